@@ -13,6 +13,7 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
 
+from straceParserLib.OutputSink import FORMATS, openSink
 
 
 class StatBase(object):
@@ -79,7 +80,102 @@ class StatBase(object):
         return None
 
     def printOutput(self):
-        """ Should print the output to console. Would be called after parsing is 
+        """ Should print the output to console. Would be called after parsing is
             finished.
+            (Use the OutputSink of _openOutput() so that the output options
+             work the same in all plugins.)
         """
         pass
+
+    def setSampling(self, fraction, clustered=False):
+        """ Called after parsing in sampling mode: only about this fraction
+            (0.0 - 1.0) of the syscalls was seen. printOutput() should then
+            print estimates scaled to the whole trace, marked as approximate.
+            clustered is True if the syscalls were sampled in blocks of
+            contiguous lines, not one by one, so they are not independent.
+
+            Return False if this plugin does not scale its output.
+        """
+        return False
+
+    def liveIdle(self, idleSeconds):
+        """ Called in live mode while no line comes, about every 0.1 second,
+            with the seconds since the last line came in. (Not called in
+            pipeline mode, where the plugins run in other processes.)
+        """
+        pass
+
+    def getMergeableStat(self):
+        """ Return the stat collected so far as a picklable object, so that
+            the stat of many strace files can be aggregated (e.g. in batch
+            mode). Would be called after parsing is finished.
+
+            Return None if this plugin does not support aggregation.
+        """
+        return None
+
+    def mergeStat(self, stat):
+        """ Merge a stat returned by getMergeableStat() of another object of
+            this plugin into this object. printOutput() will then print the
+            aggregated result.
+        """
+        pass
+
+    def printDiff(self, baseObj):
+        """ Print the difference of the stat of this object (e.g. the trace
+            after a change) against baseObj, another object of this plugin
+            (e.g. the trace before). Both objects are set up by mergeStat(),
+            like in the aggregated report of batch mode.
+
+            Return False if this plugin does not support diff.
+        """
+        return False
+
+    def getState(self):
+        """ Return the whole state of this plugin as a picklable object, so
+            that the analysis can be checkpointed at the end of a strace file
+            and resumed later when more lines are appended to the file.
+            Would be called after parsing is finished and before printOutput.
+
+            Return None if this plugin does not support checkpoint.
+        """
+        return None
+
+    def setState(self, state):
+        """ Restore the state returned by getState(). Would be called after
+            setOption and before parsing is started.
+        """
+        pass
+
+    def _combineHooks(self, *hookDictList):
+        """ Combine many hook dicts (e.g. of this plugin and of the plugins
+            used inside it) into one. If a syscall is in more than one dict,
+            all its hook functions are called in the order of hookDictList.
+        """
+        funcListDict = {}
+        for hookDict in hookDictList:
+            for syscall, func in (hookDict or {}).iteritems():
+                funcListDict.setdefault(syscall, []).append(func)
+
+        def callAll(funcList):
+            def hook(result):
+                for func in funcList:
+                    func(result)
+            return hook
+
+        return dict((syscall, funcList[0] if len(funcList) == 1 else callAll(funcList))
+                    for syscall, funcList in funcListDict.iteritems())
+
+    def _checkOutputOption(self, pluginOptionDict):
+        """ Return False if the output options of _openOutput() in
+            pluginOptionDict are wrong
+        """
+        return pluginOptionDict.get("format", "text") in FORMATS
+
+    def _openOutput(self, pluginOptionDict):
+        """ Return an OutputSink for the output options in pluginOptionDict:
+            "output" is the file to write (stdout by default) and "format" is
+            text (default), csv, json or ndjson. The plugin must close it.
+        """
+        return openSink(pluginOptionDict.get("format", "text"), pluginOptionDict.get("output", ""),
+                        self.__class__.__name__)
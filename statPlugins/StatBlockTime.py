@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+from datetime import timedelta
+from collections import defaultdict
+
+from StatBase import StatBase
+from StatProcessTree import StatProcessTree
+from StatFileIO import StatFileIO
+
+
+class StatBlockTime(StatBase):
+    """ Blocked time in the kernel and estimated user time of each thread """
+
+    # syscalls which may block the thread
+    BLOCKING_SYSCALLS = set(["read", "readv", "pread64", "preadv", "write", "writev", "pwrite64",
+                             "recvfrom", "recvmsg", "recvmmsg", "sendto", "sendmsg", "sendmmsg",
+                             "accept", "accept4", "connect",
+                             "poll", "ppoll", "select", "pselect6", "epoll_wait", "epoll_pwait",
+                             "futex", "nanosleep", "clock_nanosleep", "pause", "rt_sigsuspend",
+                             "rt_sigtimedwait", "wait4", "waitid", "flock", "fsync", "fdatasync",
+                             "msgrcv", "semop", "semtimedop"])
+    # blocking syscalls which have a fd as first argument
+    FD_SYSCALLS = set(["read", "readv", "pread64", "preadv", "write", "writev", "pwrite64",
+                       "recvfrom", "recvmsg", "recvmmsg", "sendto", "sendmsg", "sendmmsg",
+                       "accept", "accept4", "connect", "epoll_wait", "epoll_pwait",
+                       "flock", "fsync", "fdatasync"])
+
+    def __init__(self):
+        self._statProcessTree = StatProcessTree()
+        self._statFileIO = StatFileIO()
+        self._pluginOptionDict = {}
+        self._allSyscalls = False
+
+        self._unfinishedStartTime = {}
+        # the end time of the last syscall of each pid
+        self._lastSyscallEndTime = {}
+        # _blockedTime[pid][syscall] = [count, blocked time]
+        self._blockedTime = defaultdict(dict)
+        # _blockedFileTime[pid][filename] = blocked time
+        self._blockedFileTime = defaultdict(dict)
+        self._otherSyscallTime = defaultdict(timedelta)
+        self._userTime = defaultdict(timedelta)
+
+    def optionHelp(self):
+        return {"output":"Write the output to this file instead of stdout",
+                "format":"Output format: text (default), csv, json or ndjson",
+                "allsyscalls":"Count the time of all syscalls as blocked time (1), not only the blocking ones (0, default)"}
+
+    def setOption(self, pluginOptionDict):
+        self._pluginOptionDict = pluginOptionDict
+        if self._pluginOptionDict.get("allsyscalls", "0") not in ["0", "1"]:
+            return False
+        self._allSyscalls = self._pluginOptionDict.get("allsyscalls", "0") == "1"
+        return self._checkOutputOption(self._pluginOptionDict)
+
+    def isOperational(self, straceOptions):
+        self._straceOptions = straceOptions
+        self._statFileIO.isOperational(straceOptions)
+        # need either the time spent or the start time of syscalls
+        if not straceOptions["haveTimeSpent"] and not straceOptions["haveTime"]:
+            return False
+        return True
+
+    def getSyscallHooks(self):
+        # fd table from StatFileIO, execuation names from StatProcessTree
+        hooks = self._statFileIO.getSyscallHooks()
+        if self._straceOptions["havePid"]:
+            hooks.update(self._statProcessTree.getSyscallHooks())
+        return hooks
+
+    def getRawSyscallHooks(self):
+        return {"ALL": self.funcHandleALLSyscall}
+
+    def funcHandleALLSyscall(self, result):
+        if self._straceOptions["havePid"]:
+            pid = result["pid"]
+        else:
+            pid = "0"
+        syscallType = result["type"]
+        startTime = result.get("startTime")
+
+        # the gap between the end of the last syscall and the start of this
+        # one is spent in user space
+        if syscallType != "resumed" and startTime and pid in self._lastSyscallEndTime:
+            gap = startTime - self._lastSyscallEndTime[pid]
+            if gap > timedelta():
+                self._userTime[pid] += gap
+
+        if syscallType == "unfinished":
+            self._unfinishedStartTime[pid] = (startTime, result["args"])
+            return
+
+        args = result["args"]
+        timeSpent = result.get("timeSpent")
+        if syscallType == "resumed":
+            if pid not in self._unfinishedStartTime:
+                return                  # no <unfinished> line before, ignore
+            startTime, args = self._unfinishedStartTime.pop(pid)
+            if not timeSpent and startTime and "startTime" in result:
+                timeSpent = result["startTime"] - startTime
+
+        if startTime:
+            self._lastSyscallEndTime[pid] = startTime + (timeSpent or timedelta())
+        if not timeSpent:
+            return
+
+        syscall = result["syscall"]
+        if not self._allSyscalls and syscall not in StatBlockTime.BLOCKING_SYSCALLS:
+            self._otherSyscallTime[pid] += timeSpent
+            return
+
+        if syscall not in self._blockedTime[pid]:
+            self._blockedTime[pid][syscall] = [0, timedelta()]
+        self._blockedTime[pid][syscall][0] += 1
+        self._blockedTime[pid][syscall][1] += timeSpent
+
+        if syscall in StatBlockTime.FD_SYSCALLS and args:
+            fid = args[0]
+            filename = self._statFileIO.getFileName(pid, fid) or "fd " + fid
+            self._blockedFileTime[pid][filename] = \
+                self._blockedFileTime[pid].get(filename, timedelta()) + timeSpent
+
+    def getState(self):
+        return (self._statProcessTree.getState(), self._statFileIO.getState(),
+                self._unfinishedStartTime, self._lastSyscallEndTime,
+                dict(self._blockedTime), dict(self._blockedFileTime),
+                dict(self._otherSyscallTime), dict(self._userTime))
+
+    def setState(self, state):
+        processTreeState, fileIOState, self._unfinishedStartTime, self._lastSyscallEndTime, \
+            blockedTime, blockedFileTime, otherSyscallTime, userTime = state
+        self._statProcessTree.setState(processTreeState)
+        self._statFileIO.setState(fileIOState)
+        self._blockedTime = defaultdict(dict, blockedTime)
+        self._blockedFileTime = defaultdict(dict, blockedFileTime)
+        self._otherSyscallTime = defaultdict(timedelta, otherSyscallTime)
+        self._userTime = defaultdict(timedelta, userTime)
+
+    def _getExecName(self, pid):
+        return self._statProcessTree.getProcessExecName(pid) or "unknown"
+
+    def printOutput(self):
+        out = self._openOutput(self._pluginOptionDict)
+
+        pidList = set(self._blockedTime.keys() + self._otherSyscallTime.keys() + self._userTime.keys())
+        totalBlockedTime = dict((pid, sum([t for c, t in self._blockedTime[pid].itervalues()], timedelta()))
+                                for pid in pidList)
+        # group by execuation name, the most blocked first
+        pidList = sorted(pidList, key=lambda pid: (self._getExecName(pid), -totalBlockedTime[pid]))
+
+        out.beginTable("Blocked time per exec name",
+                       ["exec name", "threads", "blocked seconds", "other syscall seconds", "estimated user seconds"],
+                       ["%s", "%d", "%.6f", "%.6f", "%.6f"])
+        execStat = {}
+        for pid in pidList:
+            stat = execStat.setdefault(self._getExecName(pid), [0, timedelta(), timedelta(), timedelta()])
+            stat[0] += 1
+            stat[1] += totalBlockedTime[pid]
+            stat[2] += self._otherSyscallTime[pid]
+            stat[3] += self._userTime[pid]
+        for execName in sorted(execStat, key=lambda name: execStat[name][1], reverse=True):
+            stat = execStat[execName]
+            out.writeRow([execName, stat[0], stat[1].total_seconds(),
+                          stat[2].total_seconds(), stat[3].total_seconds()])
+
+        out.write("\n")
+        out.beginTable("Blocked time per thread",
+                       ["exec name", "pid", "blocked seconds", "other syscall seconds", "estimated user seconds"],
+                       ["%s", "%s", "%.6f", "%.6f", "%.6f"])
+        for pid in pidList:
+            out.writeRow([self._getExecName(pid), pid,
+                          totalBlockedTime[pid].total_seconds(), self._otherSyscallTime[pid].total_seconds(),
+                          self._userTime[pid].total_seconds()])
+
+        out.write("\n")
+        out.beginTable("Blocked time per thread and syscall", ["exec name", "pid", "syscall", "calls", "blocked seconds"],
+                       ["%s", "%s", "%s", "%d", "%.6f"])
+        for pid in pidList:
+            for syscall, (count, blockedTime) in sorted(self._blockedTime[pid].iteritems(),
+                                                        key=lambda item: item[1][1], reverse=True):
+                out.writeRow([self._getExecName(pid), pid, syscall, count, blockedTime.total_seconds()])
+
+        out.write("\n")
+        out.beginTable("Blocked time per thread and file", ["exec name", "pid", "filename", "blocked seconds"],
+                       ["%s", "%s", "%s", "%.6f"])
+        for pid in pidList:
+            for filename, blockedTime in sorted(self._blockedFileTime[pid].iteritems(),
+                                                key=lambda item: item[1], reverse=True):
+                out.writeRow([self._getExecName(pid), pid, filename, blockedTime.total_seconds()])
+        out.close()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+import json
+from datetime import datetime
+
+from StatBase import StatBase
+from StatProcessTree import StatProcessTree
+from straceParserLib.StatUtils import timedeltaToMicroseconds
+
+
+class StatChromeTrace(StatBase):
+    """ Export syscalls as Chrome trace events (JSON), for chrome://tracing or Perfetto """
+
+    EPOCH = datetime(1970, 1, 1)
+
+    def __init__(self):
+        self._statProcessTree = StatProcessTree()
+        self._pluginOptionDict = {}
+        self._straceOptions = {}
+        self._output = None
+        self._pidFilter = None
+        self._fromTime = None
+        self._toTime = None
+        # start time of the first line, in microseconds
+        self._firstTime = None
+        self._lastTime = 0
+        # _unfinished[pid] = (start time in microseconds, syscall, args)
+        self._unfinished = {}
+        self._allPid = set()
+
+    def optionHelp(self):
+        return {"output":"Write the output to this file instead of stdout",
+                "pids":"Only export these pids (threads or processes), separated by ':'",
+                "from":"Only export syscalls started this many seconds after the first line",
+                "to":"Only export syscalls started before this many seconds after the first line"}
+
+    def setOption(self, pluginOptionDict):
+        self._pluginOptionDict = pluginOptionDict
+        if "pids" in self._pluginOptionDict:
+            pidList = self._pluginOptionDict["pids"].split(":")
+            if not all([pid.isdigit() for pid in pidList]):
+                return False
+            self._pidFilter = set(pidList)
+        try:
+            if "from" in self._pluginOptionDict:
+                self._fromTime = float(self._pluginOptionDict["from"]) * 1000000
+            if "to" in self._pluginOptionDict:
+                self._toTime = float(self._pluginOptionDict["to"]) * 1000000
+        except ValueError:
+            return False
+        return True
+
+    def isOperational(self, straceOptions):
+        self._straceOptions = straceOptions
+        if not straceOptions["haveTime"]:
+            return False
+        return True
+
+    def getSyscallHooks(self):
+        # exec names and thread groups
+        if self._straceOptions["havePid"]:
+            return self._statProcessTree.getSyscallHooks()
+        return None
+
+    def getRawSyscallHooks(self):
+        return {"ALL": self.funcHandleALLSyscall}
+
+    def _getPid(self, result):
+        if self._straceOptions["havePid"]:
+            return result["pid"]
+        return "0"
+
+    def _isSelected(self, pid, startTime):
+        """ Check the pid and time filters; startTime is the offset from the
+            first line in microseconds
+        """
+        if self._fromTime is not None and startTime < self._fromTime:
+            return False
+        if self._toTime is not None and startTime >= self._toTime:
+            return False
+        if self._pidFilter is not None and pid not in self._pidFilter and \
+           self._statProcessTree.getProcessTgid(pid) not in self._pidFilter:
+            return False
+        return True
+
+    def _writeEvent(self, event):
+        """ Write one event to the output at once, so the trace is never
+            built in memory. (The output is the Chrome trace, it is always
+            written as text.)
+        """
+        if self._output is None:
+            self._output = self._openOutput(self._pluginOptionDict)
+            self._output.write("[\n")
+        else:
+            self._output.write(",\n")
+        self._output.write(json.dumps(event))
+
+    def _writeSlice(self, pid, syscall, startTime, duration, args, returnValue):
+        if not self._isSelected(pid, startTime - self._firstTime):
+            return
+        self._allPid.add(pid)
+        event = {"name": syscall, "cat": "syscall", "ph": "X",
+                 "ts": startTime, "dur": duration,
+                 "pid": int(self._statProcessTree.getProcessTgid(pid)), "tid": int(pid),
+                 "args": {"args": args}}
+        if returnValue is None:
+            event["args"]["unfinished"] = True
+        else:
+            event["args"]["return"] = returnValue
+        self._writeEvent(event)
+
+    def funcHandleALLSyscall(self, result):
+        if "startTime" not in result:
+            return
+        pid = self._getPid(result)
+        startTime = timedeltaToMicroseconds(result["startTime"] - StatChromeTrace.EPOCH)
+        if self._firstTime is None:
+            self._firstTime = startTime
+        self._lastTime = max(self._lastTime, startTime)
+        timeSpent = result.get("timeSpent")
+
+        syscallType = result["type"]
+        if syscallType == "unfinished":
+            self._unfinished[pid] = (startTime, result["syscall"], result["args"])
+            return
+        if syscallType == "resumed":
+            if pid not in self._unfinished:
+                return          # no <unfinished> line before, ignore
+            unfinishedTime, syscall, args = self._unfinished.pop(pid)
+            # the whole span from the unfinished line: -T of the resumed line
+            # is the total time of the syscall
+            if timeSpent:
+                duration = timedeltaToMicroseconds(timeSpent)
+            else:
+                duration = startTime - unfinishedTime
+            self._writeSlice(pid, syscall, unfinishedTime, duration, args + result["args"],
+                             result["return"])
+            self._lastTime = max(self._lastTime, unfinishedTime + duration)
+            return
+
+        duration = timedeltaToMicroseconds(timeSpent) if timeSpent else 0
+        self._writeSlice(pid, result["syscall"], startTime, duration, result["args"], result["return"])
+        self._lastTime = max(self._lastTime, startTime + duration)
+
+    def _getName(self, pid):
+        execName = self._statProcessTree.getProcessExecName(pid)
+        if execName:
+            return execName.strip('"')
+        return "unknown"
+
+    def printOutput(self):
+        # the syscalls which never finish last until the end of the trace
+        for pid, (startTime, syscall, args) in sorted(self._unfinished.iteritems()):
+            self._writeSlice(pid, syscall, startTime, self._lastTime - startTime, args, None)
+        self._unfinished = {}
+
+        # name the tracks
+        for tgid in sorted(set([self._statProcessTree.getProcessTgid(pid) for pid in self._allPid])):
+            self._writeEvent({"name": "process_name", "ph": "M", "pid": int(tgid), "tid": int(tgid),
+                              "args": {"name": "%s [%s]" % (self._getName(tgid), tgid)}})
+        for pid in sorted(self._allPid):
+            self._writeEvent({"name": "thread_name", "ph": "M",
+                              "pid": int(self._statProcessTree.getProcessTgid(pid)), "tid": int(pid),
+                              "args": {"name": "%s [%s]" % (self._getName(pid), pid)}})
+
+        if self._output is None:
+            self._output = self._openOutput(self._pluginOptionDict)
+            self._output.write("[")
+        self._output.write("\n]\n")
+        self._output.close()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+import heapq
+from datetime import datetime, timedelta
+
+from StatBase import StatBase
+from straceParserLib.StatUtils import LatencyHistogram, timedeltaToMicroseconds
+
+
+class StatEventLoop(StatBase):
+    """ Idle and busy time of event loops (epoll_wait/poll/select) per thread """
+
+    EPOCH = datetime(1970, 1, 1)
+    WAIT_SYSCALLS = set(["epoll_wait", "epoll_pwait", "poll", "ppoll", "select", "pselect6"])
+    EXIT_SYSCALLS = set(["exit", "exit_group"])
+
+    # Index of the stat of a thread
+    WAITS, IDLE_USECS, BUSY_USECS, TIMEOUTS, READY_FDS, MAX_READY_FDS, MAX_BUSY_USECS, ITERATIONS = range(8)
+
+    def __init__(self):
+        self._pluginOptionDict = {}
+        self._straceOptions = {}
+        self._top = 10
+        # _threadStat[pid] = the stat of the loop of a thread
+        self._threadStat = {}
+        # _wakeTime[pid] = (wake up time in microseconds, {syscall: count})
+        # of the current busy stretch of a thread
+        self._wakeTime = {}
+        # _pendingWait[pid] = start time of an <unfinished ...> wait
+        self._pendingWait = {}
+        # min-heap of (busy usecs, sequence number, pid, wake up time,
+        # {syscall: count}) of the longest busy stretches
+        self._longestBusy = []
+        self._sequence = 0
+
+    def optionHelp(self):
+        return {"output":"Write the output to this file instead of stdout",
+                "format":"Output format: text (default), csv, json or ndjson",
+                "top":"Number of the longest busy stretches to print (default: 10)"}
+
+    def setOption(self, pluginOptionDict):
+        self._pluginOptionDict = pluginOptionDict
+        top = self._pluginOptionDict.get("top", "10")
+        if not top.isdigit():
+            return False
+        self._top = int(top)
+        return self._checkOutputOption(self._pluginOptionDict)
+
+    def isOperational(self, straceOptions):
+        self._straceOptions = straceOptions
+        if not straceOptions["haveTime"]:
+            return False
+        return True
+
+    def getRawSyscallHooks(self):
+        # the wake up time of an <unfinished ...> wait is the time of its
+        # resumed line, which is only seen by the raw hooks
+        return {"ALL": self.funcHandleALLSyscall}
+
+    def _getPid(self, result):
+        if self._straceOptions["havePid"]:
+            return result["pid"]
+        return "0"
+
+    def _getThreadStat(self, pid):
+        stat = self._threadStat.get(pid)
+        if stat is None:
+            stat = self._threadStat[pid] = [0, 0, 0, 0, 0, 0, 0, LatencyHistogram()]
+        return stat
+
+    def _enterWait(self, pid, enterTime):
+        """ End the busy stretch of the thread, if it is woken up before """
+        if pid not in self._wakeTime:
+            return
+        wakeTime, syscallCount = self._wakeTime.pop(pid)
+        busyUsecs = max(0, enterTime - wakeTime)
+        stat = self._getThreadStat(pid)
+        stat[StatEventLoop.BUSY_USECS] += busyUsecs
+        stat[StatEventLoop.MAX_BUSY_USECS] = max(stat[StatEventLoop.MAX_BUSY_USECS], busyUsecs)
+        stat[StatEventLoop.ITERATIONS].add(busyUsecs)
+
+        if self._top == 0:
+            return
+        if len(self._longestBusy) < self._top:
+            self._sequence += 1
+            heapq.heappush(self._longestBusy, (busyUsecs, self._sequence, pid, wakeTime, syscallCount))
+        elif busyUsecs > self._longestBusy[0][0]:
+            self._sequence += 1
+            heapq.heapreplace(self._longestBusy, (busyUsecs, self._sequence, pid, wakeTime, syscallCount))
+
+    def _wake(self, pid, enterTime, wakeTime, returnValue):
+        stat = self._getThreadStat(pid)
+        stat[StatEventLoop.WAITS] += 1
+        stat[StatEventLoop.IDLE_USECS] += max(0, wakeTime - enterTime)
+        if returnValue.isdigit():
+            readyFds = int(returnValue)
+            if readyFds == 0:
+                stat[StatEventLoop.TIMEOUTS] += 1
+            stat[StatEventLoop.READY_FDS] += readyFds
+            stat[StatEventLoop.MAX_READY_FDS] = max(stat[StatEventLoop.MAX_READY_FDS], readyFds)
+        self._wakeTime[pid] = (wakeTime, {})
+
+    def _countBusy(self, pid, syscall):
+        if pid in self._wakeTime:
+            syscallCount = self._wakeTime[pid][1]
+            syscallCount[syscall] = syscallCount.get(syscall, 0) + 1
+
+    def funcHandleALLSyscall(self, result):
+        if "startTime" not in result:
+            return
+        pid = self._getPid(result)
+        syscall = result["syscall"]
+        startTime = timedeltaToMicroseconds(result["startTime"] - StatEventLoop.EPOCH)
+        timeSpent = result.get("timeSpent")
+        syscallType = result["type"]
+
+        if syscallType == "unfinished":
+            if syscall in StatEventLoop.WAIT_SYSCALLS:
+                self._enterWait(pid, startTime)
+                self._pendingWait[pid] = startTime
+            else:
+                self._countBusy(pid, syscall)
+        elif syscallType == "resumed":
+            # other resumed syscalls are counted by their unfinished line
+            if pid in self._pendingWait:
+                enterTime = self._pendingWait.pop(pid)
+                wakeTime = enterTime + timedeltaToMicroseconds(timeSpent) if timeSpent else startTime
+                self._wake(pid, enterTime, wakeTime, result["return"])
+        elif syscall in StatEventLoop.WAIT_SYSCALLS:
+            self._enterWait(pid, startTime)
+            wakeTime = startTime + timedeltaToMicroseconds(timeSpent) if timeSpent else startTime
+            self._wake(pid, startTime, wakeTime, result["return"])
+        elif syscall in StatEventLoop.EXIT_SYSCALLS:
+            self._wakeTime.pop(pid, None)
+        else:
+            self._countBusy(pid, syscall)
+
+    def getState(self):
+        return (self._threadStat, self._wakeTime, self._pendingWait, self._longestBusy, self._sequence)
+
+    def setState(self, state):
+        self._threadStat, self._wakeTime, self._pendingWait, self._longestBusy, self._sequence = state
+
+    def _formatTime(self, usecs):
+        """ A time in microseconds, in the time format of the strace file """
+        if self._straceOptions["haveTime"] == "ttt":
+            return "%.6f" % (usecs / 1000000.0)
+        return (StatEventLoop.EPOCH + timedelta(microseconds=usecs)).strftime("%H:%M:%S.%f")
+
+    def printOutput(self):
+        out = self._openOutput(self._pluginOptionDict)
+
+        columns = ["pid", "waits", "idle seconds", "busy seconds", "busy %", "timeouts", "mean ready fds",
+                   "max ready fds", "p50 iteration usecs", "p90 iteration usecs", "p99 iteration usecs",
+                   "max iteration usecs"]
+        out.beginTable("Event loops per thread", columns,
+                       ["%s", "%d", "%.6f", "%.6f", "%.1f", "%d", "%.2f", "%d", "%s", "%s", "%s", "%s"],
+                       "====== Event loops per thread (csv), the busiest first ======\n%s\n" % ", ".join(columns))
+        for pid, stat in sorted(self._threadStat.iteritems(),
+                                key=lambda (pid, stat): (-stat[StatEventLoop.BUSY_USECS], pid)):
+            waits = stat[StatEventLoop.WAITS]
+            idleUsecs = stat[StatEventLoop.IDLE_USECS]
+            busyUsecs = stat[StatEventLoop.BUSY_USECS]
+            iterations = stat[StatEventLoop.ITERATIONS]
+            totalUsecs = idleUsecs + busyUsecs
+            out.writeRow([pid, waits, idleUsecs / 1000000.0, busyUsecs / 1000000.0,
+                          100.0 * busyUsecs / totalUsecs if totalUsecs else 0.0,
+                          stat[StatEventLoop.TIMEOUTS],
+                          float(stat[StatEventLoop.READY_FDS]) / waits if waits else 0.0,
+                          stat[StatEventLoop.MAX_READY_FDS],
+                          iterations.percentile(50), iterations.percentile(90), iterations.percentile(99),
+                          stat[StatEventLoop.MAX_BUSY_USECS] if iterations.getCount() else None])
+
+        if self._top > 0:
+            out.write("\n")
+            out.beginTable("Longest busy stretches", ["pid", "wake up time", "busy seconds", "syscalls"],
+                           ["%s", "%s", "%.6f", "%s"],
+                           "====== The %d longest busy stretches (csv) ======\n"
+                           "pid, wake up time, busy seconds, syscalls\n" % self._top)
+            for busyUsecs, sequence, pid, wakeTime, syscallCount in sorted(self._longestBusy, reverse=True):
+                syscalls = " ".join(["%s:%d" % (syscall, count) for syscall, count in
+                                     sorted(syscallCount.iteritems(), key=lambda (s, c): (-c, s))])
+                out.writeRow([pid, self._formatTime(wakeTime), busyUsecs / 1000000.0, syscalls])
+        out.close()
@@ -13,120 +13,488 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
 
-import sys
+import os
 
 from StatBase import StatBase
+from StatProcessTree import StatProcessTree
+from straceParserLib.StatUtils import SpaceSaving, timedeltaToMicroseconds
 
 class StatFileIO(StatBase):
     """ Stat and print file IO of strace"""
 
+    SYSCALLS = ["read", "write", "open", "openat", "close",
+                "pread64", "pwrite64", "readv", "writev", "preadv", "pwritev",
+                "sendfile", "sendfile64", "lseek", "dup", "dup2", "dup3", "fcntl"]
+    # syscalls which make a new fd of the file of the fd in the first argument
+    DUP_SYSCALLS = set(["dup", "dup2", "dup3", "fcntl"])
+
+    # syscalls which have a fd as first argument
+    FD_SYSCALLS = set(["read", "write", "pread64", "pwrite64", "readv", "writev", "preadv", "pwritev",
+                       "close", "dup", "dup2", "dup3", "fstat", "newfstatat", "fsync", "fdatasync", "lseek", "ioctl", "fcntl",
+                       "getdents", "getdents64", "ftruncate", "flock", "fchmod", "fchown",
+                       "sendto", "recvfrom", "sendmsg", "recvmsg", "connect", "accept", "accept4",
+                       "bind", "listen", "shutdown", "setsockopt", "getsockopt",
+                       "epoll_wait", "epoll_pwait", "epoll_ctl", "sendfile", "sendfile64"])
+
+    # Index of the stat lists. A fid stat is
+    # [filename, read count, read acc bytes, write count, write acc bytes,
+    #  sequential access count, random access count, read size histogram,
+    #  write size histogram, file position]
+    # A file stat is the same from index 1 to 8, with the open/close count at
+    # index 0. The size histograms are dicts of {log2 bucket: count}.
+    READ_COUNT, READ_BYTES, WRITE_COUNT, WRITE_BYTES = 1, 2, 3, 4
+    SEQ_COUNT, RANDOM_COUNT, READ_HIST, WRITE_HIST = 5, 6, 7, 8
+    POSITION = 9
+    # Index of a file position [current offset, end offset of last access].
+    # The fds duplicated from each other share one file position, as they
+    # share the offset of the open file in the kernel.
+    OFFSET, LAST_END = 0, 1
+
+    # flag the files read or written by many small IOs
+    SMALL_IO_MIN_CALLS = 100
+
+    # the unit of the weight to rank the hot files
+    RANK_UNITS = {"bytes": "bytes", "calls": "calls", "time": "microseconds"}
+    # syscalls to follow the process subtree of the scope option
+    FORK_SYSCALLS = ["clone", "fork", "vfork"]
+    # the heavy hitters table keeps this times more keys than printed, for
+    # tighter error bounds
+    HOT_CAPACITY_FACTOR = 10
+
     def __init__(self):
+        # the threads of a process share its fd table, so the fid stats (and
+        # the file stats) are by thread group id, from StatProcessTree
+        self._statProcessTree = StatProcessTree()
         self._fileStatList = {}
         self._fidStatList = {}
         self._pluginOptionDict = {}
         self._straceOptions = {}
+        # top-K mode: heavy hitters of files and directories in fixed memory,
+        # instead of the full _fileStatList
+        self._hotFiles = None
+        self._hotDirs = None
+        self._rankBy = "bytes"
+        # pids in the subtree to rank (None for all pids)
+        self._subtreePids = None
         return
 
     def optionHelp(self):
-        return {"output":"Write the output to this file instead of stdout"}
+        return {"output":"Write the output to this file instead of stdout",
+                "format":"Output format: text (default), csv, json or ndjson",
+                "top":"Only print the N files with the most read+write bytes",
+                "smallio":"Flag the files with less than this bytes/call on average (default: 64)",
+                "hot":"Top-K mode: only keep the K hottest files and directories in fixed memory (default: 0, off)",
+                "rankby":"Rank the hot files by bytes (default), calls or time (needs -T)",
+                "scope":"Stat the files of all pids (all, default) or of the process subtree of this pid only"}
 
     def setOption(self, pluginOptionDict):
         self._pluginOptionDict = pluginOptionDict
+        if not self._pluginOptionDict.get("top", "0").isdigit() or \
+           not self._pluginOptionDict.get("smallio", "64").isdigit() or \
+           not self._pluginOptionDict.get("hot", "0").isdigit() or \
+           not self._checkOutputOption(self._pluginOptionDict):
+            return False
+
+        self._rankBy = self._pluginOptionDict.get("rankby", "bytes")
+        if self._rankBy not in StatFileIO.RANK_UNITS:
+            return False
+        if self._rankBy == "time" and not self._straceOptions.get("haveTimeSpent"):
+            return False
+
+        scope = self._pluginOptionDict.get("scope", "all")
+        if scope != "all":
+            if not scope.isdigit() or not self._straceOptions.get("havePid"):
+                return False
+            self._subtreePids = set([int(scope)])
+
+        hot = int(self._pluginOptionDict.get("hot", "0"))
+        if hot:
+            self._hotFiles = SpaceSaving(hot * StatFileIO.HOT_CAPACITY_FACTOR)
+            self._hotDirs = SpaceSaving(hot * StatFileIO.HOT_CAPACITY_FACTOR)
         return True
 
     def getSyscallHooks(self):
         return_dict = {}
-        for syscall in ["read", "write", "open", "openat", "close"]:
+        for syscall in StatFileIO.SYSCALLS:
             return_dict[syscall] = self.statFileIO
+        if self._subtreePids is not None:
+            for syscall in StatFileIO.FORK_SYSCALLS:
+                return_dict[syscall] = self.followSubtree
+        if self._straceOptions["havePid"]:
+            # the clones make the thread groups
+            return self._combineHooks(return_dict, {"clone": self._statProcessTree.statProcessTree})
         return return_dict
 
+    def followSubtree(self, result):
+        if int(result["pid"]) in self._subtreePids and result["return"].isdigit():
+            self._subtreePids.add(int(result["return"]))
+
     def isOperational(self, straceOptions):
         self._straceOptions = straceOptions
         return True
 
+    def _newFidStat(self, filename, position=None):
+        return [filename, 0, 0, 0, 0, 0, 0, {}, {}, position or [0, 0]]
+
+    def _getTgid(self, pid):
+        """ The key of the fd table of pid (0 without pids) """
+        if self._straceOptions["havePid"]:
+            return int(self._statProcessTree.getProcessTgid(pid))
+        return 0
+
+    def _getFidStat(self, pid, fid):
+        if fid not in self._fidStatList[pid]:
+            self._fidStatList[pid][fid] = self._newFidStat("unknown:" + fid)
+        return self._fidStatList[pid][fid]
+
+    def _parseOffset(self, offsetArg):
+        """ Parse the offset argument of pread/pwrite/sendfile, return None
+            if it is not a number (e.g. NULL)
+        """
+        if isinstance(offsetArg, list):     # e.g. sendfile(1, 3, [0], 4096)
+            offsetArg = offsetArg[0] if offsetArg else ""
+        try:
+            return int(offsetArg)
+        except ValueError:
+            return None
+
+    def _recordAccess(self, fidStat, isWrite, nbytes, offset=None):
+        """ Record a read/write of nbytes on fidStat. offset is the explicit
+            offset of pread/pwrite. If it is None, the current offset of the
+            fid is used and moved.
+        """
+        if isWrite:
+            fidStat[StatFileIO.WRITE_COUNT] += 1
+            fidStat[StatFileIO.WRITE_BYTES] += nbytes
+            hist = fidStat[StatFileIO.WRITE_HIST]
+        else:
+            fidStat[StatFileIO.READ_COUNT] += 1
+            fidStat[StatFileIO.READ_BYTES] += nbytes
+            hist = fidStat[StatFileIO.READ_HIST]
+        bucket = nbytes.bit_length()    # 0, 1, 2-3, 4-7, ...
+        hist[bucket] = hist.get(bucket, 0) + 1
+
+        # sequential if it starts where the last access ended
+        position = fidStat[StatFileIO.POSITION]
+        start = position[StatFileIO.OFFSET] if offset is None else offset
+        if start == position[StatFileIO.LAST_END]:
+            fidStat[StatFileIO.SEQ_COUNT] += 1
+        else:
+            fidStat[StatFileIO.RANDOM_COUNT] += 1
+        position[StatFileIO.LAST_END] = start + nbytes
+        if offset is None:
+            position[StatFileIO.OFFSET] += nbytes
+
+    def _addStat(self, stat, otherStat):
+        """ Add otherStat (a fid or file stat) to the file stat stat """
+        for i in range(StatFileIO.READ_COUNT, StatFileIO.RANDOM_COUNT + 1):
+            stat[i] += otherStat[i]
+        for i in [StatFileIO.READ_HIST, StatFileIO.WRITE_HIST]:
+            for bucket, count in otherStat[i].iteritems():
+                stat[i][bucket] = stat[i].get(bucket, 0) + count
+
+    def _closeFid(self, pid, fid):
+        """ Count the fid stat into the file stat and remove it """
+        fidStat = self._fidStatList[pid][fid]
+        filename = fidStat[0]
+        del self._fidStatList[pid][fid]
+        if self._hotFiles is not None:
+            return      # top-K mode keeps no per file stat
+        if filename not in self._fileStatList[pid]:
+            self._fileStatList[pid][filename] = [0, 0, 0, 0, 0, 0, 0, {}, {}]
+        self._fileStatList[pid][filename][0] += 1
+        self._addStat(self._fileStatList[pid][filename], fidStat)
+
+    def _dupFid(self, pid, fid, newFid):
+        """ newFid is a duplicate of fid: it refers to the same file and
+            shares its offset
+        """
+        if newFid == fid:       # e.g. dup2(3, 3)
+            return
+        if newFid in self._fidStatList[pid]:    # dup2/dup3 close newFid first
+            self._closeFid(pid, newFid)
+        fidStat = self._getFidStat(pid, fid)
+        self._fidStatList[pid][newFid] = self._newFidStat(fidStat[0], fidStat[StatFileIO.POSITION])
+
+    def _recordHot(self, filename, nbytes, result):
+        """ Count an access to filename and its directories in the heavy
+            hitters of top-K mode
+        """
+        if self._rankBy == "bytes":
+            weight = nbytes
+        elif self._rankBy == "calls":
+            weight = 1
+        else:
+            if not result.get("timeSpent"):
+                return
+            weight = timedeltaToMicroseconds(result["timeSpent"])
+        self._hotFiles.add(filename, weight)
+
+        if filename.startswith("unknown:"):
+            return
+        path = filename.strip('"')
+        while True:
+            parent = os.path.dirname(path)
+            if parent == path or parent in ["", "/"]:    # "/" would count every access
+                break
+            path = parent
+            self._hotDirs.add(path, weight)
+
     def statFileIO(self, result):
-        if result["syscall"] in ["read", "write", "open", "openat", "close"]:
+        if result["syscall"] in StatFileIO.SYSCALLS:
             if result["return"] == "-1":  # ignore failed syscalls
                 return
-            
-            if result["syscall"] in ["open", "openat"]:
+
+            syscall = result["syscall"]
+            args = result["args"]
+            if syscall in ["open", "openat"]:
                 fid = result["return"]
             else:
-                fid = result["args"][0]
+                fid = args[0]
 
-            if self._straceOptions["havePid"]:
-                pid = int(result["pid"])
-            else:
-                pid = 0
+            if self._subtreePids is not None and int(result["pid"]) not in self._subtreePids:
+                return
+            pid = self._getTgid(result.get("pid"))
             if pid not in self._fidStatList:
                 self._fidStatList[pid] = {}
             if pid not in self._fileStatList:
                 self._fileStatList[pid] = {}
 
             # file close
-            if result["syscall"] == "close":
+            if syscall == "close":
                 if fid in self._fidStatList[pid]:
-                    #print self._fidStatList[fid]
-                    filename = self._fidStatList[pid][fid][0]
-                    if filename not in self._fileStatList[pid]:
-                        self._fileStatList[pid][filename] = [1, 
-                                                             self._fidStatList[pid][fid][1], 
-                                                             self._fidStatList[pid][fid][2], 
-                                                             self._fidStatList[pid][fid][3], 
-                                                             self._fidStatList[pid][fid][4]]
-                    else:
-                        self._fileStatList[pid][filename][0] += 1
-                        for i in [1, 2, 3, 4]:
-                            self._fileStatList[pid][filename][i] += self._fidStatList[pid][fid][i]
-
-                    del self._fidStatList[pid][fid]
+                    self._closeFid(pid, fid)
                 # else if fid not in self._fidStatList[pid] and this is a close syscall, just ignore and return
                 return
 
+            # fd duplicate, fcntl is only F_DUPFD/F_DUPFD_CLOEXEC
+            if syscall in StatFileIO.DUP_SYSCALLS:
+                if syscall != "fcntl" or (len(args) > 1 and args[1].startswith("F_DUPFD")):
+                    self._dupFid(pid, fid, result["return"])
+                return
+
             # if read/write/open
             if fid not in self._fidStatList[pid]:
-                if result["syscall"] == "open":
-                    # self._fidStatList[pid][fid] = [filename, read count, read acc bytes, write count, write acc bytes]
-                    self._fidStatList[pid][fid] = [result["args"][0], 0, 0, 0, 0]
-                elif result["syscall"] == "openat":
-                    self._fidStatList[pid][fid] = [result["args"][1], 0, 0, 0, 0]
-                else:
-                    self._fidStatList[pid][fid] = ["unknown:"+fid, 0, 0, 0, 0]
+                if syscall == "open":
+                    self._fidStatList[pid][fid] = self._newFidStat(args[0])
+                elif syscall == "openat":
+                    self._fidStatList[pid][fid] = self._newFidStat(args[1])
             # ISSUE #8: if fid in self._fidStatList[pid] but the syscall is open/openat, that mean
             # we missed a close syscall, we should update _fileStatList before we move on
+            if syscall in ["open", "openat"]:
+                return
+
+            fidStat = self._getFidStat(pid, fid)
+            nbytes = int(result["return"])
 
             # stat read/write
-            if result["syscall"] == "read":
-                self._fidStatList[pid][fid][1] += 1
-                self._fidStatList[pid][fid][2] += int(result["return"])
-            if result["syscall"] == "write":
-                self._fidStatList[pid][fid][3] += 1
-                self._fidStatList[pid][fid][4] += int(result["return"])
+            if syscall in ["read", "readv"]:
+                self._recordAccess(fidStat, False, nbytes)
+            elif syscall in ["write", "writev"]:
+                self._recordAccess(fidStat, True, nbytes)
+            elif syscall in ["pread64", "preadv"]:
+                self._recordAccess(fidStat, False, nbytes, self._parseOffset(args[3]))
+            elif syscall in ["pwrite64", "pwritev"]:
+                self._recordAccess(fidStat, True, nbytes, self._parseOffset(args[3]))
+            elif syscall in ["sendfile", "sendfile64"]:
+                # sendfile(out_fd, in_fd, offset, count): read from in_fd, write to out_fd
+                inFidStat = self._getFidStat(pid, args[1])
+                self._recordAccess(inFidStat, False, nbytes, self._parseOffset(args[2]))
+                self._recordAccess(fidStat, True, nbytes)
+            elif syscall == "lseek":
+                fidStat[StatFileIO.POSITION][StatFileIO.OFFSET] = nbytes    # the new offset
+                return
+
+            if self._hotFiles is not None:
+                self._recordHot(fidStat[0], nbytes, result)
+                if syscall in ["sendfile", "sendfile64"]:
+                    self._recordHot(inFidStat[0], nbytes, result)
             return
 
-    def printOutput(self):
-        filename = self._pluginOptionDict.get("output", "")
-        f = open(filename, "w") if filename else sys.stdout
-        f.write("====== File IO summary (csv) ======\n")
+    def getFileName(self, pid, fid):
+        """ Return the filename of the file id (fd) fid of pid, or None if it
+            is unknown. (For plugins which need the fd table of this plugin.)
+            pid may be any thread of the process.
+        """
+        pid = self._getTgid(pid)
+        if pid in self._fidStatList and fid in self._fidStatList[pid]:
+            return self._fidStatList[pid][fid][0]
+        return None
 
-        for pid in self._fidStatList:
-            for fid in self._fidStatList[pid]:
-                #print self._fidStatList[pid][fid]
-                filename = self._fidStatList[pid][fid][0]
-                if filename not in self._fileStatList[pid]:
-                    self._fileStatList[pid][filename] = [1] + self._fidStatList[pid][fid][1:5]
-                else:
-                    self._fileStatList[pid][filename][0] += 1
-                    for i in [1, 2, 3, 4]:
-                        self._fileStatList[pid][filename][i] += self._fidStatList[pid][fid][i]
+    def getSyscallFile(self, result):
+        """ Return a tuple (fd, filename) of the file used by the syscall
+            result (either may be None), before this plugin sees result.
+        """
+        args = result["args"]
+        if result["syscall"] in ["open", "openat"]:
+            fid = result["return"] if result["return"] != "-1" else None
+            pathIndex = 0 if result["syscall"] == "open" else 1
+            return (fid, args[pathIndex] if len(args) > pathIndex else None)
+        if result["syscall"] in StatFileIO.FD_SYSCALLS and args and isinstance(args[0], basestring):
+            return (args[0], self.getFileName(result.get("pid", 0), args[0]))
+        return (None, None)
 
-        if self._straceOptions["havePid"]:
-            f.write("pid, ")
-        f.write("filename, open/close count, read count, read bytes, write count, write bytes\n")
+    def _flushOpenFiles(self):
+        """ Count the files which are still open into _fileStatList """
+        for pid in self._fidStatList:
+            for fid in self._fidStatList[pid].keys():
+                self._closeFid(pid, fid)
 
+    def getMergeableStat(self):
+        # pid of different strace files are unrelated, so merge them by filename
+        self._flushOpenFiles()
+        fileStat = {}
         for pid in self._fileStatList:
-            for filename in self._fileStatList[pid]:
-                if self._straceOptions["havePid"]:
-                    f.write("%d, " % pid)
-                f.write("%s, %d, %d, %d, %d, %d\n" % tuple([filename] + self._fileStatList[pid][filename]))
+            for filename, stat in self._fileStatList[pid].iteritems():
+                if filename not in fileStat:
+                    fileStat[filename] = [0, 0, 0, 0, 0, 0, 0, {}, {}]
+                fileStat[filename][0] += stat[0]
+                self._addStat(fileStat[filename], stat)
+        return (fileStat, self._hotFiles, self._hotDirs)
+
+    def mergeStat(self, stat):
+        stat, hotFiles, hotDirs = stat
+        if self._hotFiles is not None and hotFiles is not None:
+            self._hotFiles.merge(hotFiles)
+            self._hotDirs.merge(hotDirs)
+        if 0 not in self._fileStatList:
+            self._fileStatList[0] = {}
+        for filename, fileStat in stat.iteritems():
+            if filename not in self._fileStatList[0]:
+                self._fileStatList[0][filename] = [0, 0, 0, 0, 0, 0, 0, {}, {}]
+            self._fileStatList[0][filename][0] += fileStat[0]
+            self._addStat(self._fileStatList[0][filename], fileStat)
+
+    def printDiff(self, baseObj):
+        # the objects are merged, so all the files are under pid 0
+        baseStat = baseObj._fileStatList.get(0, {})
+        newStat = self._fileStatList.get(0, {})
+
+        def volume(stat):
+            return (stat[StatFileIO.READ_BYTES] + stat[StatFileIO.WRITE_BYTES],
+                    stat[StatFileIO.READ_COUNT] + stat[StatFileIO.WRITE_COUNT])
+
+        out = self._openOutput(self._pluginOptionDict)
+        out.beginTable("File IO diff", ["filename", "bytes before", "bytes after", "bytes delta",
+                                        "calls before", "calls after", "calls delta"],
+                       ["%s", "%d", "%d", "%+d", "%d", "%d", "%+d"],
+                       "====== File IO diff (csv), the largest increase of read+write bytes first ======\n"
+                       "filename, bytes before, bytes after, bytes delta, calls before, calls after, calls delta\n")
+        diffList = []
+        for filename in set(baseStat) & set(newStat):
+            (baseBytes, baseCalls), (newBytes, newCalls) = volume(baseStat[filename]), volume(newStat[filename])
+            if (baseBytes, baseCalls) != (newBytes, newCalls):
+                diffList.append((filename, baseBytes, newBytes, baseCalls, newCalls))
+        for filename, baseBytes, newBytes, baseCalls, newCalls in \
+                sorted(diffList, key=lambda item: (item[1] - item[2], item[3] - item[4], item[0])):
+            out.writeRow([filename, baseBytes, newBytes, newBytes - baseBytes,
+                          baseCalls, newCalls, newCalls - baseCalls])
+
+        out.write("\n")
+        out.beginTable("Files in one trace only", ["filename", "trace", "bytes", "calls"],
+                       ["%s", "%s", "%d", "%d"],
+                       "====== Files in one trace only (csv), the most read+write bytes first ======\n"
+                       "filename, trace, bytes, calls\n")
+        onlyList = [(filename, "after") + volume(newStat[filename])
+                    for filename in newStat if filename not in baseStat] + \
+                   [(filename, "before") + volume(baseStat[filename])
+                    for filename in baseStat if filename not in newStat]
+        for filename, trace, nbytes, calls in sorted(onlyList, key=lambda item: (-item[2], -item[3], item[0])):
+            out.writeRow([filename, trace, nbytes, calls])
+        out.write("\n")
+        out.close()
+
+    def getState(self):
+        return (self._statProcessTree.getState(), self._fileStatList, self._fidStatList, self._hotFiles,
+                self._hotDirs, self._subtreePids)
+
+    def setState(self, state):
+        (processTreeState, self._fileStatList, self._fidStatList, self._hotFiles, self._hotDirs,
+         self._subtreePids) = state
+        self._statProcessTree.setState(processTreeState)
+
+    def _formatHist(self, hist):
+        """ Format a size histogram as "lower bound bytes:count ..." """
+        return " ".join(["%d:%d" % (0 if bucket == 0 else 2 ** (bucket - 1), hist[bucket])
+                         for bucket in sorted(hist)])
+
+    def _bytesPerCall(self, nbytes, count):
+        return float(nbytes) / count if count else 0.0
+
+    def _printHot(self, out, title, name, sketch):
+        unit = StatFileIO.RANK_UNITS[self._rankBy]
+        top = int(self._pluginOptionDict["hot"])
+        topList = sketch.getTop(top + 1)
+        # the error bounds of the space-saving counters: a key not in the
+        # table has at most the minimum count of the table
+        notListedMax = max([sketch.getMinCount()] + [count for _, count, _ in topList[top:]])
+        columns = ["rank", name, "estimated %s" % unit, "max overestimate", "guaranteed %s" % unit]
+        out.beginTable("Hot %s by %s" % (title, self._rankBy), columns, ["%d", "%s", "%d", "%d", "%d"],
+                       "====== Hot %s by %s (top %d, csv) ======\n"
+                       "# total %d %s; every %s with more than %d %s is counted; "
+                       "a %s not listed has at most %d %s\n%s\n" %
+                       (title, self._rankBy, top,
+                        sketch.getTotal(), unit, name, sketch.getTotal() / sketch.getCapacity(), unit,
+                        name, notListedMax, unit, ", ".join(columns)))
+        for rank, (key, count, error) in enumerate(topList[:top]):
+            out.writeRow([rank + 1, key, count, error, count - error])
+
+    def printOutput(self):
+        out = self._openOutput(self._pluginOptionDict)
+
+        self._flushOpenFiles()
+        if self._hotFiles is not None:
+            self._printHot(out, "files", "file", self._hotFiles)
+            out.write("\n")
+            self._printHot(out, "directories", "directory", self._hotDirs)
+            out.close()
+            return
+
+        # the pid column only if there are pids
+        pidColumn = ["pid"] if self._straceOptions["havePid"] else []
+        pidFormat = ["%d"] if self._straceOptions["havePid"] else []
+        out.beginTable("File IO summary",
+                       pidColumn + ["filename", "open/close count", "read count", "read bytes", "write count",
+                                    "write bytes", "sequential access", "random access", "read bytes/call",
+                                    "write bytes/call", "read size histogram (bytes:count)",
+                                    "write size histogram (bytes:count)"],
+                       pidFormat + ["%s", "%d", "%d", "%d", "%d", "%d", "%d", "%d", "%.1f", "%.1f", "%s", "%s"])
+
+        allFileList = [(pid, filename) for pid in self._fileStatList
+                                       for filename in self._fileStatList[pid]]
+        fileList = list(allFileList)
+        top = int(self._pluginOptionDict.get("top", 0))
+        if top:
+            # sort by read bytes + write bytes
+            fileList.sort(key=lambda (pid, filename): self._fileStatList[pid][filename][2] +
+                                                      self._fileStatList[pid][filename][4],
+                          reverse=True)
+            fileList = fileList[:top]
+
+        for pid, filename in fileList:
+            stat = self._fileStatList[pid][filename]
+            out.writeRow(([pid] if pidColumn else []) + [filename] + stat[0:7] + [
+                         self._bytesPerCall(stat[StatFileIO.READ_BYTES], stat[StatFileIO.READ_COUNT]),
+                         self._bytesPerCall(stat[StatFileIO.WRITE_BYTES], stat[StatFileIO.WRITE_COUNT]),
+                         self._formatHist(stat[StatFileIO.READ_HIST]), self._formatHist(stat[StatFileIO.WRITE_HIST])])
 
+        # files with many small reads/writes, which could use buffering
+        smallIO = int(self._pluginOptionDict.get("smallio", "64"))
+        out.write("\n")
+        columns = pidColumn + ["filename", "operation", "calls", "bytes", "bytes/call"]
+        out.beginTable("Small IO", columns, pidFormat + ["%s", "%s", "%d", "%d", "%.1f"],
+                       "====== Small IO (less than %d bytes/call in at least %d calls) (csv) ======\n%s\n" %
+                       (smallIO, StatFileIO.SMALL_IO_MIN_CALLS, ", ".join(columns)))
+        # all the files, the small IO files are rarely the top ones by bytes
+        smallIOList = []
+        for pid, filename in allFileList:
+            stat = self._fileStatList[pid][filename]
+            for operation, countIndex in [("read", StatFileIO.READ_COUNT), ("write", StatFileIO.WRITE_COUNT)]:
+                count, nbytes = stat[countIndex], stat[countIndex + 1]
+                if count >= StatFileIO.SMALL_IO_MIN_CALLS and self._bytesPerCall(nbytes, count) < smallIO:
+                    smallIOList.append((pid, filename, operation, count, nbytes))
+        # the most calls first
+        for pid, filename, operation, count, nbytes in sorted(smallIOList, key=lambda item: item[3], reverse=True):
+            out.writeRow(([pid] if pidColumn else []) + [filename, operation, count, nbytes,
+                                                   self._bytesPerCall(nbytes, count)])
+        out.close()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+import os
+
+from StatBase import StatBase
+from StatProcessTree import StatProcessTree
+from StatFileIO import StatFileIO
+from straceParserLib.StatUtils import timedeltaToMicroseconds
+
+
+class StatFlameGraph(StatBase):
+    """ Folded stacks (process;thread;syscall;file) for flamegraph.pl or speedscope """
+
+    def __init__(self):
+        self._statProcessTree = StatProcessTree()
+        self._statFileIO = StatFileIO()
+        self._pluginOptionDict = {}
+        self._straceOptions = {}
+        self._weightByTime = True
+        # _weight[(pid, syscall, file)] = count or microseconds; the stacks
+        # are built at the end, when the whole process tree is known
+        self._weight = {}
+
+    def optionHelp(self):
+        return {"output":"Write the output to this file instead of stdout",
+                "format":"Output format: text (default), csv, json or ndjson",
+                "weight":"Weight the stacks by syscall time (time, default if -T) or by call count (count)"}
+
+    def setOption(self, pluginOptionDict):
+        self._pluginOptionDict = pluginOptionDict
+        weight = self._pluginOptionDict.get("weight", "time" if self._straceOptions["haveTimeSpent"] else "count")
+        if weight not in ["time", "count"]:
+            return False
+        if weight == "time" and not self._straceOptions["haveTimeSpent"]:
+            return False
+        self._weightByTime = weight == "time"
+        return self._checkOutputOption(self._pluginOptionDict)
+
+    def isOperational(self, straceOptions):
+        self._straceOptions = straceOptions
+        self._statFileIO.isOperational(straceOptions)
+        return True
+
+    def getSyscallHooks(self):
+        # the file of a fd is taken before StatFileIO sees the syscall, so
+        # it is still known for close
+        fileIOHooks = self._statFileIO.getSyscallHooks()
+        ownHooks = dict((syscall, self.record) for syscall in StatFileIO.SYSCALLS)
+        ownHooks["ALL"] = self.recordOther
+        processTreeHooks = None
+        if self._straceOptions["havePid"]:
+            processTreeHooks = self._statProcessTree.getSyscallHooks()
+        return self._combineHooks(ownHooks, fileIOHooks, processTreeHooks)
+
+    def recordOther(self, result):
+        if result["syscall"] not in StatFileIO.SYSCALLS:
+            self.record(result)
+
+    def record(self, result):
+        if self._weightByTime:
+            if not result["timeSpent"]:
+                return
+            weight = timedeltaToMicroseconds(result["timeSpent"])
+        else:
+            weight = 1
+
+        syscall = result["syscall"]
+        pid = result["pid"] if self._straceOptions["havePid"] else "0"
+        fid, fileFrame = self._statFileIO.getSyscallFile(result)
+        if not fileFrame and fid:
+            fileFrame = "fd " + fid
+
+        key = (pid, syscall, fileFrame)
+        self._weight[key] = self._weight.get(key, 0) + weight
+
+    def getState(self):
+        return (self._statProcessTree.getState(), self._statFileIO.getState(), self._weight)
+
+    def setState(self, state):
+        processTreeState, fileIOState, self._weight = state
+        self._statProcessTree.setState(processTreeState)
+        self._statFileIO.setState(fileIOState)
+
+    def _frame(self, name):
+        """ ';' separates the frames of a folded stack """
+        return unicode(name).replace(";", ":")
+
+    def _processName(self, pid):
+        execName = self._statProcessTree.getProcessExecName(pid)
+        execName = os.path.basename(execName.strip('"')) if execName else "unknown"
+        return "%s [%s]" % (execName, pid)
+
+    def _processFrames(self, pid):
+        """ The frames of the processes from the head pid down to the process
+            of pid (its thread group)
+        """
+        frames = []
+        lastTgid = None
+        for chainPid in self._statProcessTree.getProcessChain(self._statProcessTree.getProcessTgid(pid)):
+            tgid = self._statProcessTree.getProcessTgid(chainPid)
+            if tgid != lastTgid:
+                frames.append(self._frame(self._processName(tgid)))
+                lastTgid = tgid
+        return frames
+
+    def printOutput(self):
+        stackWeight = {}
+        processFrames = {}
+        for (pid, syscall, fileFrame), weight in self._weight.iteritems():
+            frames = []
+            if self._straceOptions["havePid"]:
+                if pid not in processFrames:
+                    processFrames[pid] = self._processFrames(pid)
+                frames = processFrames[pid] + ["thread %s" % pid]
+            frames.append(self._frame(syscall))
+            if fileFrame:
+                frames.append(self._frame(fileFrame))
+            stack = ";".join(frames)
+            stackWeight[stack] = stackWeight.get(stack, 0) + weight
+
+        out = self._openOutput(self._pluginOptionDict)
+        out.beginTable("Folded stacks", ["stack", "microseconds" if self._weightByTime else "calls"],
+                       ["%s", "%d"], "", " ")
+        for stack in sorted(stackWeight):
+            out.writeRow([stack, stackWeight[stack]])
+        out.close()
@@ -13,7 +13,6 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
 
-import sys
 from datetime import timedelta, datetime
 from collections import defaultdict
 
@@ -24,23 +23,56 @@ from StatProcessTree import StatProcessTree
 class StatFutex(StatBase):
     """ Get futex related info  """
 
+    # Index of the contention stat of a futex. A wait is a FUTEX_WAIT which
+    # blocked until it was woken; a FUTEX_WAIT which returned EAGAIN (the
+    # futex value had changed) did not block, and one which returned
+    # ETIMEDOUT was not woken, so they are counted apart.
+    WAITS, WAIT_TIME, MAX_WAIT, MAX_WAITERS, MAX_WOKEN, EAGAINS, TIMEOUTS = range(7)
+
     def __init__(self):
         self._statProcessTree = StatProcessTree()
         self._unfinishedResult = {}
         self._futexHolderPid = {}
         self._futexWaiterPids = defaultdict(list)
         self._pluginOptionDict = {}
-        self._outputFile = sys.stdout
+        # the output is opened at the first event
+        self._output = None
+        self._printEvents = True
+
+        # contention stat of each futex address:
+        # [wait count, total wait time, max wait time, max waiters, max woken,
+        #  EAGAIN count, timeout count]
+        self._futexStat = {}
+        # blocked time of each pid: [wait count, total wait time]
+        self._pidWaitStat = {}
+        self._haveWaitTime = False
 
     def optionHelp(self):
-        return {"output":"Write the output to this file instead of stdout"}
+        return {"output":"Write the output to this file instead of stdout",
+                "format":"Output format: text (default), csv, json or ndjson",
+                "events":"Print every futex event (1, default) or the summary only (0)",
+                "top":"Number of the hottest futexes to print (default: 10)"}
 
     def setOption(self, pluginOptionDict):
         self._pluginOptionDict = pluginOptionDict
-        filename = self._pluginOptionDict.get("output", "")
-        self._outputFile = open(filename, "w") if filename else sys.stdout
+        if self._pluginOptionDict.get("events", "1") not in ["0", "1"] or \
+           not self._pluginOptionDict.get("top", "10").isdigit() or \
+           not self._checkOutputOption(self._pluginOptionDict):
+            return False
+        self._printEvents = self._pluginOptionDict.get("events", "1") == "1"
         return True
 
+    def _getOutput(self):
+        if self._output is None:
+            self._output = self._openOutput(self._pluginOptionDict)
+            if self._printEvents:
+                self._output.beginTable("Futex events", ["time", "pid", "event", "futex", "holder", "waiting list"],
+                                        header="")
+        return self._output
+
+    def _printEvent(self, timeStr, pid, event, futexAddress, holder, waiterPids, text):
+        self._getOutput().writeRow([str(timeStr) if timeStr else None, pid, event, futexAddress, holder, waiterPids], text)
+
     def isOperational(self, straceOptions):
         self._straceOptions = straceOptions
         return True
@@ -65,15 +97,22 @@ class StatFutex(StatBase):
         else:
             timeStr = ""
 
+        waitTime = None
         if syscallType == "resumed":
+            if pid not in self._unfinishedResult:
+                return                  # no <unfinished> line before, ignore
             # if this is a resume syscall, combine it with last unfinished syscall of this pid
             lastResult = self._unfinishedResult[pid]
+            waitTime = self._getWaitTime(result, lastResult)
             lastResult["return"] = result["return"]
+            lastResult["errno"] = result["errno"]
             lastResult["args"].append(result["args"])
             lastResult["type"] = "completed"
             result = lastResult
         elif syscallType == "unfinished":
             self._unfinishedResult[pid] = result
+        else:
+            waitTime = self._getWaitTime(result, None)
 
         futexAddress = result["args"][0]
         futexOp = result["args"][1]
@@ -81,40 +120,151 @@ class StatFutex(StatBase):
             if syscallType == "unfinished": # wait on a futex
                 # add myself in waiter list
                 self._futexWaiterPids[futexAddress].append(pid)
+                futexStat = self._getFutexStat(futexAddress)
+                futexStat[StatFutex.MAX_WAITERS] = max(futexStat[StatFutex.MAX_WAITERS],
+                                                       len(self._futexWaiterPids[futexAddress]))
 
-                self._outputFile.write("{0} pid:{1} wait        futex:{2}, current holder:{3}, waiting list:{4}\n".format(
-                       timeStr, pid, futexAddress, 
-                       self._futexHolderPid[futexAddress] if futexAddress in self._futexHolderPid else "Unknown", 
-                       self._futexWaiterPids[futexAddress]))
+                if self._printEvents:
+                    holder = self._futexHolderPid[futexAddress] if futexAddress in self._futexHolderPid else "Unknown"
+                    self._printEvent(timeStr, pid, "wait", futexAddress, holder, self._futexWaiterPids[futexAddress],
+                           "{0} pid:{1} wait        futex:{2}, current holder:{3}, waiting list:{4}".format(
+                           timeStr, pid, futexAddress, holder, self._futexWaiterPids[futexAddress]))
 
-            else: # completed or resumed = being wake up or timeout
+            else: # completed or resumed = being wake up, timeout or EAGAIN
                 # remove myself from futexWaiterPids
                 if futexAddress in self._futexWaiterPids:
                     if pid in self._futexWaiterPids[futexAddress]:
                         self._futexWaiterPids[futexAddress].remove(pid)
+                futexStat = self._getFutexStat(futexAddress)
+                if syscallType == "completed" and result["errno"] != "EAGAIN":
+                    # it blocked with the waiters which are still in the list
+                    futexStat[StatFutex.MAX_WAITERS] = max(futexStat[StatFutex.MAX_WAITERS],
+                                                           len(self._futexWaiterPids[futexAddress]) + 1)
 
-                returnValue = result["return"]
-                if int(returnValue) == 0: # being wake up
+                if result["errno"] is None: # being wake up
+                    self._recordWait(pid, futexAddress, waitTime)
                     self._futexHolderPid[futexAddress] = pid    # I am the holder now
-                    self._outputFile.write("{0} pid:{1} hold        futex:{2}, waiting list:{3}\n".format(
-                           timeStr, pid, futexAddress, 
-                           self._futexWaiterPids[futexAddress]))
-                else:                # timeout 
-                    self._outputFile.write("{0} pid:{1} timeout     futex:{2}\n".format(timeStr, pid, futexAddress))
-                    #TODO: many different cases in man page
+                    if self._printEvents:
+                        self._printEvent(timeStr, pid, "hold", futexAddress, pid, self._futexWaiterPids[futexAddress],
+                               "{0} pid:{1} hold        futex:{2}, waiting list:{3}".format(
+                               timeStr, pid, futexAddress,
+                               self._futexWaiterPids[futexAddress]))
+                else:
+                    if result["errno"] == "EAGAIN":     # the futex value changed, no wait
+                        futexStat[StatFutex.EAGAINS] += 1
+                        event = "eagain"
+                    elif result["errno"] == "ETIMEDOUT":
+                        futexStat[StatFutex.TIMEOUTS] += 1
+                        event = "timeout"
+                    else:                               # e.g. EINTR
+                        event = result["errno"]
+                    if self._printEvents:
+                        self._printEvent(timeStr, pid, event, futexAddress, None, None,
+                               "{0} pid:{1} {2:<11} futex:{3}".format(timeStr, pid, event, futexAddress))
 
         if "FUTEX_WAKE" in futexOp:
             self._futexHolderPid[futexAddress] = None
-            self._outputFile.write("{0} pid:{1} release     futex:{2}, waiting list:{3}\n".format(
-                   timeStr, pid, futexAddress, 
-                   self._futexWaiterPids[futexAddress]))
+            if syscallType != "unfinished" and result["return"].isdigit():
+                futexStat = self._getFutexStat(futexAddress)
+                futexStat[StatFutex.MAX_WOKEN] = max(futexStat[StatFutex.MAX_WOKEN],
+                                                     int(result["return"]))   # number of waiters woken
+            if self._printEvents:
+                self._printEvent(timeStr, pid, "release", futexAddress, None, self._futexWaiterPids[futexAddress],
+                       "{0} pid:{1} release     futex:{2}, waiting list:{3}".format(
+                       timeStr, pid, futexAddress,
+                       self._futexWaiterPids[futexAddress]))
+
+    def _getWaitTime(self, result, unfinishedResult):
+        """ Return the time spent in the futex syscall: from -T if there is,
+            otherwise from the start time of the unfinished and resumed line.
+            Return None if it is unknown.
+        """
+        if result.get("timeSpent"):
+            return result["timeSpent"]
+        if unfinishedResult and "startTime" in result:
+            return result["startTime"] - unfinishedResult["startTime"]
+        return None
+
+    def _getFutexStat(self, futexAddress):
+        if futexAddress not in self._futexStat:
+            self._futexStat[futexAddress] = [0, timedelta(), timedelta(), 0, 0, 0, 0]
+        return self._futexStat[futexAddress]
 
+    def _recordWait(self, pid, futexAddress, waitTime):
+        futexStat = self._getFutexStat(futexAddress)
+        futexStat[StatFutex.WAITS] += 1
+        if pid not in self._pidWaitStat:
+            self._pidWaitStat[pid] = [0, timedelta()]
+        self._pidWaitStat[pid][0] += 1
+
+        if waitTime is not None:
+            self._haveWaitTime = True
+            futexStat[StatFutex.WAIT_TIME] += waitTime
+            futexStat[StatFutex.MAX_WAIT] = max(futexStat[StatFutex.MAX_WAIT], waitTime)
+            self._pidWaitStat[pid][1] += waitTime
+
+
+    def getState(self):
+        return (self._statProcessTree.getState(), self._unfinishedResult,
+                self._futexHolderPid, dict(self._futexWaiterPids),
+                self._futexStat, self._pidWaitStat, self._haveWaitTime)
+
+    def setState(self, state):
+        processTreeState, self._unfinishedResult, self._futexHolderPid, futexWaiterPids, \
+            self._futexStat, self._pidWaitStat, self._haveWaitTime = state
+        self._statProcessTree.setState(processTreeState)
+        self._futexWaiterPids = defaultdict(list, futexWaiterPids)
 
     def printOutput(self):
+        output = self._getOutput()
         futexAddressSet = set(self._futexHolderPid.keys() + self._futexWaiterPids.keys())
 
-        self._outputFile.write("Futex Address,Holder,Waiters\n")
+        output.beginTable("Futexes", ["futex", "holder", "waiters"],
+                          header="Futex Address,Holder,Waiters\n")
         for addr in futexAddressSet:
-            self._outputFile.write("{0},{1},{2}\n".format(addr, 
-                   self._futexHolderPid[addr] if addr in self._futexHolderPid else "Unknown",
-                   self._futexWaiterPids[addr]))
+            holder = self._futexHolderPid[addr] if addr in self._futexHolderPid else "Unknown"
+            output.writeRow([addr, holder, self._futexWaiterPids[addr]],
+                            "{0},{1},{2}".format(addr, holder, self._futexWaiterPids[addr]))
+
+        # hottest futexes by total wait time (or by wait count if the wait
+        # time is unknown), then by EAGAIN count
+        sortIndex = StatFutex.WAIT_TIME if self._haveWaitTime else StatFutex.WAITS
+        top = int(self._pluginOptionDict.get("top", "10"))
+        hotFutexList = sorted([addr for addr, futexStat in self._futexStat.iteritems()
+                               if futexStat[StatFutex.WAITS] or futexStat[StatFutex.EAGAINS] or
+                                  futexStat[StatFutex.TIMEOUTS]],
+                              key=lambda addr: (self._futexStat[addr][sortIndex],
+                                                self._futexStat[addr][StatFutex.EAGAINS]),
+                              reverse=True)[:top]
+        output.beginTable("Hottest futexes", ["futex", "waits", "total wait seconds", "max wait seconds",
+                                              "max waiters", "max woken", "EAGAIN", "timeouts"],
+                          header="\nHottest futexes (top %d)\n"
+                                 "Futex Address,Waits,Total Wait (s),Max Wait (s),Max Waiters,Max Woken,"
+                                 "EAGAIN,Timeouts\n" % top)
+        for addr in hotFutexList:
+            waitCount, totalWait, maxWait, maxWaiters, maxWoken, eagainCount, timeoutCount = self._futexStat[addr]
+            output.writeRow([addr, waitCount, self._getWaitSeconds(totalWait), self._getWaitSeconds(maxWait),
+                             maxWaiters, maxWoken, eagainCount, timeoutCount],
+                            "{0},{1},{2},{3},{4},{5},{6},{7}".format(addr, waitCount,
+                            self._formatWaitTime(totalWait), self._formatWaitTime(maxWait), maxWaiters, maxWoken,
+                            eagainCount, timeoutCount))
+
+        output.beginTable("Blocked time per thread", ["pid", "exec name", "waits", "total wait seconds"],
+                          header="\nBlocked time per thread\nPid,Exec Name,Waits,Total Wait (s)\n")
+        for pid in sorted(self._pidWaitStat, key=lambda pid: self._pidWaitStat[pid][sortIndex],
+                          reverse=True):
+            waitCount, totalWait = self._pidWaitStat[pid]
+            execName = self._statProcessTree.getProcessExecName(pid) or "unknown"
+            output.writeRow([pid, execName, waitCount, self._getWaitSeconds(totalWait)],
+                            "{0},{1},{2},{3}".format(pid, execName, waitCount, self._formatWaitTime(totalWait)))
+        output.close()
+
+    def _getWaitSeconds(self, waitTime):
+        if not self._haveWaitTime:
+            return None
+        return waitTime.total_seconds()
+
+    def _formatWaitTime(self, waitTime):
+        if not self._haveWaitTime:
+            return "n/a"
+        return "%.6f" % waitTime.total_seconds()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+from collections import deque
+
+from StatBase import StatBase
+from straceParserLib.StatUtils import SpaceSaving, timedeltaToMicroseconds
+
+
+class StatInefficiency(StatBase):
+    """ Find redundant and repeated syscalls, ranked by the time wasted """
+
+    # syscalls taking a path, and the index of the path argument
+    PATH_SYSCALLS = {"stat": 0, "lstat": 0, "stat64": 0, "lstat64": 0, "access": 0,
+                     "open": 0, "readlink": 0, "openat": 1, "newfstatat": 1,
+                     "fstatat64": 1, "statx": 1, "faccessat": 1, "readlinkat": 1}
+    MISSING_ERRNO = set(["ENOENT", "ENOTDIR"])
+    TIME_SYSCALLS = set(["gettimeofday", "clock_gettime", "time"])
+    # syscalls which can be replaced by the positional version after lseek
+    SEEK_SYSCALLS = {"read": "pread64", "write": "pwrite64", "readv": "preadv", "writev": "pwritev"}
+    # syscalls waiting for fds, and the index of the timeout argument
+    POLL_SYSCALLS = {"poll": 2, "ppoll": 2, "select": 4, "pselect6": 4,
+                     "epoll_wait": 3, "epoll_pwait": 3}
+    EXIT_SYSCALLS = set(["exit", "exit_group"])
+
+    # Index of the state of a thread
+    WINDOW, TIME_CALLS, LAST_SYSCALL, LAST_FD, LAST_USECS, IDLE_POLLS = 0, 1, 2, 3, 4, 5
+
+    def __init__(self):
+        self._pluginOptionDict = {}
+        self._straceOptions = {}
+        self._top = 20
+        self._repeat = 10
+        self._window = 50
+        # _threads[pid] = the state of the recent syscalls of a thread
+        self._threads = {}
+        # the paths failing the most, with [calls, usecs, syscall set] of
+        # each path still in the table in _missingPath[(pid, path)]
+        self._missingCounter = SpaceSaving(1000)
+        self._missingPath = {}
+        # _timeStorm[pid], _seekPair[(pid, fd)] and _busyPoll[pid] are
+        # [calls, wasted usecs]
+        self._timeStorm = {}
+        self._seekPair = {}
+        self._busyPoll = {}
+
+    def optionHelp(self):
+        return {"output":"Write the output to this file instead of stdout",
+                "format":"Output format: text (default), csv, json or ndjson",
+                "top":"Number of findings to print (default: 20)",
+                "repeat":"Report a missing path failing at least this many times (default: 10)",
+                "window":"Number of recent syscalls of a thread checked for time storms (default: 50)"}
+
+    def setOption(self, pluginOptionDict):
+        self._pluginOptionDict = pluginOptionDict
+        for option in ["top", "repeat", "window"]:
+            value = self._pluginOptionDict.get(option, str(getattr(self, "_" + option)))
+            if not value.isdigit() or int(value) == 0:
+                return False
+            setattr(self, "_" + option, int(value))
+        return self._checkOutputOption(self._pluginOptionDict)
+
+    def isOperational(self, straceOptions):
+        self._straceOptions = straceOptions
+        return True
+
+    def getSyscallHooks(self):
+        hooks = {"ALL": self.recordWindow}
+        hooks.update(dict((syscall, self.checkMissingPath) for syscall in StatInefficiency.PATH_SYSCALLS))
+        hooks.update(dict((syscall, self.checkTimeStorm) for syscall in StatInefficiency.TIME_SYSCALLS))
+        hooks.update(dict((syscall, self.checkSeekPair) for syscall in StatInefficiency.SEEK_SYSCALLS))
+        hooks.update(dict((syscall, self.checkBusyPoll) for syscall in StatInefficiency.POLL_SYSCALLS))
+        return hooks
+
+    def _getPid(self, result):
+        if self._straceOptions["havePid"]:
+            return result["pid"]
+        return "0"
+
+    def _getThread(self, pid):
+        thread = self._threads.get(pid)
+        if thread is None:
+            thread = self._threads[pid] = [deque(maxlen=self._window), 0, None, None, 0, 0]
+        return thread
+
+    def _getUsecs(self, result):
+        if result.get("timeSpent"):
+            return timedeltaToMicroseconds(result["timeSpent"])
+        return 0
+
+    def _addFinding(self, findingDict, key, usecs):
+        finding = findingDict.get(key)
+        if finding is None:
+            finding = findingDict[key] = [0, 0]
+        finding[0] += 1
+        finding[1] += usecs
+
+    # The syscall hooks run before recordWindow, so the window of the thread
+    # does not have the current syscall yet.
+
+    def checkMissingPath(self, result):
+        if result["return"] != "-1" or result["errno"] not in StatInefficiency.MISSING_ERRNO:
+            return
+        pathIndex = StatInefficiency.PATH_SYSCALLS[result["syscall"]]
+        if len(result["args"]) <= pathIndex:
+            return
+        key = (self._getPid(result), result["args"][pathIndex])
+        evictedKey = self._missingCounter.add(key)
+        if evictedKey is not None:
+            del self._missingPath[evictedKey]
+        path = self._missingPath.get(key)
+        if path is None:
+            path = self._missingPath[key] = [0, 0, set()]
+        path[0] += 1
+        path[1] += self._getUsecs(result)
+        path[2].add(result["syscall"])
+
+    def checkTimeStorm(self, result):
+        thread = self._getThread(self._getPid(result))
+        window = thread[StatInefficiency.WINDOW]
+        # a storm: at least half of the recent syscalls (this one included)
+        # ask for the time
+        if len(window) + 1 >= self._window / 2 and \
+           (thread[StatInefficiency.TIME_CALLS] + 1) * 2 >= len(window) + 1:
+            self._addFinding(self._timeStorm, self._getPid(result), self._getUsecs(result))
+
+    def checkSeekPair(self, result):
+        thread = self._getThread(self._getPid(result))
+        if thread[StatInefficiency.LAST_SYSCALL] == "lseek" and result["args"] and \
+           thread[StatInefficiency.LAST_FD] == result["args"][0]:
+            # the lseek is saved by a positional read or write
+            self._addFinding(self._seekPair, (self._getPid(result), result["syscall"], result["args"][0]),
+                             thread[StatInefficiency.LAST_USECS])
+
+    def _isZeroTimeout(self, timeout):
+        """ A timeout of 0 ms for poll or {0, 0} / {tv_sec=0, tv_usec=0} for
+            the others
+        """
+        if isinstance(timeout, list):
+            return bool(timeout) and all([isinstance(t, basestring) and t.rpartition("=")[2] == "0"
+                                          for t in timeout])
+        return timeout == "0"
+
+    def checkBusyPoll(self, result):
+        thread = self._getThread(self._getPid(result))
+        timeoutIndex = StatInefficiency.POLL_SYSCALLS[result["syscall"]]
+        if result["return"] == "0" and len(result["args"]) > timeoutIndex and \
+           self._isZeroTimeout(result["args"][timeoutIndex]):
+            thread[StatInefficiency.IDLE_POLLS] += 1
+            # polling again with nothing ready and nothing done in between
+            if thread[StatInefficiency.IDLE_POLLS] > 1:
+                self._addFinding(self._busyPoll, self._getPid(result), self._getUsecs(result))
+        else:
+            thread[StatInefficiency.IDLE_POLLS] = 0
+
+    def recordWindow(self, result):
+        pid = self._getPid(result)
+        syscall = result["syscall"]
+        if syscall in StatInefficiency.EXIT_SYSCALLS:
+            self._threads.pop(pid, None)
+            return
+
+        thread = self._getThread(pid)
+        window = thread[StatInefficiency.WINDOW]
+        if len(window) == window.maxlen and window[0] in StatInefficiency.TIME_SYSCALLS:
+            thread[StatInefficiency.TIME_CALLS] -= 1
+        window.append(syscall)
+        if syscall in StatInefficiency.TIME_SYSCALLS:
+            thread[StatInefficiency.TIME_CALLS] += 1
+
+        if syscall not in StatInefficiency.POLL_SYSCALLS:
+            thread[StatInefficiency.IDLE_POLLS] = 0
+        thread[StatInefficiency.LAST_SYSCALL] = syscall if result["return"] != "-1" else None
+        thread[StatInefficiency.LAST_FD] = result["args"][0] if result["args"] else None
+        thread[StatInefficiency.LAST_USECS] = self._getUsecs(result)
+
+    def getState(self):
+        return (self._threads, self._missingCounter, self._missingPath,
+                self._timeStorm, self._seekPair, self._busyPoll)
+
+    def setState(self, state):
+        (self._threads, self._missingCounter, self._missingPath,
+         self._timeStorm, self._seekPair, self._busyPoll) = state
+
+    def _getFindings(self):
+        """ Return the list of (pattern, pid, detail, calls, wasted usecs,
+            suggestion)
+        """
+        findings = []
+        for (pid, path), (calls, usecs, syscallSet) in self._missingPath.iteritems():
+            if calls >= self._repeat:
+                # the first failure is needed, the others are repeated
+                findings.append(("missing path", pid, "%s (%s)" % (path, " ".join(sorted(syscallSet))),
+                                 calls, usecs * (calls - 1) / calls,
+                                 "cache the failure or fix the search path"))
+        for pid, (calls, usecs) in self._timeStorm.iteritems():
+            findings.append(("time storm", pid, "gettimeofday/clock_gettime/time", calls, usecs,
+                             "cache the time or use a coarse vDSO clock"))
+        for (pid, syscall, fid), (calls, usecs) in self._seekPair.iteritems():
+            positional = StatInefficiency.SEEK_SYSCALLS[syscall]
+            findings.append(("lseek+%s" % syscall, pid, "fd %s" % fid, calls, usecs,
+                             "use %s instead of lseek and %s" % (positional, syscall)))
+        for pid, (calls, usecs) in self._busyPoll.iteritems():
+            findings.append(("busy poll", pid, "zero timeout, nothing ready", calls, usecs,
+                             "block with a timeout instead of polling"))
+        return findings
+
+    def printOutput(self):
+        out = self._openOutput(self._pluginOptionDict)
+
+        haveTimeSpent = self._straceOptions["haveTimeSpent"]
+        findings = self._getFindings()
+        if haveTimeSpent:
+            findings.sort(key=lambda finding: (-finding[4], -finding[3], finding[:3]))
+            order = "the most wasted time first"
+        else:
+            findings.sort(key=lambda finding: (-finding[3], finding[:3]))
+            order = "the most calls first"
+        columns = ["pattern", "pid", "detail", "calls", "wasted seconds", "suggestion"]
+        out.beginTable("Inefficiency findings", columns, ["%s", "%s", "%s", "%d", "%.6f", "%s"],
+                       "====== Inefficiency findings (csv), %s ======\n%s\n" % (order, ", ".join(columns)))
+        for pattern, pid, detail, calls, usecs, suggestion in findings[:self._top]:
+            out.writeRow([pattern, pid, detail, calls, usecs / 1000000.0 if haveTimeSpent else None, suggestion])
+        out.close()
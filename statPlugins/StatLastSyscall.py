@@ -27,6 +27,15 @@ class StatLastSyscall(StatBase):
         self._statProcessTree = StatProcessTree()
         self._lastSyscallStore = defaultdict(deque)
         self._lastSyscallTime = {}
+        self._pluginOptionDict = {}
+
+    def optionHelp(self):
+        return {"output":"Write the output to this file instead of stdout",
+                "format":"Output format: text (default), csv, json or ndjson"}
+
+    def setOption(self, pluginOptionDict):
+        self._pluginOptionDict = pluginOptionDict
+        return self._checkOutputOption(pluginOptionDict)
 
     def isOperational(self, straceOptions):
         self._straceOptions = straceOptions
@@ -75,7 +84,20 @@ class StatLastSyscall(StatBase):
             self._lastSyscallStore[pid].popleft()
 
 
+    def getState(self):
+        return (self._statProcessTree.getState(), dict(self._lastSyscallStore),
+                self._lastSyscallTime, getattr(self, "_latestTime", None))
+
+    def setState(self, state):
+        processTreeState, lastSyscallStore, self._lastSyscallTime, latestTime = state
+        self._statProcessTree.setState(processTreeState)
+        self._lastSyscallStore = defaultdict(deque, lastSyscallStore)
+        if latestTime:
+            self._latestTime = latestTime
+
     def printOutput(self):
+        out = self._openOutput(self._pluginOptionDict)
+        out.beginTable("Last syscalls", ["pid", "wait seconds", "last syscall"], header="")
         for pid, syscallList in self._lastSyscallStore.iteritems():
             if self._straceOptions["haveTime"]:
                 waitTime = self._latestTime - self._lastSyscallTime[pid]
@@ -86,4 +108,7 @@ class StatLastSyscall(StatBase):
                 #print pid, self._statProcessTree.getProcessExecName(pid), waitTime
                 #for syscallResult in syscallList:
                 #    print "   ", self._reconstructStraceLine(syscallResult)
-                print pid, waitTime, self._reconstructStraceLine(syscallList[-1])
+                syscallLine = self._reconstructStraceLine(syscallList[-1])
+                out.writeRow([pid, waitTime.total_seconds() if waitTime != "" else None, syscallLine],
+                             "%s %s %s" % (pid, waitTime, syscallLine))
+        out.close()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+from datetime import datetime, timedelta
+
+from StatBase import StatBase
+from StatProcessTree import StatProcessTree
+from StatFileIO import StatFileIO
+from straceParserLib.StatUtils import IntervalMap, timedeltaToMicroseconds
+
+
+class StatMemMap(StatBase):
+    """ Mapped memory (mmap/munmap/mremap/brk) over time, peak and churn per process """
+
+    EPOCH = datetime(1970, 1, 1)
+    PAGE_SIZE = 4096
+    MMAP_SYSCALLS = set(["mmap", "mmap2"])
+    FORK_SYSCALLS = set(["clone", "fork", "vfork"])
+    ANONYMOUS = "(anonymous)"
+
+    # Index of the stat of a process
+    MAPPED_BYTES, PEAK_BYTES, MMAPS, MUNMAPS, MREMAPS, BRKS, \
+        TOTAL_MAPPED, TOTAL_UNMAPPED, FIRST_TIME, LAST_TIME = range(10)
+
+    def __init__(self):
+        self._statProcessTree = StatProcessTree()
+        self._statFileIO = StatFileIO()
+        self._pluginOptionDict = {}
+        self._straceOptions = {}
+        self._interval = 1000000        # in microseconds
+        # _addressSpace[tgid] = [IntervalMap of the mappings, heap start, heap end]
+        self._addressSpace = {}
+        # _processStat[tgid] = the stat of a process
+        self._processStat = {}
+        # _mappedFiles[tgid][filename] = [mappings, bytes]
+        self._mappedFiles = {}
+        # _timeline[tgid][bucket number] = the most bytes mapped in the interval
+        self._timeline = {}
+
+    def optionHelp(self):
+        return {"output":"Write the output to this file instead of stdout",
+                "format":"Output format: text (default), csv, json or ndjson",
+                "interval":"Length of the time interval of the mapped bytes over time in milliseconds (default: 1000)"}
+
+    def setOption(self, pluginOptionDict):
+        self._pluginOptionDict = pluginOptionDict
+        interval = self._pluginOptionDict.get("interval", "1000")
+        if not interval.isdigit() or int(interval) == 0:
+            return False
+        self._interval = int(interval) * 1000
+        return self._checkOutputOption(self._pluginOptionDict)
+
+    def isOperational(self, straceOptions):
+        self._straceOptions = straceOptions
+        self._statFileIO.isOperational(straceOptions)
+        return True
+
+    def getSyscallHooks(self):
+        ownHooks = dict((syscall, self.recordMmap) for syscall in StatMemMap.MMAP_SYSCALLS)
+        ownHooks.update({"munmap": self.recordMunmap, "mremap": self.recordMremap,
+                         "brk": self.recordBrk, "execve": self.recordExecve})
+        processTreeHooks = None
+        if self._straceOptions["havePid"]:
+            ownHooks.update(dict((syscall, self.recordFork) for syscall in StatMemMap.FORK_SYSCALLS))
+            processTreeHooks = self._statProcessTree.getSyscallHooks()
+        # the fd table of StatFileIO names the mapped files
+        return self._combineHooks(ownHooks, self._statFileIO.getSyscallHooks(), processTreeHooks)
+
+    def _getTgid(self, result):
+        if self._straceOptions["havePid"]:
+            return self._statProcessTree.getProcessTgid(result["pid"])
+        return "0"
+
+    def _getAddressSpace(self, tgid):
+        addressSpace = self._addressSpace.get(tgid)
+        if addressSpace is None:
+            addressSpace = self._addressSpace[tgid] = [IntervalMap(), None, None]
+        return addressSpace
+
+    def _getProcessStat(self, tgid):
+        stat = self._processStat.get(tgid)
+        if stat is None:
+            stat = self._processStat[tgid] = [0, 0, 0, 0, 0, 0, 0, 0, None, None]
+        return stat
+
+    def _toInt(self, value):
+        """ Parse an address or length, None if it is not a number """
+        try:
+            return int(value, 0)
+        except (ValueError, TypeError):
+            return None
+
+    def _pageAlign(self, length):
+        return (length + StatMemMap.PAGE_SIZE - 1) // StatMemMap.PAGE_SIZE * StatMemMap.PAGE_SIZE
+
+    def _update(self, result, tgid, mapped=0, unmapped=0):
+        """ Update the mapped bytes of tgid after a syscall """
+        mappings, heapStart, heapEnd = self._getAddressSpace(tgid)
+        stat = self._getProcessStat(tgid)
+        stat[StatMemMap.TOTAL_MAPPED] += mapped
+        stat[StatMemMap.TOTAL_UNMAPPED] += unmapped
+        mappedBytes = mappings.getSize()
+        if heapStart is not None:
+            mappedBytes += heapEnd - heapStart
+        stat[StatMemMap.MAPPED_BYTES] = mappedBytes
+        stat[StatMemMap.PEAK_BYTES] = max(stat[StatMemMap.PEAK_BYTES], mappedBytes)
+
+        if "startTime" in result:
+            startTime = timedeltaToMicroseconds(result["startTime"] - StatMemMap.EPOCH)
+            if stat[StatMemMap.FIRST_TIME] is None:
+                stat[StatMemMap.FIRST_TIME] = startTime
+            stat[StatMemMap.LAST_TIME] = startTime
+            timeline = self._timeline.setdefault(tgid, {})
+            bucketNumber = startTime // self._interval
+            timeline[bucketNumber] = max(timeline.get(bucketNumber, 0), mappedBytes)
+
+    def recordMmap(self, result):
+        args = result["args"]
+        address = self._toInt(result["return"])
+        if result["return"] == "-1" or address is None or len(args) < 5:
+            return
+        length = self._toInt(args[1])
+        if length is None:
+            return
+        tgid = self._getTgid(result)
+        filename = StatMemMap.ANONYMOUS
+        if args[4] != "-1":
+            filename = self._statFileIO.getFileName(result.get("pid", 0), args[4]) or "unknown:" + args[4]
+        length = self._pageAlign(length)
+        # a MAP_FIXED mapping replaces the mappings it overlaps
+        unmapped = self._getAddressSpace(tgid)[0].add(address, address + length, filename)
+
+        self._getProcessStat(tgid)[StatMemMap.MMAPS] += 1
+        mappedFile = self._mappedFiles.setdefault(tgid, {}).setdefault(filename, [0, 0])
+        mappedFile[0] += 1
+        mappedFile[1] += length
+        self._update(result, tgid, mapped=length, unmapped=unmapped)
+
+    def recordMunmap(self, result):
+        if result["return"] != "0" or len(result["args"]) < 2:
+            return
+        address = self._toInt(result["args"][0])
+        length = self._toInt(result["args"][1])
+        if address is None or length is None:
+            return
+        tgid = self._getTgid(result)
+        unmapped = self._getAddressSpace(tgid)[0].remove(address, address + self._pageAlign(length))
+        self._getProcessStat(tgid)[StatMemMap.MUNMAPS] += 1
+        self._update(result, tgid, unmapped=unmapped)
+
+    def recordMremap(self, result):
+        args = result["args"]
+        newAddress = self._toInt(result["return"])
+        if result["return"] == "-1" or newAddress is None or len(args) < 3:
+            return
+        oldAddress = self._toInt(args[0])
+        oldLength = self._toInt(args[1])
+        newLength = self._toInt(args[2])
+        if oldAddress is None or oldLength is None or newLength is None:
+            return
+        tgid = self._getTgid(result)
+        mappings = self._getAddressSpace(tgid)[0]
+        value = mappings.get(oldAddress) or StatMemMap.ANONYMOUS
+        unmapped = mappings.remove(oldAddress, oldAddress + self._pageAlign(oldLength))
+        newLength = self._pageAlign(newLength)
+        unmapped += mappings.add(newAddress, newAddress + newLength, value)
+        self._getProcessStat(tgid)[StatMemMap.MREMAPS] += 1
+        self._update(result, tgid, mapped=newLength, unmapped=unmapped)
+
+    def recordBrk(self, result):
+        end = self._toInt(result["return"])
+        if end is None:
+            return
+        tgid = self._getTgid(result)
+        addressSpace = self._getAddressSpace(tgid)
+        if addressSpace[1] is None:      # the first brk is the start of the heap
+            addressSpace[1] = addressSpace[2] = end
+        growth = end - addressSpace[2]
+        addressSpace[2] = max(end, addressSpace[1])
+        stat = self._getProcessStat(tgid)
+        stat[StatMemMap.BRKS] += 1
+        self._update(result, tgid, mapped=max(growth, 0), unmapped=max(-growth, 0))
+
+    def recordExecve(self, result):
+        if result["return"] != "0":
+            return
+        # a new address space, the stat of the process goes on
+        tgid = self._getTgid(result)
+        self._addressSpace[tgid] = [IntervalMap(), None, None]
+        self._update(result, tgid)
+
+    def recordFork(self, result):
+        if not result["return"].isdigit():
+            return
+        flags = " ".join([arg for arg in result["args"] if isinstance(arg, basestring)])
+        if "CLONE_VM" in flags or result["syscall"] == "vfork":
+            return          # a thread, or a child sharing the memory until execve
+        parentSpace = self._addressSpace.get(self._getTgid(result))
+        if parentSpace is not None:
+            # the child gets a copy of the address space of the parent
+            childPid = result["return"]
+            self._addressSpace[childPid] = [parentSpace[0].copy(), parentSpace[1], parentSpace[2]]
+            self._update(result, childPid)
+
+    def getState(self):
+        return (self._statProcessTree.getState(), self._statFileIO.getState(), self._addressSpace,
+                self._processStat, self._mappedFiles, self._timeline)
+
+    def setState(self, state):
+        (processTreeState, fileIOState, self._addressSpace,
+         self._processStat, self._mappedFiles, self._timeline) = state
+        self._statProcessTree.setState(processTreeState)
+        self._statFileIO.setState(fileIOState)
+
+    def _getBucketTime(self, bucketNumber):
+        """ The start time of the bucket, in the time format of the strace file """
+        usecs = bucketNumber * self._interval
+        if self._straceOptions["haveTime"] == "ttt":
+            return "%.6f" % (usecs / 1000000.0)
+        return (StatMemMap.EPOCH + timedelta(microseconds=usecs)).strftime("%H:%M:%S.%f")
+
+    def printOutput(self):
+        out = self._openOutput(self._pluginOptionDict)
+
+        columns = ["pid", "mapped bytes at end", "peak mapped bytes", "mmaps", "munmaps", "mremaps", "brks",
+                   "bytes mapped", "bytes unmapped", "map+unmap calls/s"]
+        out.beginTable("Memory mappings per process", columns,
+                       ["%s", "%d", "%d", "%d", "%d", "%d", "%d", "%d", "%d", "%.1f"],
+                       "====== Memory mappings per process (csv), the largest peak first ======\n%s\n" %
+                       ", ".join(columns))
+        for tgid, stat in sorted(self._processStat.iteritems(),
+                                 key=lambda (tgid, stat): (-stat[StatMemMap.PEAK_BYTES], tgid)):
+            calls = stat[StatMemMap.MMAPS] + stat[StatMemMap.MUNMAPS] + stat[StatMemMap.MREMAPS]
+            churn = None
+            if stat[StatMemMap.FIRST_TIME] is not None and stat[StatMemMap.LAST_TIME] > stat[StatMemMap.FIRST_TIME]:
+                churn = calls * 1000000.0 / (stat[StatMemMap.LAST_TIME] - stat[StatMemMap.FIRST_TIME])
+            out.writeRow([tgid, stat[StatMemMap.MAPPED_BYTES], stat[StatMemMap.PEAK_BYTES],
+                          stat[StatMemMap.MMAPS], stat[StatMemMap.MUNMAPS], stat[StatMemMap.MREMAPS],
+                          stat[StatMemMap.BRKS], stat[StatMemMap.TOTAL_MAPPED], stat[StatMemMap.TOTAL_UNMAPPED],
+                          churn])
+
+        out.write("\n")
+        out.beginTable("Files mapped", ["pid", "filename", "mappings", "bytes"], ["%s", "%s", "%d", "%d"])
+        for tgid in sorted(self._mappedFiles):
+            for name, (mappings, nbytes) in sorted(self._mappedFiles[tgid].iteritems(),
+                                                   key=lambda (name, m): (-m[1], name)):
+                if name != StatMemMap.ANONYMOUS:
+                    out.writeRow([tgid, name, mappings, nbytes])
+
+        if self._timeline:
+            out.write("\n")
+            tgidList = sorted(self._timeline)
+            out.beginTable("Most mapped bytes per %d ms" % (self._interval / 1000), ["time"] + tgidList,
+                           ["%s"] + ["%d"] * len(tgidList))
+            firstBucket = min([min(timeline) for timeline in self._timeline.itervalues()])
+            lastBucket = max([max(timeline) for timeline in self._timeline.itervalues()])
+            # a process keeps its mapped bytes in the intervals without mmap,
+            # until its last one
+            lastBytes = dict((tgid, None) for tgid in tgidList)
+            endBucket = dict((tgid, max(self._timeline[tgid])) for tgid in tgidList)
+            for bucketNumber in xrange(firstBucket, lastBucket + 1):
+                for tgid in tgidList:
+                    if bucketNumber in self._timeline[tgid]:
+                        lastBytes[tgid] = self._timeline[tgid][bucketNumber]
+                    elif bucketNumber > endBucket[tgid]:
+                        lastBytes[tgid] = None
+                out.writeRow([self._getBucketTime(bucketNumber)] + [lastBytes[tgid] for tgid in tgidList])
+        out.close()
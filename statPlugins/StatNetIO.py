@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+import re
+
+from StatBase import StatBase
+from StatProcessTree import StatProcessTree
+from straceParserLib.StatUtils import LatencyHistogram, timedeltaToMicroseconds
+
+
+class StatNetIO(StatBase):
+    """ Socket throughput, EAGAIN rate and latency per peer address """
+
+    SEND_SYSCALLS = set(["write", "writev", "send", "sendto", "sendmsg"])
+    RECV_SYSCALLS = set(["read", "readv", "recv", "recvfrom", "recvmsg"])
+    # syscalls which can only be done on a socket, so a fd opened before
+    # the trace is still counted
+    SOCKET_ONLY_SYSCALLS = set(["send", "sendto", "sendmsg", "recv", "recvfrom", "recvmsg"])
+    # index of the address argument of sendto and recvfrom
+    ADDRESS_ARG = 4
+    EAGAIN_ERRNO = set(["EAGAIN", "EWOULDBLOCK"])
+
+    RE_PORT = re.compile(r'port=htons\((\d+)\)')
+    RE_INET_ADDR = re.compile(r'inet_addr\("([^"]*)"\)')
+    RE_INET6_ADDR = re.compile(r'inet_pton\(AF_INET6,\s*"([^"]*)"')
+
+    # Index of the stat of a peer. The EAGAIN of accept are counted apart,
+    # they are not calls of the send/receive calls of EAGAIN_COUNT.
+    CONNECTIONS, CONNECT_FAILS, CONNECT_USECS, CALLS, SENT_BYTES, RECV_BYTES, \
+        EAGAIN_COUNT, ERRORS, IO_USECS, ACCEPT_EAGAIN_COUNT, LATENCY = range(11)
+
+    def __init__(self):
+        self._statProcessTree = StatProcessTree()
+        self._pluginOptionDict = {}
+        self._straceOptions = {}
+        # _sockets[(tgid, fd)] = [peer, bound address], the peer is a
+        # (direction, address) tuple or None if not connected
+        self._sockets = {}
+        # _peerStat[(direction, address)] = the stat of a peer
+        self._peerStat = {}
+
+    def optionHelp(self):
+        return {"output":"Write the output to this file instead of stdout",
+                "format":"Output format: text (default), csv, json or ndjson",
+                "top":"Only print the N peers with the most sent+received bytes"}
+
+    def setOption(self, pluginOptionDict):
+        self._pluginOptionDict = pluginOptionDict
+        if not self._pluginOptionDict.get("top", "0").isdigit():
+            return False
+        return self._checkOutputOption(self._pluginOptionDict)
+
+    def isOperational(self, straceOptions):
+        self._straceOptions = straceOptions
+        return True
+
+    def getSyscallHooks(self):
+        hooks = {"socket": self.openSocket, "connect": self.connectSocket,
+                 "bind": self.bindSocket, "accept": self.acceptSocket, "accept4": self.acceptSocket,
+                 "close": self.closeSocket}
+        for syscall in StatNetIO.SEND_SYSCALLS | StatNetIO.RECV_SYSCALLS:
+            hooks[syscall] = self.transferSocket
+        # the fds are shared by the threads of a process
+        if self._straceOptions["havePid"]:
+            return self._combineHooks(hooks, self._statProcessTree.getSyscallHooks())
+        return hooks
+
+    def _getKey(self, result, fid):
+        if self._straceOptions["havePid"]:
+            return (self._statProcessTree.getProcessTgid(result["pid"]), fid)
+        return ("0", fid)
+
+    def _parseAddress(self, sockaddr):
+        """ Return the address in a sockaddr argument as a string, e.g.
+            "192.168.1.1:80", "[::1]:80" or "unix:/tmp/socket", or None if
+            there is no address
+        """
+        if not isinstance(sockaddr, list) or not sockaddr:
+            return None
+        family = sockaddr[0].partition("=")[2]
+        text = ", ".join([arg for arg in sockaddr if isinstance(arg, basestring)])
+        port = StatNetIO.RE_PORT.search(text)
+        port = ":" + port.group(1) if port else ""
+        if family == "AF_INET":
+            addr = StatNetIO.RE_INET_ADDR.search(text)
+            return (addr.group(1) if addr else "?") + port
+        if family == "AF_INET6":
+            addr = StatNetIO.RE_INET6_ADDR.search(text)
+            return "[%s]%s" % (addr.group(1) if addr else "?", port)
+        if family in ["AF_FILE", "AF_UNIX", "AF_LOCAL"]:
+            for arg in sockaddr[1:]:
+                if isinstance(arg, basestring) and arg.startswith("path="):
+                    return "unix:" + arg[len("path="):].replace('"', '')
+            return None
+        return family
+
+    def _getPeerStat(self, peer):
+        stat = self._peerStat.get(peer)
+        if stat is None:
+            stat = self._peerStat[peer] = [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, LatencyHistogram()]
+        return stat
+
+    def _getUsecs(self, result):
+        if result.get("timeSpent"):
+            return timedeltaToMicroseconds(result["timeSpent"])
+        return None
+
+    def openSocket(self, result):
+        if result["return"].isdigit():
+            self._sockets[self._getKey(result, result["return"])] = [None, None]
+
+    def bindSocket(self, result):
+        socket = self._sockets.get(self._getKey(result, result["args"][0]))
+        if socket is not None and len(result["args"]) > 1:
+            socket[1] = self._parseAddress(result["args"][1])
+
+    def connectSocket(self, result):
+        key = self._getKey(result, result["args"][0])
+        socket = self._sockets.get(key)
+        if socket is None:          # a socket opened before the trace
+            socket = self._sockets[key] = [None, None]
+        address = self._parseAddress(result["args"][1]) if len(result["args"]) > 1 else None
+        socket[0] = ("out", address or "unknown")
+
+        stat = self._getPeerStat(socket[0])
+        # a non-blocking connect goes on after EINPROGRESS
+        if result["return"] == "0" or result["errno"] == "EINPROGRESS":
+            stat[StatNetIO.CONNECTIONS] += 1
+        else:
+            stat[StatNetIO.CONNECT_FAILS] += 1
+        usecs = self._getUsecs(result)
+        if usecs is not None:
+            stat[StatNetIO.CONNECT_USECS] += usecs
+
+    def acceptSocket(self, result):
+        if not result["return"].isdigit():
+            if result["errno"] in StatNetIO.EAGAIN_ERRNO:
+                listenSocket = self._sockets.get(self._getKey(result, result["args"][0]))
+                if listenSocket is not None and listenSocket[1]:
+                    self._getPeerStat(("in", listenSocket[1]))[StatNetIO.ACCEPT_EAGAIN_COUNT] += 1
+            return
+        # the port of a client is different in each connection, the clients
+        # are counted by their address only
+        address = self._parseAddress(result["args"][1]) if len(result["args"]) > 1 else None
+        if address and not address.startswith("unix:") and ":" in address:
+            address = address.rpartition(":")[0]
+        if not address or address.startswith("unix:"):
+            listenSocket = self._sockets.get(self._getKey(result, result["args"][0]))
+            address = listenSocket[1] if listenSocket is not None and listenSocket[1] else "unknown"
+        peer = ("in", address)
+        self._sockets[self._getKey(result, result["return"])] = [peer, None]
+        self._getPeerStat(peer)[StatNetIO.CONNECTIONS] += 1
+
+    def closeSocket(self, result):
+        self._sockets.pop(self._getKey(result, result["args"][0]), None)
+
+    def transferSocket(self, result):
+        syscall = result["syscall"]
+        if not result["args"]:
+            return
+        key = self._getKey(result, result["args"][0])
+        socket = self._sockets.get(key)
+        if socket is None:
+            if syscall not in StatNetIO.SOCKET_ONLY_SYSCALLS:
+                return              # a file or a pipe
+            socket = self._sockets[key] = [None, None]
+
+        peer = socket[0]
+        if peer is None:
+            # an unconnected datagram socket: the peer of each message
+            address = None
+            if syscall in ["sendto", "recvfrom"] and len(result["args"]) > StatNetIO.ADDRESS_ARG:
+                address = self._parseAddress(result["args"][StatNetIO.ADDRESS_ARG])
+            direction = "out" if syscall in StatNetIO.SEND_SYSCALLS else "in"
+            peer = (direction, address or "unconnected")
+
+        stat = self._getPeerStat(peer)
+        stat[StatNetIO.CALLS] += 1
+        if result["return"].isdigit():
+            if syscall in StatNetIO.SEND_SYSCALLS:
+                stat[StatNetIO.SENT_BYTES] += int(result["return"])
+            else:
+                stat[StatNetIO.RECV_BYTES] += int(result["return"])
+        elif result["errno"] in StatNetIO.EAGAIN_ERRNO:
+            stat[StatNetIO.EAGAIN_COUNT] += 1
+        elif result["errno"]:
+            stat[StatNetIO.ERRORS] += 1
+        usecs = self._getUsecs(result)
+        if usecs is not None:
+            stat[StatNetIO.IO_USECS] += usecs
+            stat[StatNetIO.LATENCY].add(usecs)
+
+    def getState(self):
+        return (self._statProcessTree.getState(), self._sockets, self._peerStat)
+
+    def setState(self, state):
+        processTreeState, self._sockets, self._peerStat = state
+        self._statProcessTree.setState(processTreeState)
+
+    def getMergeableStat(self):
+        return self._peerStat
+
+    def mergeStat(self, peerStat):
+        for peer, stat in peerStat.iteritems():
+            total = self._getPeerStat(peer)
+            for index in range(StatNetIO.LATENCY):
+                total[index] += stat[index]
+            total[StatNetIO.LATENCY].merge(stat[StatNetIO.LATENCY])
+
+    def printOutput(self):
+        out = self._openOutput(self._pluginOptionDict)
+
+        peerList = sorted(self._peerStat.iteritems(),
+                          key=lambda (peer, stat): (-(stat[StatNetIO.SENT_BYTES] + stat[StatNetIO.RECV_BYTES]),
+                                                    -stat[StatNetIO.CALLS], peer))
+        top = int(self._pluginOptionDict.get("top", "0"))
+        if top:
+            peerList = peerList[:top]
+
+        haveTimeSpent = self._straceOptions["haveTimeSpent"]
+        out.beginTable("Network IO per peer",
+                       ["direction", "peer", "connections", "failed connects", "connect seconds", "calls",
+                        "sent bytes", "received bytes", "EAGAIN %", "errors", "io seconds", "p50 usecs",
+                        "p99 usecs", "accept EAGAIN"],
+                       ["%s", "%s", "%d", "%d", "%.6f", "%d", "%d", "%d", "%.1f", "%d", "%.6f", "%s", "%s", "%d"])
+        for (direction, address), stat in peerList:
+            calls = stat[StatNetIO.CALLS]
+            latency = stat[StatNetIO.LATENCY]
+            out.writeRow([direction, address, stat[StatNetIO.CONNECTIONS], stat[StatNetIO.CONNECT_FAILS],
+                          stat[StatNetIO.CONNECT_USECS] / 1000000.0 if haveTimeSpent else None,
+                          calls, stat[StatNetIO.SENT_BYTES], stat[StatNetIO.RECV_BYTES],
+                          100.0 * stat[StatNetIO.EAGAIN_COUNT] / calls if calls else 0.0,
+                          stat[StatNetIO.ERRORS],
+                          stat[StatNetIO.IO_USECS] / 1000000.0 if haveTimeSpent else None,
+                          latency.percentile(50), latency.percentile(99), stat[StatNetIO.ACCEPT_EAGAIN_COUNT]])
+        out.close()
@@ -14,21 +14,56 @@
 # Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
 
 
+import heapq
 import logging
 from collections import defaultdict
+from datetime import datetime
 from StatBase import StatBase
+from straceParserLib.StatUtils import timedeltaToMicroseconds
 
 
 class StatProcessTree(StatBase):
     """ Print the process fork tree in the strace file """
 
+    READ_SYSCALLS = set(["read", "readv", "pread64", "preadv", "recv", "recvfrom", "recvmsg"])
+    WRITE_SYSCALLS = set(["write", "writev", "pwrite64", "pwritev", "send", "sendto", "sendmsg",
+                          "sendfile", "sendfile64"])
+    EPOCH = datetime(1970, 1, 1)
+
+    # Index of the stat of a pid and of a subtree (the first time and the
+    # last time are in microseconds, None if unknown)
+    PROCESSES, SYSCALLS, USECS, READ_BYTES, WRITE_BYTES, FIRST_TIME, LAST_TIME = range(7)
+
     def __init__(self):
         self._allPid = set()
         self._childDict = defaultdict(list)
         self._childExecName = {}
+        # _tgid[pid] = thread group id (the process id) of a thread, only
+        # for the threads created by clone(CLONE_THREAD)
+        self._tgid = {}
+        self._parentPid = {}
+        self._pluginOptionDict = {}
+        self._straceOptions = {}
+        # _pidStat[pid] = the stat of the syscalls of pid, only collected
+        # when this is the plugin, not when other plugins use it for the tree
+        self._pidStat = {}
+        self._statSubtrees = False
         return
 
+    def optionHelp(self):
+        return {"output":"Write the output to this file instead of stdout",
+                "format":"Output format: text (default), csv, json or ndjson",
+                "top":"Number of the heaviest process subtrees to print (default: 10)"}
+
+    def setOption(self, pluginOptionDict):
+        self._pluginOptionDict = pluginOptionDict
+        if not self._pluginOptionDict.get("top", "10").isdigit():
+            return False
+        self._statSubtrees = True
+        return self._checkOutputOption(pluginOptionDict)
+
     def isOperational(self, straceOptions):
+        self._straceOptions = straceOptions
         if not straceOptions["havePid"]:
             return False
         return True
@@ -46,42 +81,153 @@ class StatProcessTree(StatBase):
         if result["syscall"] == "clone":
             childPid = result["return"]
             self._childDict[pid].append(childPid)
+            self._parentPid[childPid] = pid
             # Copy the execuation name of parent process to child process.
             # It will be overwritten by next execve call of child 
             if pid in self._childExecName:
                 self._childExecName[childPid] = self._childExecName[pid]
+            if any(["CLONE_THREAD" in arg for arg in result["args"] if isinstance(arg, basestring)]):
+                self._tgid[childPid] = self.getProcessTgid(pid)
 
         if result["syscall"] == "execve":
             self._childExecName[pid] = result["args"][0]
 
+        if self._statSubtrees:
+            self._recordStat(pid, result)
+
+    def _recordStat(self, pid, result):
+        stat = self._pidStat.get(pid)
+        if stat is None:
+            stat = self._pidStat[pid] = [1, 0, 0, 0, 0, None, None]
+        stat[StatProcessTree.SYSCALLS] += 1
+        usecs = 0
+        if result.get("timeSpent"):
+            usecs = timedeltaToMicroseconds(result["timeSpent"])
+            stat[StatProcessTree.USECS] += usecs
+        if result["return"].isdigit():
+            if result["syscall"] in StatProcessTree.READ_SYSCALLS:
+                stat[StatProcessTree.READ_BYTES] += int(result["return"])
+            elif result["syscall"] in StatProcessTree.WRITE_SYSCALLS:
+                stat[StatProcessTree.WRITE_BYTES] += int(result["return"])
+        if "startTime" in result:
+            startTime = timedeltaToMicroseconds(result["startTime"] - StatProcessTree.EPOCH)
+            if stat[StatProcessTree.FIRST_TIME] is None:
+                stat[StatProcessTree.FIRST_TIME] = startTime
+            stat[StatProcessTree.LAST_TIME] = max(stat[StatProcessTree.LAST_TIME], startTime + usecs)
+
+    def getState(self):
+        return (self._allPid, dict(self._childDict), self._childExecName, self._tgid, self._parentPid,
+                self._pidStat)
+
+    def setState(self, state):
+        allPid, childDict, self._childExecName, self._tgid, self._parentPid, self._pidStat = state
+        self._allPid = set(allPid)
+        self._childDict = defaultdict(list, childDict)
+
+    def getAllPid(self):
+        return self._allPid
+
     def getProcessChildern(self, pid):
         return self._childDict[pid]
 
-    def getProcessExecName(self, pid):
-        return self._childExecName[pid]
-
-    def printOutput(self):
-        # headPid = remove child pid in _allPid, so it contains only head pid 
-        headPid = self._allPid
-        for childPidList in self._childDict.values():
-            for childPid in childPidList:
-                headPid.remove(childPid)
-
-        print "====== Process Tree ======"
-        for pid in headPid:
-            self._printTree(pid, 0)
-        print ""
-
+    def getProcessParent(self, pid):
+        """ Return the pid which created pid, or None if it is a head pid """
+        return self._parentPid.get(pid)
 
-    def _printTree(self, pid, indent):
-        for i in xrange(0, indent):
-            print "   ",
+    def getProcessChain(self, pid):
+        """ Return the list of pids from the head pid down to pid """
+        chain = [pid]
+        while chain[-1] in self._parentPid and len(chain) <= len(self._parentPid):
+            chain.append(self._parentPid[chain[-1]])
+        chain.reverse()
+        return chain
 
-        if pid in self._childExecName:
-            print "%s [%s]" % (pid, self._childExecName[pid])
-        else:
-            print "%s [unknown]" % pid
+    def getProcessExecName(self, pid):
+        """ Return the execuation name of pid, or None if it is unknown """
+        return self._childExecName.get(pid)
+
+    def getProcessTgid(self, pid):
+        """ Return the thread group id of pid, i.e. the pid of the process
+            which the thread pid belongs to (pid itself if it is not a thread)
+        """
+        return self._tgid.get(pid, pid)
+
+    def _addSubtreeStat(self, total, stat):
+        for index in range(StatProcessTree.FIRST_TIME):
+            total[index] += stat[index]
+        if stat[StatProcessTree.FIRST_TIME] is not None:
+            if total[StatProcessTree.FIRST_TIME] is None:
+                total[StatProcessTree.FIRST_TIME] = stat[StatProcessTree.FIRST_TIME]
+            total[StatProcessTree.FIRST_TIME] = min(total[StatProcessTree.FIRST_TIME],
+                                                    stat[StatProcessTree.FIRST_TIME])
+            total[StatProcessTree.LAST_TIME] = max(total[StatProcessTree.LAST_TIME],
+                                                   stat[StatProcessTree.LAST_TIME])
+
+    def _walkTree(self):
+        """ Return the list of (pid, parent pid, depth) of the tree in depth
+            first order, from the head pids (the pids not created by another
+            pid in the strace file). It is walked with a stack, not by
+            recursion, so deep fork chains are fine. A pid reused as a child
+            of its own subtree is only walked once.
+        """
+        headPidList = sorted(self._allPid.difference(self._parentPid), key=lambda pid: (len(pid), pid))
+        order = []
+        visited = set()
+        stack = [(pid, None, 0) for pid in reversed(headPidList)]
+        while stack:
+            pid, parentPid, depth = stack.pop()
+            if pid in visited:
+                continue
+            visited.add(pid)
+            order.append((pid, parentPid, depth))
+            for childPid in reversed(self._childDict.get(pid, [])):
+                stack.append((childPid, pid, depth + 1))
+        return order
 
-        for childPid in self._childDict[pid]:
-            self._printTree(childPid, indent+1)
-        return
+    def printOutput(self):
+        out = self._openOutput(self._pluginOptionDict)
+        order = self._walkTree()
+
+        out.beginTable("Process Tree", ["pid", "parent", "depth", "exec name"],
+                       header="====== Process Tree ======\n")
+        for pid, parentPid, depth in order:
+            execName = self._childExecName.get(pid)
+            out.writeRow([pid, parentPid, depth, execName],
+                         "    " * depth + "%s [%s]" % (pid, execName if execName is not None else "unknown"))
+        out.write("\n")
+
+        top = int(self._pluginOptionDict.get("top", "10"))
+        if self._statSubtrees and top > 0:
+            self._printHeaviestSubtrees(out, order, top)
+        out.close()
+
+    def _printHeaviestSubtrees(self, out, order, top):
+        # the children come after their parent in the order, so the
+        # subtrees are summed up from the end
+        subtreeStat = {}
+        for pid, parentPid, depth in reversed(order):
+            total = subtreeStat.setdefault(pid, [0, 0, 0, 0, 0, None, None])
+            self._addSubtreeStat(total, self._pidStat.get(pid, [1, 0, 0, 0, 0, None, None]))
+            if parentPid is not None:
+                self._addSubtreeStat(subtreeStat.setdefault(parentPid, [0, 0, 0, 0, 0, None, None]), total)
+
+        # the most syscall time (or syscalls without -T) first
+        weightIndex = StatProcessTree.USECS if self._straceOptions["haveTimeSpent"] else StatProcessTree.SYSCALLS
+        heaviest = heapq.nsmallest(top, order, key=lambda (pid, parentPid, depth):
+                                   (-subtreeStat[pid][weightIndex], depth, pid))
+
+        haveTimeSpent = self._straceOptions["haveTimeSpent"]
+        columns = ["pid", "exec name", "depth", "processes", "syscalls", "syscall seconds", "read bytes",
+                   "written bytes", "lifetime seconds"]
+        out.beginTable("Heaviest process subtrees", columns,
+                       ["%s", "%s", "%d", "%d", "%d", "%.6f", "%d", "%d", "%.6f"],
+                       "====== The %d heaviest process subtrees (csv) ======\n%s\n" % (top, ", ".join(columns)))
+        for pid, parentPid, depth in heaviest:
+            stat = subtreeStat[pid]
+            lifetime = None
+            if stat[StatProcessTree.FIRST_TIME] is not None:
+                lifetime = (stat[StatProcessTree.LAST_TIME] - stat[StatProcessTree.FIRST_TIME]) / 1000000.0
+            out.writeRow([pid, self._childExecName.get(pid, "unknown"), depth,
+                          stat[StatProcessTree.PROCESSES], stat[StatProcessTree.SYSCALLS],
+                          stat[StatProcessTree.USECS] / 1000000.0 if haveTimeSpent else None,
+                          stat[StatProcessTree.READ_BYTES], stat[StatProcessTree.WRITE_BYTES], lifetime])
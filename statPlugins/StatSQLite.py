@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+import sqlite3
+from datetime import datetime
+
+from StatBase import StatBase
+from StatProcessTree import StatProcessTree
+from StatFileIO import StatFileIO
+from straceParserLib.StatUtils import timedeltaToMicroseconds
+
+
+class StatSQLite(StatBase):
+    """ Export the syscalls to a SQLite database for SQL queries """
+
+    EPOCH = datetime(1970, 1, 1)
+    # number of the first arguments stored in the arg0, arg1, ... columns
+    ARG_COUNT = 3
+
+    def __init__(self):
+        self._statProcessTree = StatProcessTree()
+        self._statFileIO = StatFileIO()
+        self._pluginOptionDict = {}
+        self._straceOptions = {}
+        self._batchSize = 50000
+        self._db = None
+        self._rows = []
+        self._rowCount = 0
+
+    def optionHelp(self):
+        return {"output":"Write the database to this file (default: strace.db, in batch or diff mode next to the output of each strace file)",
+                "format":"Output format of the report: text (default), csv, json or ndjson",
+                "batch":"Number of syscalls inserted in one transaction (default: 50000)"}
+
+    def setOption(self, pluginOptionDict):
+        self._pluginOptionDict = pluginOptionDict
+        batch = self._pluginOptionDict.get("batch", "50000")
+        if not batch.isdigit() or int(batch) == 0:
+            return False
+        self._batchSize = int(batch)
+        return self._checkOutputOption(self._pluginOptionDict)
+
+    def isOperational(self, straceOptions):
+        self._straceOptions = straceOptions
+        self._statFileIO.isOperational(straceOptions)
+        return True
+
+    def getSyscallHooks(self):
+        # the path of a fd is taken before StatFileIO sees the syscall, so it
+        # is still known for close
+        fileIOHooks = self._statFileIO.getSyscallHooks()
+        ownHooks = dict((syscall, self.record) for syscall in StatFileIO.SYSCALLS)
+        ownHooks["ALL"] = self.recordOther
+        processTreeHooks = None
+        if self._straceOptions["havePid"]:
+            processTreeHooks = self._statProcessTree.getSyscallHooks()
+        return self._combineHooks(ownHooks, fileIOHooks, processTreeHooks)
+
+    def _openDatabase(self):
+        self._db = sqlite3.connect(self._pluginOptionDict.get("output", "strace.db"))
+        # the database is written from scratch, no need to be crash safe
+        self._db.execute("PRAGMA journal_mode = OFF")
+        self._db.execute("PRAGMA synchronous = OFF")
+        self._db.execute("DROP TABLE IF EXISTS syscalls")
+        self._db.execute("DROP TABLE IF EXISTS processes")
+        self._db.execute("CREATE TABLE syscalls (pid INTEGER, time INTEGER, duration INTEGER, "
+                         "syscall TEXT, ret INTEGER, errno TEXT, %s, fd INTEGER, path TEXT)" %
+                         ", ".join(["arg%d TEXT" % i for i in range(StatSQLite.ARG_COUNT)]))
+        self._db.execute("CREATE TABLE processes (pid INTEGER PRIMARY KEY, tgid INTEGER, "
+                         "parent INTEGER, exec TEXT)")
+
+    def _flush(self):
+        """ Insert the buffered rows in one transaction """
+        if self._db is None:
+            self._openDatabase()
+        with self._db:
+            self._db.executemany("INSERT INTO syscalls VALUES (%s)" %
+                                 ", ".join(["?"] * (8 + StatSQLite.ARG_COUNT)), self._rows)
+        self._rowCount += len(self._rows)
+        self._rows = []
+
+    def _argToText(self, arg):
+        if isinstance(arg, list):
+            return "{%s}" % ", ".join([self._argToText(a) for a in arg])
+        return arg
+
+    def _toInt(self, value):
+        """ Convert a return value or fd to an integer for SQLite, None if it
+            is not a number (e.g. "?")
+        """
+        try:
+            value = int(value, 0)
+        except (ValueError, TypeError):
+            return None
+        if value >= 2 ** 63:            # e.g. an address, keep it in 64 bits
+            value -= 2 ** 64
+        return value
+
+    def recordOther(self, result):
+        if result["syscall"] not in StatFileIO.SYSCALLS:
+            self.record(result)
+
+    def record(self, result):
+        fid, path = self._statFileIO.getSyscallFile(result)
+        if path and path.startswith("unknown:"):    # a fd opened before the trace
+            path = None
+        args = [self._argToText(arg) for arg in result["args"][:StatSQLite.ARG_COUNT]]
+        args += [None] * (StatSQLite.ARG_COUNT - len(args))
+        startTime = result.get("startTime")
+        timeSpent = result.get("timeSpent")
+        self._rows.append(
+            [int(result["pid"]) if "pid" in result else None,
+             timedeltaToMicroseconds(startTime - StatSQLite.EPOCH) if startTime else None,
+             timedeltaToMicroseconds(timeSpent) if timeSpent else None,
+             result["syscall"], self._toInt(result["return"]), result["errno"]] +
+            args + [self._toInt(fid), path])
+        if len(self._rows) >= self._batchSize:
+            self._flush()
+
+    def printOutput(self):
+        self._flush()
+        if self._straceOptions["havePid"]:
+            processTree = self._statProcessTree
+            with self._db:
+                self._db.executemany("INSERT INTO processes VALUES (?, ?, ?, ?)",
+                                     [(int(pid), int(processTree.getProcessTgid(pid)),
+                                       self._toInt(processTree.getProcessParent(pid)),
+                                       processTree.getProcessExecName(pid))
+                                      for pid in processTree.getAllPid()])
+
+        # indexes are much faster to build once after loading
+        with self._db:
+            self._db.execute("CREATE INDEX syscalls_pid_time ON syscalls (pid, time)")
+            self._db.execute("CREATE INDEX syscalls_syscall ON syscalls (syscall)")
+        self._db.close()
+
+        # the output option is the database, the report goes to stdout
+        out = self._openOutput({"format": self._pluginOptionDict.get("format", "text")})
+        filename = self._pluginOptionDict.get("output", "strace.db")
+        out.beginTable("SQLite export", ["syscalls", "database"], header="====== SQLite export ======\n")
+        out.writeRow([self._rowCount, filename], "%d syscalls written to %s" % (self._rowCount, filename))
+        out.close()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+import heapq
+from collections import deque
+
+from StatBase import StatBase
+from straceParserLib.StatUtils import timedeltaToMicroseconds
+
+
+class StatSlowest(StatBase):
+    """ The slowest syscalls, overall and of each syscall, with the lines before them """
+
+    EXIT_SYSCALLS = set(["exit", "exit_group"])
+
+    def __init__(self):
+        self._pluginOptionDict = {}
+        self._straceOptions = {}
+        self._top = 10
+        self._perSyscall = 3
+        self._context = 5
+        # min-heaps of (usecs, sequence number, pid, result, context results),
+        # the fastest of the kept calls on top
+        self._slowest = []
+        self._slowestBySyscall = {}
+        self._sequence = 0
+        # _recent[pid] = the last completed syscalls of pid
+        self._recent = {}
+        # _unfinished[pid] = the result of the <unfinished ...> line
+        self._unfinished = {}
+
+    def optionHelp(self):
+        return {"output":"Write the output to this file instead of stdout",
+                "format":"Output format: text (default), csv, json or ndjson",
+                "top":"Number of the slowest syscalls to print (default: 10)",
+                "per":"Number of the slowest calls to print of each syscall (default: 3, 0 to disable)",
+                "context":"Number of lines of the same pid printed before a slow syscall (default: 5)"}
+
+    def setOption(self, pluginOptionDict):
+        self._pluginOptionDict = pluginOptionDict
+        for option, attr in [("top", "_top"), ("per", "_perSyscall"), ("context", "_context")]:
+            value = self._pluginOptionDict.get(option, str(getattr(self, attr)))
+            if not value.isdigit():
+                return False
+            setattr(self, attr, int(value))
+        return self._top > 0 and self._checkOutputOption(self._pluginOptionDict)
+
+    def isOperational(self, straceOptions):
+        self._straceOptions = straceOptions
+        # the time of a syscall is from -T, or from the time of the
+        # <unfinished ...> and resumed lines
+        if not straceOptions["haveTimeSpent"] and not straceOptions["haveTime"]:
+            return False
+        return True
+
+    def getRawSyscallHooks(self):
+        return {"ALL": self.funcHandleALLSyscall}
+
+    def _getPid(self, result):
+        if self._straceOptions["havePid"]:
+            return result["pid"]
+        return "0"
+
+    def _pushSlow(self, heap, size, entry):
+        """ Keep the size slowest entries in heap """
+        if len(heap) < size:
+            heapq.heappush(heap, entry)
+        elif entry[0] > heap[0][0]:
+            heapq.heapreplace(heap, entry)
+
+    def _recordCall(self, pid, result, usecs):
+        syscall = result["syscall"]
+        bySyscall = self._slowestBySyscall.get(syscall)
+        isSlow = len(self._slowest) < self._top or usecs > self._slowest[0][0]
+        isSlowOfSyscall = self._perSyscall > 0 and \
+            (bySyscall is None or len(bySyscall) < self._perSyscall or usecs > bySyscall[0][0])
+        if not isSlow and not isSlowOfSyscall:
+            return          # the common case: no copy of the context
+
+        self._sequence += 1
+        entry = (usecs, self._sequence, pid, result, list(self._recent.get(pid, [])))
+        if isSlow:
+            self._pushSlow(self._slowest, self._top, entry)
+        if isSlowOfSyscall:
+            self._pushSlow(self._slowestBySyscall.setdefault(syscall, []), self._perSyscall, entry)
+
+    def funcHandleALLSyscall(self, result):
+        pid = self._getPid(result)
+        syscallType = result["type"]
+        if syscallType == "unfinished":
+            self._unfinished[pid] = result
+            return
+
+        timeSpent = result.get("timeSpent")
+        if syscallType == "resumed":
+            unfinished = self._unfinished.pop(pid, None)
+            if unfinished is None:
+                return          # no <unfinished> line before, ignore
+            if timeSpent:
+                usecs = timedeltaToMicroseconds(timeSpent)
+            elif "startTime" in result:
+                usecs = timedeltaToMicroseconds(result["startTime"] - unfinished["startTime"])
+            else:
+                usecs = None
+            result = dict(unfinished, args=unfinished["args"] + result["args"],
+                          **{"return": result["return"], "errno": result["errno"], "type": "resumed"})
+        else:
+            usecs = timedeltaToMicroseconds(timeSpent) if timeSpent else None
+
+        if usecs is not None:
+            self._recordCall(pid, result, usecs)
+
+        if result["syscall"] in StatSlowest.EXIT_SYSCALLS:
+            self._recent.pop(pid, None)
+        elif self._context > 0:
+            recent = self._recent.get(pid)
+            if recent is None:
+                recent = self._recent[pid] = deque(maxlen=self._context)
+            recent.append(result)
+
+    def getState(self):
+        return (self._slowest, self._slowestBySyscall, self._sequence, self._recent, self._unfinished)
+
+    def setState(self, state):
+        self._slowest, self._slowestBySyscall, self._sequence, self._recent, self._unfinished = state
+
+    def _argToText(self, arg):
+        if isinstance(arg, list):
+            return "{%s}" % ", ".join([self._argToText(a) for a in arg])
+        return arg
+
+    def _reconstructStraceLine(self, result):
+        if self._straceOptions["haveTime"]:
+            syscallLine = result["startTime"].strftime("%H:%M:%S.%f") + " "
+        else:
+            syscallLine = ""
+        syscallLine += u"%s(%s)" % (result["syscall"], ", ".join([self._argToText(a) for a in result["args"]]))
+        returnValue = result["return"]
+        if result.get("errno"):
+            returnValue += " " + result["errno"]
+        return u"{0:<39} = {1}".format(syscallLine, returnValue)
+
+    def _writeEntry(self, out, title, entry):
+        usecs, sequence, pid, result, context = entry
+        contextLines = [self._reconstructStraceLine(contextResult) for contextResult in context]
+        line = self._reconstructStraceLine(result)
+        out.writeRow([pid, result["syscall"], usecs / 1000000.0, line, contextLines],
+                     u"\n".join([title] + [u"               %s" % contextLine for contextLine in contextLines] +
+                                 [u"%12.6f s %s" % (usecs / 1000000.0, line)]))
+
+    def printOutput(self):
+        out = self._openOutput(self._pluginOptionDict)
+        columns = ["pid", "syscall", "seconds", "line", "lines before"]
+
+        out.beginTable("Slowest syscalls", columns, header="====== The %d slowest syscalls ======\n" % self._top)
+        for entry in sorted(self._slowest, reverse=True):
+            self._writeEntry(out, "--- pid %s" % entry[2], entry)
+
+        if self._perSyscall > 0:
+            out.write("\n")
+            out.beginTable("Slowest calls of each syscall", columns,
+                           header="====== The %d slowest calls of each syscall ======\n" % self._perSyscall)
+            # the syscall with the slowest call first
+            for syscall, heap in sorted(self._slowestBySyscall.iteritems(),
+                                        key=lambda item: (-max(item[1])[0], item[0])):
+                for entry in sorted(heap, reverse=True):
+                    self._writeEntry(out, "--- %s, pid %s" % (syscall, entry[2]), entry)
+        out.close()
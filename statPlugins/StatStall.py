@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+import heapq
+from datetime import datetime, timedelta
+
+from StatBase import StatBase
+from StatFileIO import StatFileIO
+from StatProcessTree import StatProcessTree
+from straceParserLib.StatUtils import timedeltaToMicroseconds
+
+
+class StatStall(StatBase):
+    """ Alert on syscalls unfinished for longer than a threshold (stalls and hangs) """
+
+    EPOCH = datetime(1970, 1, 1)
+    EXIT_SYSCALLS = set(["exit", "exit_group"])
+    # syscalls blocked on the fd of their first argument
+    FD_SYSCALLS = set(["read", "readv", "pread64", "preadv", "recv", "recvfrom", "recvmsg", "recvmmsg",
+                       "write", "writev", "pwrite64", "pwritev", "send", "sendto", "sendmsg", "sendmmsg",
+                       "sendfile", "sendfile64", "accept", "accept4", "connect", "epoll_wait", "epoll_pwait",
+                       "fsync", "fdatasync", "flock", "fcntl", "ioctl", "lockf"])
+    # syscalls blocked on the child pid of their first argument
+    PID_SYSCALLS = set(["wait4", "waitpid"])
+
+    # Index of an outstanding syscall of a thread
+    START_TIME, SEQUENCE, SYSCALL, ARGS, BLOCKED_ON, STALL_INDEX = range(6)
+    # Index of a stall
+    STALL_PID, STALL_SYSCALL, STALL_BLOCKED_ON, STALL_START, STALL_END, STALL_ARGS = range(6)
+
+    def __init__(self):
+        self._statProcessTree = StatProcessTree()
+        self._statFileIO = StatFileIO()
+        self._pluginOptionDict = {}
+        self._straceOptions = {}
+        self._output = None
+        self._printAlerts = True
+        self._threshold = 1000000
+        # _outstanding[pid] = the <unfinished ...> syscall of a thread
+        self._outstanding = {}
+        # min-heap of (start time, sequence number, pid) of the outstanding
+        # syscalls. The entry of a syscall which is resumed is left in the
+        # heap and skipped when it comes to the top (its sequence number is
+        # not the one of the thread any more), so each line costs O(log n).
+        self._pending = []
+        self._sequence = 0
+        # the stalls, in the order they are found
+        self._stalls = []
+        # the time of the latest line, and the time of the trace clock (the
+        # same, or later when no line comes in live mode)
+        self._lastLineTime = None
+        self._lastTime = None
+
+    def optionHelp(self):
+        return {"output":"Write the output to this file instead of stdout",
+                "format":"Output format: text (default), csv, json or ndjson",
+                "threshold":"Alert when a syscall is unfinished for longer than this many milliseconds (default: 1000)",
+                "alerts":"Print every alert when it happens (1, default) or the summary only (0)"}
+
+    def setOption(self, pluginOptionDict):
+        self._pluginOptionDict = pluginOptionDict
+        threshold = self._pluginOptionDict.get("threshold", "1000")
+        if not threshold.isdigit():
+            return False
+        self._threshold = int(threshold) * 1000
+        alerts = self._pluginOptionDict.get("alerts", "1")
+        if alerts not in ["0", "1"]:
+            return False
+        self._printAlerts = alerts == "1"
+        return self._checkOutputOption(self._pluginOptionDict)
+
+    def isOperational(self, straceOptions):
+        self._straceOptions = straceOptions
+        self._statFileIO.isOperational(straceOptions)
+        if not straceOptions["haveTime"]:
+            return False
+        return True
+
+    def getSyscallHooks(self):
+        fileIOHooks = self._statFileIO.getSyscallHooks()
+        if self._straceOptions["havePid"]:
+            return self._combineHooks(self._statProcessTree.getSyscallHooks(), fileIOHooks)
+        return fileIOHooks
+
+    def getRawSyscallHooks(self):
+        # the <unfinished ...> and resumed lines are only seen by the raw hooks
+        return {"ALL": self.funcHandleALLSyscall}
+
+    def _getPid(self, result):
+        if self._straceOptions["havePid"]:
+            return result["pid"]
+        return "0"
+
+    def _getOutput(self):
+        if self._output is None:
+            self._output = self._openOutput(self._pluginOptionDict)
+            if self._printAlerts:
+                self._output.beginTable("Stall alerts",
+                                        ["time", "pid", "syscall", "blocked on", "unfinished seconds", "args"],
+                                        header="")
+        return self._output
+
+    def _formatTime(self, usecs):
+        """ A time in microseconds, in the time format of the strace file """
+        if self._straceOptions["haveTime"] == "ttt":
+            return "%.6f" % (usecs / 1000000.0)
+        return (StatStall.EPOCH + timedelta(microseconds=usecs)).strftime("%H:%M:%S.%f")
+
+    def _argToText(self, arg):
+        if isinstance(arg, list):
+            return "{%s}" % ", ".join([self._argToText(a) for a in arg])
+        return arg
+
+    def _formatArgs(self, args):
+        return u", ".join([self._argToText(a) for a in args])
+
+    def _getBlockedOn(self, pid, syscall, args):
+        """ The futex, fd or child pid syscall is blocked on, or None """
+        if not args:
+            return None
+        if syscall == "futex":
+            return "futex " + args[0]
+        if syscall in StatStall.FD_SYSCALLS:
+            filename = self._statFileIO.getFileName(pid, args[0])
+            return "fd %s (%s)" % (args[0], filename) if filename else "fd " + args[0]
+        if syscall in StatStall.PID_SYSCALLS:
+            return "pid " + args[0]
+        return None
+
+    def _exitThreadGroup(self, pid):
+        """ Forget the outstanding syscalls of the threads killed by the
+            exit_group of pid. (An exit_group is rare, so it may look at all
+            the outstanding syscalls.)
+        """
+        if not self._straceOptions["havePid"]:
+            self._outstanding.clear()
+            return
+        tgid = self._statProcessTree.getProcessTgid(pid)
+        for threadPid in [p for p in self._outstanding
+                          if self._statProcessTree.getProcessTgid(p) == tgid]:
+            del self._outstanding[threadPid]
+
+    def _alert(self, pid, call, now):
+        self._stalls.append([pid, call[StatStall.SYSCALL], call[StatStall.BLOCKED_ON],
+                             call[StatStall.START_TIME], None, call[StatStall.ARGS]])
+        call[StatStall.STALL_INDEX] = len(self._stalls) - 1
+        if not self._printAlerts:
+            return
+        timeStr = self._formatTime(now)
+        unfinished = (now - call[StatStall.START_TIME]) / 1000000.0
+        args = self._formatArgs(call[StatStall.ARGS])
+        blockedOn = call[StatStall.BLOCKED_ON]
+        out = self._getOutput()
+        out.writeRow([timeStr, pid, call[StatStall.SYSCALL], blockedOn, unfinished, args],
+                     "%s STALL pid %s: %s unfinished for %.6f seconds%s: %s(%s <unfinished ...>" %
+                     (timeStr, pid, call[StatStall.SYSCALL], unfinished,
+                      " blocked on " + blockedOn if blockedOn else "", call[StatStall.SYSCALL], args))
+        # an alert is no use at the end of the output
+        out.flush()
+
+    def _checkStalls(self, now):
+        pending = self._pending
+        while pending and now - pending[0][0] > self._threshold:
+            startTime, sequence, pid = heapq.heappop(pending)
+            call = self._outstanding.get(pid)
+            if call is not None and call[StatStall.SEQUENCE] == sequence:
+                self._alert(pid, call, now)
+
+    def funcHandleALLSyscall(self, result):
+        if "startTime" not in result:
+            return
+        pid = self._getPid(result)
+        syscall = result["syscall"]
+        now = timedeltaToMicroseconds(result["startTime"] - StatStall.EPOCH)
+        syscallType = result["type"]
+
+        if syscallType == "unfinished":
+            if syscall not in StatStall.EXIT_SYSCALLS:
+                self._sequence += 1
+                self._outstanding[pid] = [now, self._sequence, syscall, result["args"],
+                                          self._getBlockedOn(pid, syscall, result["args"]), None]
+                heapq.heappush(self._pending, (now, self._sequence, pid))
+        else:
+            # any other line of the thread ends its outstanding syscall
+            call = self._outstanding.pop(pid, None)
+            if call is not None and call[StatStall.STALL_INDEX] is not None:
+                timeSpent = result.get("timeSpent") if syscallType == "resumed" else None
+                endTime = call[StatStall.START_TIME] + timedeltaToMicroseconds(timeSpent) if timeSpent else now
+                self._stalls[call[StatStall.STALL_INDEX]][StatStall.STALL_END] = endTime
+            if syscall == "exit_group":
+                self._exitThreadGroup(pid)
+
+        self._lastLineTime = max(self._lastLineTime, now)
+        self._lastTime = max(self._lastTime, now)
+        self._checkStalls(self._lastTime)
+
+    def liveIdle(self, idleSeconds):
+        # a hung process may write no line at all: the trace clock goes on
+        # from the last line by the time no line came in (the lines of a
+        # live trace come when they happen)
+        if self._lastLineTime is None:
+            return
+        self._lastTime = max(self._lastTime, self._lastLineTime + int(idleSeconds * 1000000))
+        self._checkStalls(self._lastTime)
+
+    def getState(self):
+        return (self._statProcessTree.getState(), self._statFileIO.getState(), self._outstanding,
+                self._pending, self._sequence, self._stalls, self._lastLineTime, self._lastTime)
+
+    def setState(self, state):
+        (processTreeState, fileIOState, self._outstanding, self._pending, self._sequence, self._stalls,
+         self._lastLineTime, self._lastTime) = state
+        self._statProcessTree.setState(processTreeState)
+        self._statFileIO.setState(fileIOState)
+
+    def printOutput(self):
+        out = self._getOutput()
+        if self._printAlerts:
+            out.write("\n")
+
+        columns = ["pid", "syscall", "blocked on", "start time", "unfinished seconds", "resumed", "args"]
+        out.beginTable("Stalled syscalls", columns, ["%s", "%s", "%s", "%s", "%.6f", "%s", "%s"],
+                       "====== Syscalls unfinished for longer than %d ms (csv), the longest first ======\n%s\n" %
+                       (self._threshold / 1000, ", ".join(columns)))
+        stallList = []
+        for pid, syscall, blockedOn, startTime, endTime, args in self._stalls:
+            resumed = endTime is not None
+            if not resumed:
+                endTime = self._lastTime
+            stallList.append((endTime - startTime, pid, syscall, blockedOn, startTime, resumed, args))
+        for usecs, pid, syscall, blockedOn, startTime, resumed, args in sorted(
+                stallList, key=lambda stall: (-stall[0], stall[4], stall[1])):
+            out.writeRow([pid, syscall, blockedOn, self._formatTime(startTime), usecs / 1000000.0,
+                          "yes" if resumed else "no", self._formatArgs(args)])
+        out.close()
@@ -44,8 +44,11 @@ class StatStreams(StatBase):
     def __init__(self):
         #key = OF number
         self._open_streams = {}
-        #store the finished streams
+        #store the finished streams, as the rows of the output
         self._closed_streams = []
+        self._pluginOptionDict = {}
+        #the output is opened at the first stream shown
+        self._output = None
 
         #some defaults
         self.show_text = True       #display streams contents
@@ -60,6 +63,21 @@ class StatStreams(StatBase):
             self._open_streams[num]._metadata['in'] = 0
 
 
+    def optionHelp(self):
+        return {"output":"Write the output to this file instead of stdout",
+                "format":"Output format: text (default), csv, json or ndjson"}
+
+    def setOption(self, pluginOptionDict):
+        self._pluginOptionDict = pluginOptionDict
+        return self._checkOutputOption(pluginOptionDict)
+
+    def _getOutput(self):
+        if self._output is None:
+            self._output = self._openOutput(self._pluginOptionDict)
+            self._output.beginTable("File Streams", ["fd", "stream", "type", "in bytes", "out bytes", "contents"],
+                                    header="")
+        return self._output
+
     def getSyscallHooks(self):
         return_dict = {}
         for syscall in StatStreams.SYSCALLS:
@@ -175,13 +193,16 @@ class StatStreams(StatBase):
             stream = self._open_streams[stream_nr]
             closing_strs = ['closed(%d) - in:%d - out: %d\n' % 
                 (stream_nr, stream._metadata['in'], stream._metadata['out'])]
+            #the report is the text of the row
+            row = ([stream_nr, stream[0], stream._metadata['type'], stream._metadata['in'],
+                    stream._metadata['out'], '\n'.join(stream[1:])], '\n'.join(stream + closing_strs))
 
             if self.show_online:
                 #just show the report and continue
-                print '\n'.join(stream + closing_strs)
+                self._getOutput().writeRow(*row)
             else:
                 #store the report for later
-                self._closed_streams.append('\n'.join(stream + closing_strs))
+                self._closed_streams.append(row)
 
             del self._open_streams[stream_nr]
         else:
@@ -201,16 +222,25 @@ class StatStreams(StatBase):
                  close=self.closeStream)[syscall](syscall, retcode, args)
                 
             
+    def getState(self):
+        return (self._open_streams, self._closed_streams)
+
+    def setState(self, state):
+        self._open_streams, self._closed_streams = state
+
     def printOutput(self):
+        output = self._getOutput()
         #close all open streams
         if self.show_online:
-            print "====== Finalized Streams  ======"
+            output.write("====== Finalized Streams  ======\n")
         for stream in self._open_streams.keys():
             self.closeStream(None, None, [stream])
 
 
         if not self.show_online:
-            print "====== File Streams ======"
-            print '\n'.join(self._closed_streams)
-
-
+            output.write("====== File Streams ======\n")
+            for row in self._closed_streams:
+                output.writeRow(*row)
+            if not self._closed_streams:
+                output.write("\n")
+        output.close()
@@ -13,9 +13,11 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
 
+import math
 from StatBase import StatBase
 from collections import defaultdict
 from datetime import timedelta
+from straceParserLib.StatUtils import LatencyHistogram, timedeltaToMicroseconds
 
 class StatSummary(StatBase):
     """ Summarize of syscall of strace, like strace -c output"""
@@ -23,9 +25,24 @@ class StatSummary(StatBase):
     def __init__(self):
         self._syscallCount = defaultdict(int)
         self._syscallTime = defaultdict(timedelta)
+        # latency in microseconds, for the percentiles in diff
+        self._syscallLatency = defaultdict(LatencyHistogram)
+        # sum of squared seconds, for the confidence interval in sampling mode
+        self._syscallTimeSquare = defaultdict(float)
+        self._sampling = 1.0
+        self._clustered = False
+        self._pluginOptionDict = {}
         #self._syscallErrorCount = {}
         return
 
+    def optionHelp(self):
+        return {"output":"Write the output to this file instead of stdout",
+                "format":"Output format: text (default), csv, json or ndjson"}
+
+    def setOption(self, pluginOptionDict):
+        self._pluginOptionDict = pluginOptionDict
+        return self._checkOutputOption(pluginOptionDict)
+
     def getSyscallHooks(self):
         return {"ALL": self.record}
 
@@ -38,27 +55,152 @@ class StatSummary(StatBase):
         self._syscallCount[result["syscall"]] += 1
         if result["timeSpent"]:
             self._syscallTime[result["syscall"]] += result["timeSpent"]
-        
+            self._syscallLatency[result["syscall"]].add(timedeltaToMicroseconds(result["timeSpent"]))
+            self._syscallTimeSquare[result["syscall"]] += result["timeSpent"].total_seconds() ** 2
+
+    def setSampling(self, fraction, clustered=False):
+        self._sampling = fraction
+        self._clustered = clustered
+        return True
+
+    def getMergeableStat(self):
+        return (dict(self._syscallCount), dict(self._syscallTime), dict(self._syscallLatency))
+
+    def mergeStat(self, stat):
+        syscallCount, syscallTime, syscallLatency = stat
+        for syscall, count in syscallCount.iteritems():
+            self._syscallCount[syscall] += count
+        for syscall, time in syscallTime.iteritems():
+            self._syscallTime[syscall] += time
+        for syscall, latency in syscallLatency.iteritems():
+            self._syscallLatency[syscall].merge(latency)
+
+    def getState(self):
+        return self.getMergeableStat()
+
+    def setState(self, state):
+        self.mergeStat(state)
 
 
     def printOutput(self):
-        print "% time     seconds  usecs/call     calls syscall"
-        print "------ ----------- ----------- --------- ----------------"
+        out = self._openOutput(self._pluginOptionDict)
+        if self._sampling < 1.0:
+            self._printSampledOutput(out)
+            out.close()
+            return
+
+        out.beginTable("Syscall summary", ["% time", "seconds", "usecs/call", "calls", "syscall"],
+                       ["%6.2f", "%11.6f", "%11d", "%9d", "%s"],
+                       "% time     seconds  usecs/call     calls syscall\n"
+                       "------ ----------- ----------- --------- ----------------\n", " ")
 
         totalCount = sum(self._syscallCount.values())
-        totalTime = reduce(lambda x,y: x+y, self._syscallTime.values())
+        totalTime = reduce(lambda x,y: x+y, self._syscallTime.values(), timedelta())
         for syscall in sorted(self._syscallTime, key=self._syscallTime.get,
                               reverse=True):
             percent = self._syscallTime[syscall].total_seconds() * 100 /  \
-                        totalTime.total_seconds() 
+                        totalTime.total_seconds() if totalTime else 0.0
             usecsPerCall = self._syscallTime[syscall] / \
                             self._syscallCount[syscall]
-            print "%6.2f %11.6f %11d %9d %s" %            \
-                  (percent, self._syscallTime[syscall].total_seconds(), 
-                   usecsPerCall.total_seconds()*(10**6), 
-                   self._syscallCount[syscall], syscall)
-            
-        print "------ ----------- ----------- --------- ----------------"
-        print "%6.2f %11.6f %11d %9d %s" % (100, totalTime.total_seconds(), 
-                totalTime.total_seconds()*(10**6) / totalCount, totalCount, "total")
+            out.writeRow([percent, self._syscallTime[syscall].total_seconds(),
+                          usecsPerCall.total_seconds()*(10**6),
+                          self._syscallCount[syscall], syscall])
+
+        out.write("------ ----------- ----------- --------- ----------------\n")
+        out.writeRow([100, totalTime.total_seconds(),
+                      totalTime.total_seconds()*(10**6) / totalCount if totalCount else 0, totalCount, "total"])
+        out.close()
+
+    def _printSampledOutput(self, out):
+        # Horvitz-Thompson estimates of the whole trace: each syscall is
+        # sampled with probability f, so the totals are scaled by 1/f. The
+        # 95% confidence intervals assume independently sampled syscalls,
+        # which is not true for blocks of contiguous lines (a block has
+        # many syscalls of the same burst), so they are not printed then.
+        f = self._sampling
+        if self._clustered:
+            out.write("APPROXIMATE: estimated from a %.2f%% sample of the file in blocks, "
+                      "no confidence interval\n" % (f * 100))
+        else:
+            out.write("APPROXIMATE: estimated from a %.2f%% sample of the syscalls, "
+                      "+/- is the 95%% confidence interval\n" % (f * 100))
+        if f == 0.0:
+            out.write("(no syscall is sampled)\n")
+            return
+        if self._clustered:
+            out.beginTable("Estimated syscall summary", ["% time", "seconds", "usecs/call", "calls", "syscall"],
+                           ["%6.2f", "%11.6f", "%11d", "%11d", "%s"],
+                           "% time     seconds  usecs/call       calls syscall\n"
+                           "------ ----------- ----------- ----------- ----------------\n", " ")
+        else:
+            out.beginTable("Estimated syscall summary",
+                           ["% time", "seconds", "seconds +/-", "usecs/call", "calls", "calls +/-", "syscall"],
+                           ["%6.2f", "%11.6f", "%11.6f", "%11d", "%11d", "%9d", "%s"],
+                           "% time     seconds         +/-  usecs/call       calls       +/- syscall\n"
+                           "------ ----------- ----------- ----------- ----------- --------- ----------------\n", " ")
+
+        def writeEstimate(percent, seconds, timeSquare, count, syscall):
+            usecsPerCall = seconds * (10**6) / count if count else 0
+            if self._clustered:
+                out.writeRow([percent, seconds / f, usecsPerCall, count / f, syscall])
+            else:
+                out.writeRow([percent, seconds / f, 1.96 * math.sqrt(timeSquare * (1 - f)) / f,
+                              usecsPerCall, count / f, 1.96 * math.sqrt(count * (1 - f)) / f, syscall])
+
+        totalCount = sum(self._syscallCount.values())
+        totalTime = sum([t.total_seconds() for t in self._syscallTime.values()])
+        for syscall in sorted(self._syscallCount, key=lambda s: (self._syscallTime.get(s, timedelta()), s),
+                              reverse=True):
+            seconds = self._syscallTime.get(syscall, timedelta()).total_seconds()
+            writeEstimate(seconds * 100 / totalTime if totalTime else 0.0, seconds,
+                          self._syscallTimeSquare.get(syscall, 0.0), self._syscallCount[syscall], syscall)
+
+        if self._clustered:
+            out.write("------ ----------- ----------- ----------- ----------------\n")
+        else:
+            out.write("------ ----------- ----------- ----------- ----------- --------- ----------------\n")
+        writeEstimate(100, totalTime, sum(self._syscallTimeSquare.values()), totalCount, "total")
+
+    def printDiff(self, baseObj):
+        base, new = baseObj, self
+        out = self._openOutput(self._pluginOptionDict)
+        out.beginTable("Syscall diff",
+                       ["syscall", "calls before", "calls after", "calls delta", "seconds before", "seconds after",
+                        "seconds delta", "p50 usecs before", "p50 usecs after", "p99 usecs before", "p99 usecs after"],
+                       ["%s", "%d", "%d", "%+d", "%.6f", "%.6f", "%+.6f", "%s", "%s", "%s", "%s"],
+                       "====== Syscall diff (csv), the largest time increase first ======\n"
+                       "syscall, calls before, calls after, calls delta, seconds before, seconds after, seconds delta, "
+                       "p50 usecs before, p50 usecs after, p99 usecs before, p99 usecs after\n")
+        # compare by dict.get, so the defaultdicts are not changed. The
+        # syscalls of one trace only are in the table below, and the
+        # syscalls of the same count and time are left out.
+        timeDelta = {}
+        for syscall in set(base._syscallCount) & set(new._syscallCount):
+            delta = new._syscallTime.get(syscall, timedelta()) - base._syscallTime.get(syscall, timedelta())
+            if delta or new._syscallCount[syscall] != base._syscallCount[syscall]:
+                timeDelta[syscall] = delta
+        syscallList = timeDelta.keys()
+        emptyLatency = LatencyHistogram()
+        for syscall in sorted(syscallList, key=lambda s: (-timeDelta[s], s)):
+            baseLatency = base._syscallLatency.get(syscall, emptyLatency)
+            newLatency = new._syscallLatency.get(syscall, emptyLatency)
+            out.writeRow([syscall, base._syscallCount.get(syscall, 0), new._syscallCount.get(syscall, 0),
+                          new._syscallCount.get(syscall, 0) - base._syscallCount.get(syscall, 0),
+                          base._syscallTime.get(syscall, timedelta()).total_seconds(),
+                          new._syscallTime.get(syscall, timedelta()).total_seconds(),
+                          timeDelta[syscall].total_seconds(),
+                          baseLatency.percentile(50), newLatency.percentile(50),
+                          baseLatency.percentile(99), newLatency.percentile(99)])
 
+        out.write("\n")
+        out.beginTable("Syscalls in one trace only", ["syscall", "trace", "calls", "seconds"],
+                       ["%s", "%s", "%d", "%.6f"],
+                       "====== Syscalls in one trace only (csv), the most time first ======\n"
+                       "syscall, trace, calls, seconds\n")
+        onlyList = [(syscall, "after", new) for syscall in new._syscallCount if syscall not in base._syscallCount] + \
+                   [(syscall, "before", base) for syscall in base._syscallCount if syscall not in new._syscallCount]
+        for syscall, trace, obj in sorted(onlyList, key=lambda (s, t, obj): (-obj._syscallTime.get(s, timedelta()), s)):
+            out.writeRow([syscall, trace, obj._syscallCount[syscall],
+                          obj._syscallTime.get(syscall, timedelta()).total_seconds()])
+        out.write("\n")
+        out.close()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+from StatBase import StatBase
+from StatFileIO import StatFileIO
+from straceParserLib.StatUtils import LatencyHistogram, timedeltaToMicroseconds
+
+
+class StatSync(StatBase):
+    """ fsync/fdatasync/sync_file_range count, latency and written bytes per file """
+
+    SYNC_SYSCALLS = set(["fsync", "fdatasync", "sync_file_range", "sync_file_range2", "syncfs"])
+    # syncs of every file, without a fd
+    SYNC_ALL_SYSCALLS = set(["sync"])
+    WRITE_SYSCALLS = set(["write", "writev", "pwrite64", "pwritev", "sendfile", "sendfile64"])
+    ALL_FILES = "(all files)"
+
+    # Index of the stat of a file
+    SYNCS, EMPTY_SYNCS, SYNC_USECS, MAX_SYNC_USECS, SYNC_LATENCY, SYNCED_BYTES, MAX_SYNCED_BYTES = range(7)
+
+    def __init__(self):
+        self._statFileIO = StatFileIO()
+        self._pluginOptionDict = {}
+        self._straceOptions = {}
+        # _unsyncedBytes[filename] = bytes written since the last sync
+        self._unsyncedBytes = {}
+        # _syncStat[filename] = the stat of the syncs of a file
+        self._syncStat = {}
+
+    def optionHelp(self):
+        return {"output":"Write the output to this file instead of stdout",
+                "format":"Output format: text (default), csv, json or ndjson",
+                "top":"Only print the N files with the most sync time (or syncs without -T)"}
+
+    def setOption(self, pluginOptionDict):
+        self._pluginOptionDict = pluginOptionDict
+        if not self._pluginOptionDict.get("top", "0").isdigit():
+            return False
+        return self._checkOutputOption(self._pluginOptionDict)
+
+    def isOperational(self, straceOptions):
+        self._straceOptions = straceOptions
+        self._statFileIO.isOperational(straceOptions)
+        return True
+
+    def getSyscallHooks(self):
+        # the file of a fd is taken before StatFileIO sees the syscall, so
+        # it is still known for close
+        fileIOHooks = self._statFileIO.getSyscallHooks()
+        ownHooks = dict((syscall, self.recordWrite) for syscall in StatSync.WRITE_SYSCALLS)
+        for syscall in StatSync.SYNC_SYSCALLS | StatSync.SYNC_ALL_SYSCALLS:
+            ownHooks[syscall] = self.recordSync
+        return self._combineHooks(ownHooks, fileIOHooks)
+
+    def _getFileName(self, result, fid):
+        filename = self._statFileIO.getFileName(result.get("pid", 0), fid)
+        return filename if filename else "unknown:" + fid
+
+    def recordWrite(self, result):
+        if not result["return"].isdigit() or not result["args"]:
+            return
+        filename = self._getFileName(result, result["args"][0])
+        self._unsyncedBytes[filename] = self._unsyncedBytes.get(filename, 0) + int(result["return"])
+
+    def _getSyncStat(self, filename):
+        stat = self._syncStat.get(filename)
+        if stat is None:
+            stat = self._syncStat[filename] = [0, 0, 0, 0, LatencyHistogram(), 0, 0]
+        return stat
+
+    def recordSync(self, result):
+        if result["return"] != "0":
+            return
+        if result["syscall"] in StatSync.SYNC_ALL_SYSCALLS:
+            filename = StatSync.ALL_FILES
+            syncedBytes = sum(self._unsyncedBytes.itervalues())
+            self._unsyncedBytes = {}
+        elif result["args"]:
+            filename = self._getFileName(result, result["args"][0])
+            syncedBytes = self._unsyncedBytes.pop(filename, 0)
+        else:
+            return
+
+        stat = self._getSyncStat(filename)
+        stat[StatSync.SYNCS] += 1
+        if syncedBytes == 0:
+            stat[StatSync.EMPTY_SYNCS] += 1
+        stat[StatSync.SYNCED_BYTES] += syncedBytes
+        stat[StatSync.MAX_SYNCED_BYTES] = max(stat[StatSync.MAX_SYNCED_BYTES], syncedBytes)
+        if result.get("timeSpent"):
+            usecs = timedeltaToMicroseconds(result["timeSpent"])
+            stat[StatSync.SYNC_USECS] += usecs
+            stat[StatSync.MAX_SYNC_USECS] = max(stat[StatSync.MAX_SYNC_USECS], usecs)
+            stat[StatSync.SYNC_LATENCY].add(usecs)
+
+    def getState(self):
+        return (self._statFileIO.getState(), self._unsyncedBytes, self._syncStat)
+
+    def setState(self, state):
+        fileIOState, self._unsyncedBytes, self._syncStat = state
+        self._statFileIO.setState(fileIOState)
+
+    def getMergeableStat(self):
+        return self._syncStat
+
+    def mergeStat(self, syncStat):
+        for filename, stat in syncStat.iteritems():
+            total = self._getSyncStat(filename)
+            for index in [StatSync.SYNCS, StatSync.EMPTY_SYNCS, StatSync.SYNC_USECS, StatSync.SYNCED_BYTES]:
+                total[index] += stat[index]
+            for index in [StatSync.MAX_SYNC_USECS, StatSync.MAX_SYNCED_BYTES]:
+                total[index] = max(total[index], stat[index])
+            total[StatSync.SYNC_LATENCY].merge(stat[StatSync.SYNC_LATENCY])
+
+    def printOutput(self):
+        out = self._openOutput(self._pluginOptionDict)
+
+        fileList = sorted(self._syncStat.iteritems(),
+                          key=lambda (name, stat): (-stat[StatSync.SYNC_USECS], -stat[StatSync.SYNCS], name))
+        top = int(self._pluginOptionDict.get("top", "0"))
+        if top:
+            fileList = fileList[:top]
+
+        haveTimeSpent = self._straceOptions["haveTimeSpent"]
+        out.beginTable("Syncs per file",
+                       ["filename", "syncs", "syncs without writes", "sync seconds", "p50 usecs", "p99 usecs",
+                        "max usecs", "synced bytes", "bytes/sync", "max bytes/sync"],
+                       ["%s", "%d", "%d", "%.6f", "%s", "%s", "%s", "%d", "%.1f", "%d"])
+        for name, stat in fileList:
+            syncs = stat[StatSync.SYNCS]
+            latency = stat[StatSync.SYNC_LATENCY]
+            out.writeRow([name, syncs, stat[StatSync.EMPTY_SYNCS],
+                          stat[StatSync.SYNC_USECS] / 1000000.0 if haveTimeSpent else None,
+                          latency.percentile(50), latency.percentile(99),
+                          stat[StatSync.MAX_SYNC_USECS] if latency.getCount() else None,
+                          stat[StatSync.SYNCED_BYTES],
+                          float(stat[StatSync.SYNCED_BYTES]) / syncs if syncs else 0.0,
+                          stat[StatSync.MAX_SYNCED_BYTES]])
+        out.close()
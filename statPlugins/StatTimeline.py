@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+from array import array
+from datetime import datetime, timedelta
+
+from StatBase import StatBase
+from straceParserLib.StatUtils import LatencyHistogram, timedeltaToMicroseconds
+
+
+class StatTimeline(StatBase):
+    """ Syscall counts, read/write bytes and latency per time interval """
+
+    READ_SYSCALLS = set(["read", "readv", "pread64", "preadv", "recv", "recvfrom", "recvmsg"])
+    WRITE_SYSCALLS = set(["write", "writev", "pwrite64", "pwritev", "send", "sendto", "sendmsg",
+                          "sendfile", "sendfile64"])
+
+    # Index of a bucket: [syscall counts, read bytes, write bytes, latency,
+    # max latency]. The syscall counts is an array indexed by the column of
+    # the syscall in _syscallColumn and the latency is a LatencyHistogram of
+    # microseconds, so a bucket does not grow with its syscalls.
+    COUNTS, READ_BYTES, WRITE_BYTES, LATENCY, MAX_LATENCY = range(5)
+
+    def __init__(self):
+        self._pluginOptionDict = {}
+        self._straceOptions = {}
+        self._interval = 100000         # in microseconds
+        self._percentiles = [50, 90, 99]
+        # _syscallColumn[syscall] = index in the syscall counts of buckets
+        self._syscallColumn = {}
+        # _buckets[bucket number] = bucket, where bucket number is the start
+        # time (in microseconds from 1970-1-1) divided by the interval
+        self._buckets = {}
+
+    def optionHelp(self):
+        return {"output":"Write the output to this file instead of stdout",
+                "interval":"Length of the time interval in milliseconds (default: 100)",
+                "format":"Output format: text (default), csv, json or ndjson",
+                "percentiles":"Latency percentiles to print, separated by ':' (default: 50:90:99)"}
+
+    def setOption(self, pluginOptionDict):
+        self._pluginOptionDict = pluginOptionDict
+        interval = self._pluginOptionDict.get("interval", "100")
+        if not interval.isdigit() or int(interval) == 0:
+            return False
+        self._interval = int(interval) * 1000
+        if not self._checkOutputOption(self._pluginOptionDict):
+            return False
+        percentiles = self._pluginOptionDict.get("percentiles", "50:90:99").split(":")
+        if not all([p.isdigit() and 0 < int(p) <= 100 for p in percentiles]):
+            return False
+        self._percentiles = [int(p) for p in percentiles]
+        return True
+
+    def isOperational(self, straceOptions):
+        self._straceOptions = straceOptions
+        if not straceOptions["haveTime"]:
+            return False
+        return True
+
+    def getSyscallHooks(self):
+        return {"ALL": self.record}
+
+    def record(self, result):
+        if "startTime" not in result:
+            return
+        startTime = timedeltaToMicroseconds(result["startTime"] - datetime(1970, 1, 1))
+        bucketNumber = startTime // self._interval
+        bucket = self._buckets.get(bucketNumber)
+        if bucket is None:
+            bucket = self._buckets[bucketNumber] = [array("L", [0] * len(self._syscallColumn)), 0, 0,
+                                                    LatencyHistogram(), None]
+
+        syscall = result["syscall"]
+        column = self._syscallColumn.setdefault(syscall, len(self._syscallColumn))
+        counts = bucket[StatTimeline.COUNTS]
+        if column >= len(counts):
+            counts.extend([0] * (column + 1 - len(counts)))
+        counts[column] += 1
+
+        if result["return"].isdigit():
+            if syscall in StatTimeline.READ_SYSCALLS:
+                bucket[StatTimeline.READ_BYTES] += int(result["return"])
+            elif syscall in StatTimeline.WRITE_SYSCALLS:
+                bucket[StatTimeline.WRITE_BYTES] += int(result["return"])
+
+        if result.get("timeSpent"):
+            usecs = timedeltaToMicroseconds(result["timeSpent"])
+            bucket[StatTimeline.LATENCY].add(usecs)
+            bucket[StatTimeline.MAX_LATENCY] = max(bucket[StatTimeline.MAX_LATENCY], usecs)
+
+    def getState(self):
+        return (self._syscallColumn, self._buckets)
+
+    def setState(self, state):
+        self._syscallColumn, self._buckets = state
+
+    def _getBucketTime(self, bucketNumber):
+        """ The start time of the bucket, in the time format of the strace file """
+        startTime = datetime(1970, 1, 1) + timedelta(microseconds=bucketNumber * self._interval)
+        if self._straceOptions["haveTime"] == "ttt":
+            return "%.6f" % (timedeltaToMicroseconds(startTime - datetime(1970, 1, 1)) / 1000000.0)
+        return startTime.strftime("%H:%M:%S.%f")
+
+    def _iterBuckets(self):
+        """ Yield (bucket time, offset seconds, syscall counts, read bytes,
+            write bytes, latency percentiles in microseconds, max latency) of
+            every interval from the first to the last one, empty intervals
+            included.
+        """
+        if not self._buckets:
+            return
+        emptyBucket = [array("L"), 0, 0, LatencyHistogram(), None]
+        firstBucket = min(self._buckets)
+        for bucketNumber in xrange(firstBucket, max(self._buckets) + 1):
+            counts, readBytes, writeBytes, latency, maxLatency = self._buckets.get(bucketNumber, emptyBucket)
+            yield (self._getBucketTime(bucketNumber),
+                   (bucketNumber - firstBucket) * self._interval / 1000000.0,
+                   counts, readBytes, writeBytes,
+                   [latency.percentile(p) for p in self._percentiles], maxLatency)
+
+    def printOutput(self):
+        out = self._openOutput(self._pluginOptionDict)
+
+        # syscall columns: the most frequent syscall first
+        totalCount = [0] * len(self._syscallColumn)
+        for bucket in self._buckets.itervalues():
+            for column, count in enumerate(bucket[StatTimeline.COUNTS]):
+                totalCount[column] += count
+        syscallList = sorted(self._syscallColumn, key=lambda s: totalCount[self._syscallColumn[s]], reverse=True)
+
+        columns = ["time", "offset seconds", "calls", "read bytes", "write bytes"] + \
+                  ["p%d usecs" % p for p in self._percentiles] + ["max usecs"] + syscallList
+        out.beginTable("Timeline per %d ms" % (self._interval / 1000), columns,
+                       ["%s", "%.3f", "%d", "%d", "%d"] + ["%s"] * (len(self._percentiles) + 1) +
+                       ["%d"] * len(syscallList))
+        for bucketTime, offset, counts, readBytes, writeBytes, percentiles, maxLatency in self._iterBuckets():
+            syscallCounts = [counts[self._syscallColumn[s]] if self._syscallColumn[s] < len(counts) else 0
+                             for s in syscallList]
+            out.writeRow([bucketTime, offset, sum(syscallCounts), readBytes, writeBytes] +
+                         percentiles + [maxLatency] + syscallCounts)
+        out.close()
@@ -19,6 +19,26 @@ from StatBase import StatBase
 class VerifyParser(StatBase):
     """ For verify parser output """
 
+    def __init__(self):
+        self._pluginOptionDict = {}
+        # the output is opened at the first line
+        self._output = None
+
+    def optionHelp(self):
+        return {"output":"Write the output to this file instead of stdout",
+                "format":"Output format: text (default), csv, json or ndjson"}
+
+    def setOption(self, pluginOptionDict):
+        self._pluginOptionDict = pluginOptionDict
+        return self._checkOutputOption(pluginOptionDict)
+
+    def _getOutput(self):
+        if self._output is None:
+            self._output = self._openOutput(self._pluginOptionDict)
+            self._output.beginTable("Syscalls", ["pid", "time", "syscall", "type", "args", "return", "seconds"],
+                                    header="")
+        return self._output
+
     def getRawSyscallHooks(self):
         return {"ALL": self.funcHandleALLSyscall}
 
@@ -47,10 +67,16 @@ class VerifyParser(StatBase):
             if "timeSpent" in result and result["timeSpent"]:
                 output += " <%d.%06d>" % (result["timeSpent"].seconds, result["timeSpent"].microseconds)
 
-        print output
+        timeSpent = result.get("timeSpent")
+        self._getOutput().writeRow([pid or None, str(startTime) if startTime else None, result["syscall"],
+                                    result["type"], result["args"], result.get("return"),
+                                    timeSpent.total_seconds() if timeSpent else None], output)
         ## Print arg for check 
         #for arg in result["args"]:
         #    print "        '%s'" % arg
 
+    def getState(self):
+        return {}   # nothing to keep
+
     def printOutput(self):
-        pass
+        self._getOutput().close()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+import os
+import sys
+import stat
+import json
+import socket
+import logging
+import threading
+import traceback
+import SocketServer
+from cStringIO import StringIO
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from StraceParser import StraceParser
+from PluginLoader import PluginLoadError, loadPlugins
+from StatUtils import timedeltaToMicroseconds
+
+
+# record kinds, as in PipelineAnalyser; a completed line is both
+COMPLETE = 0
+RAW = 1
+BOTH = 2
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class AnalysisError(Exception):
+    """ Raised when the server cannot be reached or answers an error """
+    pass
+
+
+class TraceStore(object):
+    """
+    TraceStore
+
+    The syscalls of a strace file, parsed once and kept in memory as compact
+    tuples, so that plugins can be run on them many times without parsing
+    the file again. A record is
+    (kind, pid, start usecs, syscall, args, return, errno, time spent usecs, type)
+    and is turned back into the dict of StraceParser when it is replayed.
+
+    The records are never changed after loading, so many threads can replay
+    them at the same time. The args are kept as a tuple and each replay gets
+    a new list of them, as some plugins change the args of a result (e.g.
+    StatFutex adds the args of the resumed line). (The lists inside the args,
+    e.g. of a struct, are shared and must not be changed.)
+    """
+
+    def __init__(self):
+        self._records = []
+        self._straceOptions = {}
+        self._firstTime = None
+        self._lastRawResult = None
+
+    def load(self, reader, straceOptions):
+        """ Parse reader and keep its syscalls """
+        self._straceOptions = straceOptions
+        straceParser = StraceParser()
+        straceParser.registerRawSyscallHook("ALL", self._storeRaw)
+        straceParser.registerSyscallHook("ALL", self._storeComplete)
+        straceParser.startParse(reader, straceOptions)
+        self._lastRawResult = None
+
+    def getStraceOptions(self):
+        return self._straceOptions
+
+    def getRecordCount(self):
+        return len(self._records)
+
+    def _toRecord(self, kind, result):
+        startTime = result.get("startTime")
+        timeSpent = result.get("timeSpent")
+        if startTime is not None:
+            startTime = timedeltaToMicroseconds(startTime - EPOCH)
+            if self._firstTime is None:
+                self._firstTime = startTime
+        return (kind, intern(str(result["pid"])) if "pid" in result else None, startTime,
+                intern(str(result["syscall"])), tuple(result["args"]), result.get("return"), result.get("errno"),
+                timedeltaToMicroseconds(timeSpent) if timeSpent is not None else None,
+                intern(result["type"]))
+
+    def _storeRaw(self, result):
+        self._records.append(self._toRecord(RAW, result))
+        self._lastRawResult = result
+
+    def _storeComplete(self, result):
+        if result is self._lastRawResult:
+            # the parser passes the same dict to both hooks for a completed line
+            self._records[-1] = (BOTH,) + self._records[-1][1:]
+        else:
+            self._records.append(self._toRecord(COMPLETE, result))
+
+    def _toResult(self, record):
+        kind, pid, startTime, syscall, args, returnValue, errno, timeSpent, syscallType = record
+        result = {"syscall": syscall, "args": list(args), "type": syscallType}
+        if self._straceOptions["havePid"]:
+            result["pid"] = unicode(pid)      # as the parser gives it
+        if self._straceOptions["haveTime"]:
+            result["startTime"] = EPOCH + timedelta(microseconds=startTime)
+        if syscallType != "unfinished":
+            result["return"] = returnValue
+            result["errno"] = errno
+            if self._straceOptions["haveTimeSpent"]:
+                result["timeSpent"] = timedelta(microseconds=timeSpent) if timeSpent is not None else None
+        return result
+
+    def replay(self, hookTables, pidSet=None, fromTime=None, toTime=None):
+        """ Call the hooks in hookTables (a complete and a raw hook table,
+            like those of StraceParser) with the stored syscalls, in the
+            order of the strace file. pidSet, fromTime and toTime (seconds
+            after the first line) select the syscalls.
+        """
+        if fromTime is not None:
+            fromTime = self._firstTime + int(fromTime * 1000000) if self._firstTime is not None else None
+        if toTime is not None:
+            toTime = self._firstTime + int(toTime * 1000000) if self._firstTime is not None else None
+        completeHooks, rawHooks = hookTables
+        completeAll = completeHooks.get("ALL", [])
+        rawAll = rawHooks.get("ALL", [])
+        for record in self._records:
+            if pidSet is not None and record[1] not in pidSet:
+                continue
+            if fromTime is not None and record[2] < fromTime:
+                continue
+            if toTime is not None and record[2] >= toTime:
+                continue
+
+            kind = record[0]
+            syscall = record[3]
+            # a completed line is the same dict for both hooks, like in StraceParser
+            result = None
+            if kind == RAW or kind == BOTH:
+                funcList = rawHooks.get(syscall)
+                if funcList or rawAll:
+                    result = self._toResult(record)
+                    for func in funcList or []:
+                        func(result)
+                    for func in rawAll:
+                        func(result)
+            if kind == COMPLETE or kind == BOTH:
+                funcList = completeHooks.get(syscall)
+                if funcList or completeAll:
+                    if result is None:
+                        result = self._toResult(record)
+                    for func in funcList or []:
+                        func(result)
+                    for func in completeAll:
+                        func(result)
+
+
+class ThreadLocalStdout(object):
+    """ A sys.stdout which writes to the buffer of the current thread, if it
+        has one, so that the output of the plugins run by each request can be
+        sent back to its client.
+    """
+
+    def __init__(self, stdout):
+        self._stdout = stdout
+        self._local = threading.local()
+
+    def capture(self):
+        """ Capture the output of the current thread, until getCaptured() """
+        self._local.buffer = StringIO()
+
+    def getCaptured(self):
+        """ Stop capturing and return the captured output of the current thread """
+        output = self._local.buffer.getvalue()
+        self._local.buffer = None
+        return output
+
+    def _getStream(self):
+        buf = getattr(self._local, "buffer", None)
+        return self._stdout if buf is None else buf
+
+    def write(self, data):
+        self._getStream().write(data)
+
+    def writelines(self, lines):
+        self._getStream().writelines(lines)
+
+    def flush(self):
+        self._getStream().flush()
+
+    def isatty(self):
+        # the captured output is not a terminal
+        return self._getStream().isatty()
+
+    def __getattr__(self, name):
+        return getattr(self._stdout, name)
+
+
+class _RequestHandler(SocketServer.StreamRequestHandler):
+    """ A request is one line of JSON:
+        {"plugins": [...], "options": {plugin: {key: value}},
+         "pids": [...] or null, "from": seconds or null, "to": seconds or null}
+        The answer is one line of JSON: {"output": text, "error": text or null}
+    """
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            self._answer("", "Bad request")
+            return
+        self._answer(*self.server.runRequest(request))
+
+    def _answer(self, output, error):
+        self.wfile.write(json.dumps({"output": output.decode("utf-8", "replace"), "error": error}))
+        self.wfile.write("\n")
+
+
+class AnalysisServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """
+    AnalysisServer
+
+    Keep a parsed strace file (a TraceStore) in memory and run the plugins
+    on it for the clients of a local Unix socket, each request in its own
+    thread.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socketPath, traceStore):
+        if os.path.exists(socketPath) and stat.S_ISSOCK(os.stat(socketPath).st_mode):
+            os.unlink(socketPath)       # left by a server which is gone
+        SocketServer.UnixStreamServer.__init__(self, socketPath, _RequestHandler)
+        # the trace may have anything in it, only the user can connect
+        os.chmod(socketPath, 0600)
+        self._socketPath = socketPath
+        self._traceStore = traceStore
+        if not isinstance(sys.stdout, ThreadLocalStdout):
+            sys.stdout = ThreadLocalStdout(sys.stdout)
+        self._stdout = sys.stdout
+
+    def runRequest(self, request):
+        """ Run the plugins of request on the trace, return (output, error) """
+        self._stdout.capture()
+        error = None
+        try:
+            pluginOptions = request.get("options") or {}
+            for plug, option in pluginOptions.iteritems():
+                if "output" in option:
+                    raise PluginLoadError("Plugin option %s.output cannot be used on the server." % plug)
+            statObjList = loadPlugins(request.get("plugins") or [], pluginOptions,
+                                      self._traceStore.getStraceOptions())
+            if statObjList:
+                hookTables = (defaultdict(list), defaultdict(list))
+                for obj in statObjList:
+                    for hookTable, hooks in zip(hookTables, (obj.getSyscallHooks(), obj.getRawSyscallHooks())):
+                        if hooks:
+                            for syscall, func in hooks.iteritems():
+                                hookTable[syscall].append(func)
+                pids = request.get("pids")
+                self._traceStore.replay(hookTables, set(pids) if pids else None,
+                                        request.get("from"), request.get("to"))
+                for obj in statObjList:
+                    obj.printOutput()
+            else:
+                print "No plugin is loaded."
+        except PluginLoadError as e:
+            error = str(e)
+        except Exception:
+            error = traceback.format_exc()
+            logging.error("Request failed: %s" % error)
+        return (self._stdout.getCaptured(), error)
+
+    def serve(self):
+        """ Serve until interrupted, then remove the socket """
+        try:
+            self.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.server_close()
+            os.unlink(self._socketPath)
+
+
+def runQuery(socketPath, request):
+    """ Send request to the server at socketPath, return its output.
+        Raise AnalysisError if it fails.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socketPath)
+        sockFile = sock.makefile("rwb")
+        sockFile.write(json.dumps(request) + "\n")
+        sockFile.flush()
+        answer = sockFile.readline()
+    except socket.error as e:
+        raise AnalysisError("Cannot query the server at %s: %s" % (socketPath, e))
+    finally:
+        sock.close()
+    try:
+        answer = json.loads(answer)
+    except ValueError:
+        raise AnalysisError("Bad answer from the server at %s" % socketPath)
+    if answer["error"]:
+        raise AnalysisError(answer["output"] + answer["error"])
+    return answer["output"]
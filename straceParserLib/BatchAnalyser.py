@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+
+import sys
+import os
+import io
+import logging
+import traceback
+import multiprocessing
+
+from StraceParser import StraceParser
+from PluginLoader import loadPlugins, registerPlugins
+from PluginRegistry import PluginRegistry
+
+
+# plugins whose output option is a file of their own (not their report),
+# with the extension of the file. Each strace file gets its own file next
+# to its output, or the worker processes would all write the same one.
+FILE_OUTPUT_PLUGINS = {"StatSQLite": ".db"}
+
+
+def collectStraceFiles(pathList):
+    """ Expand the directories in pathList to the files inside them
+        (recursively). Files are kept in the given order.
+    """
+    straceFiles = []
+    for path in pathList:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    straceFiles.append(os.path.join(dirpath, filename))
+        else:
+            straceFiles.append(path)
+    return straceFiles
+
+
+def analyseStraceFile(task):
+    """ Analyse one strace file; run in a worker process of BatchAnalyser.
+
+        task is a tuple of (straceFile, enablePluginList, pluginOptions,
+        straceOptions, outputFile). straceOptions is None for autodetect.
+        The output of the plugins is written to outputFile.
+
+        Return a tuple of (straceFile, straceOptions, statDict, error), where
+        statDict contains the getMergeableStat() of each plugin by name and
+        error is None on success.
+    """
+    straceFile, enablePluginList, pluginOptions, straceOptions, outputFile = task
+    stdout = sys.stdout
+    try:
+        with io.open(straceFile) as reader:
+            straceParser = StraceParser()
+            if not straceOptions:
+                straceOptions = straceParser.autoDetectFormat(reader)
+                if not straceOptions:
+                    return (straceFile, None, {}, "Auto detect line format failed.")
+
+            with open(outputFile, "w") as output:
+                sys.stdout = output
+                statObjList = loadPlugins(enablePluginList, pluginOptions, straceOptions)
+                registerPlugins(straceParser, statObjList)
+                straceParser.startParse(reader, straceOptions)
+                for obj in statObjList:
+                    obj.printOutput()
+
+        statDict = {}
+        for obj in statObjList:
+            stat = obj.getMergeableStat()
+            if stat is not None:
+                statDict[obj.__class__.__name__] = stat
+        return (straceFile, straceOptions, statDict, None)
+    except Exception:
+        return (straceFile, straceOptions, {}, traceback.format_exc())
+    finally:
+        sys.stdout = stdout
+
+
+class BatchAnalyser(object):
+    """
+    BatchAnalyser
+
+    Analyse many independent strace files in a pool of worker processes.
+    The output of each strace file is written to its own file in outputDir
+    and the stat of the plugins which support getMergeableStat() are
+    aggregated into a cross-file report.
+    """
+
+    def __init__(self, enablePluginList, pluginOptions, straceOptions=None,
+                 outputDir="strace_analyser.batch", jobs=None):
+        self._enablePluginList = enablePluginList
+        self._pluginOptions = pluginOptions
+        self._straceOptions = straceOptions
+        self._outputDir = outputDir
+        self._jobs = jobs or multiprocessing.cpu_count()
+
+    def _outputFileList(self, straceFiles):
+        """ Name the output file by the basename of strace file, add a
+            sequence number if the basename is used already.
+        """
+        outputFileList = []
+        usedNames = set()
+        for straceFile in straceFiles:
+            name = os.path.basename(straceFile) + ".txt"
+            seq = 1
+            while name in usedNames:
+                seq += 1
+                name = "%s.%d.txt" % (os.path.basename(straceFile), seq)
+            usedNames.add(name)
+            outputFileList.append(os.path.join(self._outputDir, name))
+        return outputFileList
+
+    def _taskPluginOptions(self, outputFile):
+        """ The plugin options of the strace file of outputFile """
+        pluginOptions = dict(self._pluginOptions)
+        for plug, extension in FILE_OUTPUT_PLUGINS.iteritems():
+            if plug in self._enablePluginList:
+                pluginOptions[plug] = dict(pluginOptions.get(plug, {}))
+                pluginOptions[plug]["output"] = os.path.splitext(outputFile)[0] + extension
+        return pluginOptions
+
+    def _analyse(self, straceFiles):
+        """ Analyse straceFiles in the worker processes, print where the
+            output of each file is. Return the results of analyseStraceFile
+            in the order of straceFiles and the number of files that failed.
+        """
+        if not os.path.isdir(self._outputDir):
+            os.makedirs(self._outputDir)
+
+        taskList = [(straceFile, self._enablePluginList, self._taskPluginOptions(outputFile),
+                     self._straceOptions, outputFile)
+                    for straceFile, outputFile in zip(straceFiles, self._outputFileList(straceFiles))]
+
+        pool = multiprocessing.Pool(min(self._jobs, len(taskList)))
+        try:
+            # imap keeps the order of straceFiles for the report
+            resultList = list(pool.imap(analyseStraceFile, taskList))
+            pool.close()
+        except KeyboardInterrupt:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+        failCount = 0
+        print "====== Batch analysis ======"
+        for (straceFile, straceOptions, statDict, error), task in zip(resultList, taskList):
+            if error:
+                failCount += 1
+                print "%s: FAILED" % straceFile
+                logging.error("Analysing %s failed: %s" % (straceFile, error))
+            else:
+                print "%s: output in %s" % (straceFile, task[4])
+        print ""
+        return resultList, failCount
+
+    def run(self, straceFiles):
+        """ Analyse all straceFiles and print the aggregated report.
+            Return the number of files that failed.
+        """
+        resultList, failCount = self._analyse(straceFiles)
+        self._printAggregatedReport([r for r in resultList if not r[3]])
+        return failCount
+
+    def runDiff(self, baseFile, newFile):
+        """ Analyse baseFile and newFile (e.g. traces before and after a
+            change) in parallel and print the diff of each plugin.
+            Return the number of files that failed.
+        """
+        resultList, failCount = self._analyse([baseFile, newFile])
+        if failCount:
+            return failCount
+
+        # the same options for both objects, so they are comparable
+        diffOptions = self._getAggregateOptions(resultList)
+        for plug in self._enablePluginList:
+            if plug not in resultList[0][2] or plug not in resultList[1][2]:
+                print "plugin %s has no stat of both files, skipping" % plug
+                continue
+            baseObj = self._createMergedStatObj(plug, [resultList[0][2][plug]], diffOptions)
+            newObj = self._createMergedStatObj(plug, [resultList[1][2][plug]], diffOptions)
+            print "====== %s: %s -> %s ======" % (plug, baseFile, newFile)
+            if newObj.printDiff(baseObj) is False:
+                print "plugin %s does not support diff, skipping" % plug
+            print ""
+        return 0
+
+    def _getAggregateOptions(self, resultList):
+        # pid of different strace files are unrelated, so the aggregated
+        # report is done without pid
+        return {"havePid": False, "haveTime": "",
+                "haveTimeSpent": any(r[1]["haveTimeSpent"] for r in resultList)}
+
+    def _createMergedStatObj(self, plug, statList, aggregateOptions):
+        """ Create an object of plugin plug and merge statList into it """
+        pluginClass = PluginRegistry().loadPluginClass(plug)
+        statObj = pluginClass()
+        statObj.isOperational(aggregateOptions)
+        statObj.setOption(self._pluginOptions.get(plug, {}))
+        for stat in statList:
+            statObj.mergeStat(stat)
+        return statObj
+
+    def _printAggregatedReport(self, resultList):
+        aggregateOptions = self._getAggregateOptions(resultList)
+        for plug in self._enablePluginList:
+            statList = [r[2][plug] for r in resultList if plug in r[2]]
+            if not statList:
+                continue
+
+            statObj = self._createMergedStatObj(plug, statList, aggregateOptions)
+            print "====== %s: aggregated over %d files ======" % (plug, len(statList))
+            statObj.printOutput()
+            print ""
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+
+import os
+import cPickle as pickle
+
+CHECKPOINT_VERSION = 1
+
+
+class CheckpointError(Exception):
+    """ Raised when a checkpoint cannot be saved or used """
+    pass
+
+
+class CheckpointReader(object):
+    """
+    CheckpointReader
+
+    Wrap the reader of a strace file which is still being written: only the
+    complete lines are returned, a partly written line at the end of the file
+    is left for the next run. offset() returns the byte offset where the next
+    run should continue.
+    """
+
+    def __init__(self, reader):
+        self._reader = reader
+        self._pendingLine = u""
+
+    def __iter__(self):
+        for line in self._reader:
+            if not line.endswith("\n"):
+                self._pendingLine = line
+                break
+            yield line
+
+    def offset(self):
+        """ The byte offset after the last complete line. Only valid after
+            all lines are read.
+        """
+        pendingBytes = len(self._pendingLine.encode(self._reader.encoding))
+        return self._reader.buffer.tell() - pendingBytes
+
+
+def saveCheckpoint(filename, checkpoint):
+    """ Save the checkpoint dict to filename. The file is replaced atomically
+        so a crash will not leave a broken checkpoint behind.
+    """
+    checkpoint = dict(checkpoint, version=CHECKPOINT_VERSION)
+    tmpFilename = filename + ".tmp"
+    try:
+        with open(tmpFilename, "wb") as f:
+            pickle.dump(checkpoint, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmpFilename, filename)
+    except (IOError, OSError, pickle.PicklingError) as e:
+        raise CheckpointError("Cannot save checkpoint %s: %s" % (filename, e))
+
+
+def loadCheckpoint(filename):
+    """ Load the checkpoint dict saved by saveCheckpoint """
+    try:
+        with open(filename, "rb") as f:
+            checkpoint = pickle.load(f)
+    except (IOError, EOFError, pickle.UnpicklingError) as e:
+        raise CheckpointError("Cannot load checkpoint %s: %s" % (filename, e))
+    if checkpoint.get("version") != CHECKPOINT_VERSION:
+        raise CheckpointError("Checkpoint %s is saved by an incompatible version" % filename)
+    return checkpoint
@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+
+import os
+import sys
+import time
+import codecs
+import locale
+import logging
+import threading
+from collections import deque
+
+
+class LiveReader(object):
+    """
+    LiveReader
+
+    Read a live strace output (e.g. stdin) in a dedicated thread into a
+    bounded buffer, so that a slow parser or plugin will not block the
+    writer (strace, and so the traced process) as long as the buffer is not
+    full. When the buffer is full, the policy decides what to do:
+
+    "block":       wait for the parser, like reading the pipe directly
+    "drop-oldest": drop the oldest lines in the buffer. The resumed line of
+                   a dropped unfinished line is dropped too, so that the
+                   parser never pairs it with an older unfinished line.
+    "sample":      when the buffer is over half full, keep only one of every
+                   sampleRate lines (except unfinished/resumed lines, so that
+                   they can still be paired). Drop the oldest lines if it is
+                   full anyway.
+
+    It can be iterated line by line like a file object. While it waits for
+    lines, the idle callback (see setIdleCallback()) is called about every
+    IDLE_INTERVAL seconds in the thread which iterates it.
+
+    >>> readFd, writeFd = os.pipe()
+    >>> _ = os.write(writeFd, '1 read(3, <unfinished ...>\\n2 write(1, "a", 1) = 1\\n'
+    ...                       '1 <... read resumed> "b", 1) = 1\\n2 close(1) = 0\\n')
+    >>> os.close(writeFd)
+    >>> reader = LiveReader(readFd, bufferSize=2)
+    >>> list(reader)
+    [u'2 close(1) = 0\\n']
+    >>> reader.getStats()["droppedLines"]
+    3
+    """
+
+    POLICIES = ["block", "drop-oldest", "sample"]
+    READ_SIZE = 65536
+    IDLE_INTERVAL = 0.1
+
+    def __init__(self, fd, bufferSize=1000000, policy="drop-oldest", sampleRate=10):
+        if policy not in LiveReader.POLICIES:
+            raise ValueError("Unknown policy %s" % policy)
+        self._fd = fd
+        self._bufferSize = bufferSize
+        self._policy = policy
+        self._sampleRate = sampleRate
+        self._havePid = True
+
+        # _buffer contains chunks of [arrival time, list of lines]
+        self._buffer = deque()
+        self._bufferedLines = 0
+        self._eof = False
+        self._idleCallback = None
+        # arrival time of the last lines taken
+        self._lastArrival = time.time()
+        # sys.exc_info() of the error which ended the reader thread, raised
+        # again to the consumer after the lines read before it
+        self._error = None
+        # the pids (see _getPid()) of the unfinished lines dropped since the
+        # consumer last took lines, whose resumed line was not dropped yet
+        self._droppedUnfinished = set()
+        # the same, of the lines taken by the consumer: their next resumed
+        # line is an orphan. Only used by the consumer thread.
+        self._orphanResumed = set()
+        self._cond = threading.Condition()
+
+        # counters
+        self._readLines = 0
+        self._droppedLines = 0
+        self._sampledOutLines = 0
+        self._maxBufferedLines = 0
+        self._maxLag = 0.0
+        self._sampleCount = 0
+
+        self._thread = threading.Thread(target=self._readSource, name="LiveReader")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _readSource(self):
+        try:
+            decoder = codecs.getincrementaldecoder(locale.getpreferredencoding() or "ascii")(errors="replace")
+            partialLine = u""
+            while True:
+                data = os.read(self._fd, LiveReader.READ_SIZE)
+                if not data:
+                    break
+                lines = (partialLine + decoder.decode(data)).split("\n")
+                partialLine = lines.pop()
+                if lines:
+                    self._addLines([line + "\n" for line in lines])
+            partialLine += decoder.decode("", final=True)
+            if partialLine:
+                self._addLines([partialLine])
+        except Exception:
+            self._error = sys.exc_info()
+        finally:
+            # the consumer would wait forever without the end of input
+            with self._cond:
+                self._eof = True
+                self._cond.notify_all()
+
+    def setHavePid(self, havePid):
+        """ Tell if the lines have pids (strace -f), to pair the unfinished
+            and resumed lines. It is assumed until then.
+        """
+        self._havePid = havePid
+
+    def _getPid(self, line):
+        """ The key of the unfinished syscall of a line, the same as StraceParser """
+        if self._havePid:
+            return line.partition(" ")[0]
+        return 0
+
+    def _dropLines(self, lines):
+        """ Count lines as dropped, and remember the pids of the unfinished
+            lines among them which are not resumed in them
+        """
+        for line in lines:
+            if "<unfinished ...>" in line:
+                self._droppedUnfinished.add(self._getPid(line))
+            elif "resumed>" in line:
+                self._droppedUnfinished.discard(self._getPid(line))
+        self._droppedLines += len(lines)
+
+    def _sample(self, lines):
+        keptLines = []
+        for line in lines:
+            self._sampleCount += 1
+            if self._sampleCount % self._sampleRate == 0 or \
+               "<unfinished ...>" in line or "resumed>" in line:
+                keptLines.append(line)
+        self._sampledOutLines += len(lines) - len(keptLines)
+        return keptLines
+
+    def _addLines(self, lines):
+        with self._cond:
+            self._readLines += len(lines)
+            if self._policy == "block":
+                while self._bufferedLines >= self._bufferSize:
+                    self._cond.wait()
+            elif self._policy == "sample" and self._bufferedLines > self._bufferSize / 2:
+                lines = self._sample(lines)
+
+            self._buffer.append([time.time(), lines])
+            self._bufferedLines += len(lines)
+
+            # drop the oldest lines if it is still over the buffer size
+            while self._policy != "block" and self._bufferedLines > self._bufferSize:
+                if self._droppedLines == 0:
+                    logging.warning("LiveReader: buffer is full, dropping lines.")
+                oldestLines = self._buffer[0][1]
+                dropCount = min(len(oldestLines), self._bufferedLines - self._bufferSize)
+                self._dropLines(oldestLines[:dropCount])
+                if dropCount == len(oldestLines):
+                    self._buffer.popleft()
+                else:
+                    del oldestLines[:dropCount]
+                self._bufferedLines -= dropCount
+
+            self._maxBufferedLines = max(self._maxBufferedLines, self._bufferedLines)
+            self._cond.notify_all()
+
+    def setIdleCallback(self, idleCallback):
+        """ Call idleCallback(idle seconds) while no line comes, where idle
+            seconds is the time since the last lines taken came in. It is
+            called between two lines, like the hooks of the parser, so a
+            plugin may act on what does not happen (e.g. a hang).
+        """
+        self._idleCallback = idleCallback
+
+    def _takeChunks(self):
+        """ Take all the chunks in the buffer; wait if it is empty. Return an
+            empty list at the end of input.
+        """
+        while True:
+            with self._cond:
+                if not self._buffer and not self._eof:
+                    self._cond.wait(LiveReader.IDLE_INTERVAL if self._idleCallback else None)
+                if self._buffer or self._eof:
+                    chunks = self._buffer
+                    self._buffer = deque()
+                    self._bufferedLines = 0
+                    # the lines dropped so far are all before these lines
+                    self._orphanResumed.update(self._droppedUnfinished)
+                    self._droppedUnfinished.clear()
+                    self._cond.notify_all()
+                    if chunks:
+                        self._lastArrival = chunks[-1][0]
+                    return chunks
+            # out of the lock, the reader thread goes on meanwhile
+            if self._idleCallback is not None:
+                self._idleCallback(time.time() - self._lastArrival)
+
+    def __iter__(self):
+        while True:
+            chunks = self._takeChunks()
+            if not chunks:
+                if self._error:
+                    raise self._error[0], self._error[1], self._error[2]
+                return
+            self._maxLag = max(self._maxLag, time.time() - chunks[0][0])
+            for arrivalTime, lines in chunks:
+                for line in lines:
+                    if self._orphanResumed and self._isOrphanResumed(line):
+                        continue
+                    yield line
+
+    def _isOrphanResumed(self, line):
+        """ Return True if line is the resumed line of a dropped unfinished
+            line (and count it as dropped)
+        """
+        if "<unfinished ...>" in line:
+            self._orphanResumed.discard(self._getPid(line))
+        elif "resumed>" in line:
+            pid = self._getPid(line)
+            if pid in self._orphanResumed:
+                self._orphanResumed.remove(pid)
+                with self._cond:
+                    self._droppedLines += 1
+                return True
+        return False
+
+    def peek(self, size):
+        """ Return at least size characters from the beginning of the input
+            (less at the end of input) without consuming them.
+        """
+        with self._cond:
+            while True:
+                text = u"".join(line for arrivalTime, lines in self._buffer for line in lines)
+                if len(text) >= size or self._eof or \
+                   self._bufferedLines >= self._bufferSize:
+                    return text
+                self._cond.wait()
+
+    def getStats(self):
+        with self._cond:
+            return {"readLines": self._readLines,
+                    "droppedLines": self._droppedLines,
+                    "sampledOutLines": self._sampledOutLines,
+                    "bufferedLines": self._bufferedLines,
+                    "maxBufferedLines": self._maxBufferedLines,
+                    "maxLag": self._maxLag}
+
+    def close(self):
+        pass
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+""" Buffered output of the stat plugins, as text, CSV, JSON or NDJSON """
+
+import sys
+import csv
+import json
+from collections import OrderedDict
+
+
+FORMATS = ["text", "csv", "json", "ndjson"]
+
+# the output is written in blocks of about this many bytes
+BUFFER_SIZE = 1024 * 1024
+
+# write the output as it comes instead of in blocks, see setLineBuffered()
+_lineBuffered = False
+
+
+def setLineBuffered(lineBuffered):
+    """ Write the output of the sinks opened from now on as it comes, not
+        in blocks, e.g. when the input is live and the rows of events or
+        alerts should be seen when they happen. (The output to a terminal
+        is always written as it comes.)
+    """
+    global _lineBuffered
+    _lineBuffered = lineBuffered
+
+
+def openSink(outputFormat="text", filename="", name=""):
+    """ Return the OutputSink of outputFormat (one of FORMATS), writing to
+        filename, or to stdout if filename is empty. name is the name of
+        the plugin, written in the JSON formats.
+
+        >>> sink = openSink("text")
+        >>> sink.beginTable("Files", ["filename", "bytes"])
+        >>> sink.writeRow(["/etc/passwd", 1024])
+        >>> sink.close()
+        ====== Files (csv) ======
+        filename, bytes
+        /etc/passwd, 1024
+        >>> sink = openSink("ndjson", name="StatFileIO")
+        >>> sink.beginTable("Files", ["filename", "bytes"])
+        >>> sink.write("Only people read this\\n")
+        >>> sink.writeRow(["/etc/passwd", 1024])
+        >>> sink.close()
+        {"plugin": "StatFileIO", "table": "Files", "filename": "/etc/passwd", "bytes": 1024}
+    """
+    sinkClass = {"text": TextSink, "csv": CsvSink, "json": JsonSink, "ndjson": NdjsonSink}[outputFormat]
+    return sinkClass(filename, name)
+
+
+class OutputSink(object):
+    """
+    OutputSink
+
+    The output of a plugin: tables of rows, begun by beginTable() and
+    written by writeRow(), and free text for people, written by write().
+    The values of a row are kept as they are (numbers, strings or None)
+    in the JSON formats, and formatted by the formats of the table in the
+    text formats. Free text is only written in the text format.
+
+    The output is collected in memory and written in large blocks, so that
+    plugins writing many small rows (e.g. one per syscall) do not pay for
+    a write each time. close() must be called to write the rest.
+    """
+
+    def __init__(self, filename="", name=""):
+        # stdout is looked up when the output is written, it may be
+        # replaced (e.g. in batch mode) after the sink is opened
+        self._file = open(filename, "w") if filename else None
+        stream = self._file or sys.stdout
+        self._lineBuffered = _lineBuffered or (hasattr(stream, "isatty") and stream.isatty())
+        self._name = name
+        self._buffer = []
+        self._bufferSize = 0
+        # title, columns, formats and separator of the current table
+        self._table = None
+        self._tableCount = 0
+
+    def _emit(self, data):
+        if isinstance(data, unicode):
+            data = data.encode("utf-8")
+        self._buffer.append(data)
+        self._bufferSize += len(data)
+        if self._bufferSize >= BUFFER_SIZE or self._lineBuffered:
+            self.flush()
+
+    def _formatRow(self, values):
+        formats = self._table[2]
+        return [u"" if value is None else (formats[i] if formats else "%s") % (value,)
+                for i, value in enumerate(values)]
+
+    def flush(self):
+        """ Write the output collected so far """
+        if self._buffer:
+            stream = self._file or sys.stdout
+            stream.write("".join(self._buffer))
+            self._buffer = []
+            self._bufferSize = 0
+            if self._lineBuffered and hasattr(stream, "flush"):
+                stream.flush()
+
+    def write(self, text):
+        """ Write free text, which is only meant for people """
+        pass
+
+    def beginTable(self, title, columns, formats=None, header=None, separator=", "):
+        """ Begin a table of rows with these columns, ending the current
+            one. formats are the % formats of the columns in the text
+            formats ("%s" by default). In the text format, header is
+            written before the rows instead of the title and the column
+            names, and separator is put between the values of a row.
+        """
+        self.endTable()
+        self._table = (title, columns, formats, separator)
+        self._beginTable(header)
+        self._tableCount += 1
+
+    def writeRow(self, values, text=None):
+        """ Write a row of the current table. In the text format, text is
+            written instead of the formatted values if it is given.
+        """
+        pass
+
+    def endTable(self):
+        """ End the current table (beginTable() and close() end it too) """
+        if self._table is not None:
+            self._endTable()
+            self._table = None
+
+    def close(self):
+        """ End the output and write the rest of it """
+        self.endTable()
+        self._close()
+        self.flush()
+        if self._file:
+            self._file.close()
+        elif hasattr(sys.stdout, "flush"):
+            sys.stdout.flush()
+
+    def _beginTable(self, header):
+        pass
+
+    def _endTable(self):
+        pass
+
+    def _close(self):
+        pass
+
+
+class TextSink(OutputSink):
+    """ The output for people: free text, and each table as its header and
+        a line of separated values per row
+    """
+
+    def write(self, text):
+        self._emit(text)
+
+    def _beginTable(self, header):
+        if header is None:
+            title, columns, formats, separator = self._table
+            header = u"====== %s (csv) ======\n%s\n" % (title, separator.join(columns))
+        self._emit(header)
+
+    def writeRow(self, values, text=None):
+        if text is None:
+            text = self._table[3].join(self._formatRow(values))
+        self._emit(text + u"\n")
+
+
+class CsvSink(OutputSink):
+    """ Each table as a "# title" line, the column names and the rows in
+        CSV, with an empty line between the tables
+    """
+
+    class _Emitter(object):
+        def __init__(self, emit):
+            self.write = emit
+
+    def __init__(self, filename="", name=""):
+        OutputSink.__init__(self, filename, name)
+        self._writer = csv.writer(CsvSink._Emitter(self._emit), lineterminator="\n")
+
+    def _writeCsvRow(self, values):
+        # the csv module of python 2 does not take unicode
+        self._writer.writerow([value.encode("utf-8") if isinstance(value, unicode) else value
+                               for value in values])
+
+    def _beginTable(self, header):
+        if self._tableCount:
+            self._emit("\n")
+        self._emit(u"# %s\n" % self._table[0])
+        self._writeCsvRow(self._table[1])
+
+    def writeRow(self, values, text=None):
+        self._writeCsvRow(self._formatRow(values))
+
+
+class JsonSink(OutputSink):
+    """ One JSON object:
+        {"plugin": name, "tables": [{"title": title, "columns": [...],
+                                     "rows": [[...], ...]}, ...]}
+        written as the rows come, not kept in memory.
+    """
+
+    def __init__(self, filename="", name=""):
+        OutputSink.__init__(self, filename, name)
+        self._emit('{"plugin": %s, "tables": [' % json.dumps(name))
+        self._rowCount = 0
+
+    def _beginTable(self, header):
+        title, columns = self._table[:2]
+        self._emit('%s\n{"title": %s, "columns": %s, "rows": [' %
+                   ("," if self._tableCount else "", json.dumps(title), json.dumps(columns)))
+        self._rowCount = 0
+
+    def writeRow(self, values, text=None):
+        self._emit("%s\n%s" % ("," if self._rowCount else "", json.dumps(values)))
+        self._rowCount += 1
+
+    def _endTable(self):
+        self._emit("]}")
+
+    def _close(self):
+        self._emit("]}\n")
+
+
+class NdjsonSink(OutputSink):
+    """ One JSON object per row:
+        {"plugin": name, "table": title, column: value, ...}
+    """
+
+    def writeRow(self, values, text=None):
+        title, columns = self._table[:2]
+        row = OrderedDict([("plugin", self._name), ("table", title)])
+        row.update(zip(columns, values))
+        self._emit(json.dumps(row) + "\n")
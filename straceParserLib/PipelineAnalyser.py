@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+
+import sys
+import marshal
+import logging
+import traceback
+import multiprocessing
+from cStringIO import StringIO
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from StatUtils import timedeltaToMicroseconds
+
+
+# record kinds in a batch; a completed line is both
+COMPLETE = 0
+RAW = 1
+BOTH = 2
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class _PluginGroup(object):
+    """ A group of plugins which run in one worker process """
+
+    def __init__(self, statObjList, queueSize):
+        self.statObjList = statObjList
+        self.queue = multiprocessing.Queue(queueSize)
+        self.batch = []
+        # the result of the last raw record in batch
+        self.lastRawResult = None
+
+        # hook tables of the plugins, similar to those in StraceParser
+        self.hookTables = (defaultdict(list), defaultdict(list))
+        for obj in statObjList:
+            for kind, hooks in ((COMPLETE, obj.getSyscallHooks()), (RAW, obj.getRawSyscallHooks())):
+                if hooks:
+                    for syscall, func in hooks.iteritems():
+                        self.hookTables[kind][syscall].append(func)
+
+
+class PipelineAnalyser(object):
+    """
+    PipelineAnalyser
+
+    Run the plugins in worker processes, so that the parser and the plugins
+    run on different cores. The parser (in the main process) sends the
+    parsed syscalls in batches to the worker processes through queues; each
+    worker runs the hooks of its own group of plugins. The output of the
+    plugins is gathered back and printed in the order of the plugins.
+
+    Only the syscalls hooked by the plugins of a group are sent to it. They
+    are sent as compact tuples of strings and numbers (see _toRecord()),
+    and a batch is serialized with marshal: it is much faster than pickling
+    the result dicts with their datetime objects. The worker makes the
+    result dicts again.
+    """
+
+    BATCH_SIZE = 2000   # records per batch
+    QUEUE_SIZE = 64     # batches waiting for each worker
+
+    def __init__(self, statObjList, jobs=None):
+        jobs = min(jobs or multiprocessing.cpu_count(), len(statObjList))
+        # distribute the plugins to the workers round robin
+        self._statObjList = statObjList
+        self._groupList = [_PluginGroup(statObjList[i::jobs], PipelineAnalyser.QUEUE_SIZE)
+                           for i in xrange(jobs)]
+        self._resultQueue = multiprocessing.Queue()
+        self._straceOptions = {}
+
+    def _toRecord(self, kind, result):
+        startTime = result.get("startTime")
+        timeSpent = result.get("timeSpent")
+        return (kind, result.get("pid"),
+                timedeltaToMicroseconds(startTime - EPOCH) if startTime is not None else None,
+                result["syscall"], tuple(result["args"]), result.get("return"), result.get("errno"),
+                timedeltaToMicroseconds(timeSpent) if timeSpent is not None else None, result["type"])
+
+    def _toResult(self, record):
+        kind, pid, startTime, syscall, args, returnValue, errno, timeSpent, syscallType = record
+        result = {"syscall": syscall, "args": list(args), "type": syscallType}
+        if self._straceOptions["havePid"]:
+            result["pid"] = pid
+        if self._straceOptions["haveTime"]:
+            result["startTime"] = EPOCH + timedelta(microseconds=startTime)
+        if syscallType != "unfinished":
+            result["return"] = returnValue
+            result["errno"] = errno
+            if self._straceOptions["haveTimeSpent"]:
+                result["timeSpent"] = timedelta(microseconds=timeSpent) if timeSpent is not None else None
+        return result
+
+    def _makeSender(self, group, kind):
+        batch = group.batch
+        def sender(result):
+            if kind == COMPLETE and batch and result is group.lastRawResult:
+                # the parser passes the same dict to both hooks for a completed line
+                batch[-1] = (BOTH,) + batch[-1][1:]
+                return
+            batch.append(self._toRecord(kind, result))
+            group.lastRawResult = result if kind == RAW else None
+            if len(batch) >= PipelineAnalyser.BATCH_SIZE:
+                group.queue.put(marshal.dumps(batch))
+                del batch[:]
+        return sender
+
+    def _registerHooks(self, straceParser):
+        registerFuncList = (straceParser.registerSyscallHook, straceParser.registerRawSyscallHook)
+        for group in self._groupList:
+            for kind in (COMPLETE, RAW):
+                syscalls = group.hookTables[kind].keys()
+                if "ALL" in syscalls:
+                    syscalls = ["ALL"]
+                sender = self._makeSender(group, kind)
+                for syscall in syscalls:
+                    registerFuncList[kind](syscall, sender)
+
+    def _runWorker(self, groupIndex):
+        group = self._groupList[groupIndex]
+        batch = []
+        try:
+            while True:
+                batch = group.queue.get()
+                if batch is None:
+                    break
+                for record in marshal.loads(batch):
+                    result = self._toResult(record)
+                    kind = record[0]
+                    for hookTable in ((group.hookTables[RAW], group.hookTables[COMPLETE]) if kind == BOTH
+                                      else (group.hookTables[kind],)):
+                        if result["syscall"] in hookTable:
+                            for func in hookTable[result["syscall"]]:
+                                func(result)
+                        if "ALL" in hookTable:
+                            for func in hookTable["ALL"]:
+                                func(result)
+
+            outputList = []
+            stdout = sys.stdout
+            for obj in group.statObjList:
+                sys.stdout = StringIO()
+                try:
+                    obj.printOutput()
+                    outputList.append(sys.stdout.getvalue())
+                finally:
+                    sys.stdout = stdout
+            self._resultQueue.put((groupIndex, outputList, None))
+        except Exception:
+            self._resultQueue.put((groupIndex, [], traceback.format_exc()))
+            # keep taking the batches, so that the parser is not blocked
+            while batch is not None:
+                batch = group.queue.get()
+
+    def run(self, straceParser, reader, straceOptions):
+        """ Parse the reader and print the output of all plugins.
+            Return False if some worker failed.
+        """
+        self._straceOptions = straceOptions
+        self._registerHooks(straceParser)
+        workerList = [multiprocessing.Process(target=self._runWorker, args=(i,))
+                      for i in xrange(len(self._groupList))]
+        for worker in workerList:
+            worker.start()
+
+        try:
+            straceParser.startParse(reader, straceOptions)
+            for group in self._groupList:
+                if group.batch:
+                    group.queue.put(marshal.dumps(group.batch))
+                group.queue.put(None)
+
+            # get the results before join, the workers cannot exit before
+            # their results are taken from the queue
+            outputDict = {}
+            success = True
+            for i in xrange(len(workerList)):
+                groupIndex, outputList, error = self._resultQueue.get()
+                if error:
+                    logging.error("Pipeline worker failed: %s" % error)
+                    success = False
+                for obj, output in zip(self._groupList[groupIndex].statObjList, outputList):
+                    outputDict[obj] = output
+        except BaseException:
+            # e.g. KeyboardInterrupt or a parse error: the workers are still
+            # waiting for their batches, and would be joined forever
+            for worker in workerList:
+                worker.terminate()
+            raise
+        finally:
+            for worker in workerList:
+                worker.join()
+
+        for obj in self._statObjList:
+            if obj in outputDict:
+                sys.stdout.write(outputDict[obj])
+        return success
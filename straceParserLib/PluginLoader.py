@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+from PluginRegistry import PluginRegistry
+
+
+class PluginLoadError(Exception):
+    """ Raised when the enabled plugins cannot be set up as requested """
+    pass
+
+
+def loadPlugins(enablePluginList, pluginOptions, straceOptions, registry=None):
+    """ Create an object for each enabled plugin and set its options.
+
+        Plugins which cannot be installed or are not operational under
+        straceOptions are skipped. Raise PluginLoadError if an option is
+        wrong for a plugin.
+        Return the list of plugin objects in the order of enablePluginList.
+    """
+    registry = registry or PluginRegistry()
+    statObjList = []
+    for plug in enablePluginList:
+        if not registry.hasPlugin(plug):
+            print "Cannot install plugin %s, skipping" % plug
+            continue
+
+        # check with the metadata first, so the plugin is not even imported
+        # if it cannot be used
+        option = pluginOptions.get(plug, {})
+        if registry.isBuiltin(plug):
+            if registry.getMissingStraceOptions(plug, straceOptions):
+                print "plugin %s is not operational under this strace options, skipping" % plug
+                continue
+            for optionName in registry.getUnknownOptions(plug, option):
+                raise PluginLoadError("option '%s' doesn't exist for plugin %s" % (optionName, plug))
+
+        pluginClass = registry.loadPluginClass(plug)
+        if not pluginClass:
+            print "Cannot install plugin %s, skipping" % plug
+            continue
+
+        statObj = pluginClass()
+        if not statObj.isOperational(straceOptions): # if it is operational under current strace option
+            print "plugin %s is not operational under this strace options, skipping" % plug
+            continue
+
+        # A sensible check: the plugin option should be in the dict of optionHelp
+        optionHelpDict = statObj.optionHelp()
+        for optionName in option:
+            if optionName not in optionHelpDict:
+                raise PluginLoadError("option '%s' doesn't exist for plugin %s" % (optionName, plug))
+
+        # setOption for this plugin
+        if not statObj.setOption(option):
+            raise PluginLoadError("plugin %s add option failure" % plug)
+
+        statObjList.append(statObj)   # new an object from plugin class and put into list
+    return statObjList
+
+
+def registerPlugins(straceParser, statObjList):
+    """ Register the hooks of all plugin objects to the parser """
+    for obj in statObjList:
+        hooks = obj.getSyscallHooks()
+        if hooks:
+            for syscall, func in hooks.iteritems():
+                straceParser.registerSyscallHook(syscall, func)
+        hooks = obj.getRawSyscallHooks()
+        if hooks:
+            for syscall, func in hooks.iteritems():
+                straceParser.registerRawSyscallHook(syscall, func)
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+
+import os
+import sys
+import json
+import logging
+import ConfigParser
+
+
+class PluginRegistry(object):
+    """
+    PluginRegistry
+
+    Know all the plugins without importing their code. The metadata of the
+    built-in plugins is in statPlugins/plugins.json:
+
+    "StatSummary": {
+        "doc":           the plugin doc (the docstring of the class)
+        "options":       {option name: description} (same as optionHelp())
+        "straceOptions": the strace options needed by the plugin, e.g. ["havePid"]
+        "syscalls":      the syscalls hooked by getSyscallHooks()
+        "rawSyscalls":   the syscalls hooked by getRawSyscallHooks()
+    }
+
+    External plugins are installed as setuptools entry points in the group
+    ENTRY_POINT_GROUP, with the plugin name as the entry point name, e.g.
+
+    entry_points={"strace_analyser.plugins": ["StatMine = mypkg.statmine:StatMine"]}
+
+    They are imported only when they are enabled. Their metadata is taken from
+    the plugin class (or the optional PLUGIN_METADATA dict attribute of it).
+    """
+
+    ENTRY_POINT_GROUP = "strace_analyser.plugins"
+    PLUGIN_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "statPlugins")
+
+    def __init__(self, pluginDir=None):
+        self._pluginDir = pluginDir or PluginRegistry.PLUGIN_DIR
+        with open(os.path.join(self._pluginDir, "plugins.json")) as f:
+            self._metadata = json.load(f)
+        self._entryPoints = None
+
+    def _getEntryPoints(self):
+        """ Find the external plugins, only when they are needed. The
+            entry_points.txt files of the installed distributions are read
+            directly: importing pkg_resources takes longer than most runs.
+        """
+        if self._entryPoints is None:
+            self._entryPoints = {}
+            for path in sys.path:
+                for entryPointsFile in self._findEntryPointsFiles(path or "."):
+                    self._readEntryPoints(entryPointsFile)
+        return self._entryPoints
+
+    def _findEntryPointsFiles(self, path):
+        """ The entry_points.txt files of the distributions in a sys.path
+            directory (egg-info, dist-info and egg directories), or of the egg
+            which is the path itself.
+        """
+        if not os.path.isdir(path):
+            return []
+        if path.endswith(".egg"):
+            return [os.path.join(path, "EGG-INFO", "entry_points.txt")]
+        try:
+            names = os.listdir(path)
+        except OSError:
+            return []
+        files = []
+        for name in names:
+            if name.endswith(".egg-info") or name.endswith(".dist-info"):
+                files.append(os.path.join(path, name, "entry_points.txt"))
+            elif name.endswith(".egg"):
+                files.append(os.path.join(path, name, "EGG-INFO", "entry_points.txt"))
+        return files
+
+    def _readEntryPoints(self, entryPointsFile):
+        if not os.path.isfile(entryPointsFile):
+            return
+        parser = ConfigParser.RawConfigParser()
+        parser.optionxform = str     # the plugin names are case sensitive
+        try:
+            parser.read(entryPointsFile)
+        except ConfigParser.Error as e:
+            logging.warning("Cannot read %s: %s" % (entryPointsFile, e))
+            return
+        if not parser.has_section(PluginRegistry.ENTRY_POINT_GROUP):
+            return
+        for name, value in parser.items(PluginRegistry.ENTRY_POINT_GROUP):
+            if name in self._metadata:
+                logging.warning("External plugin %s is ignored, a built-in plugin has the same name." % name)
+                continue
+            # "module:attr [extras]"
+            self._entryPoints.setdefault(name, value.split("[")[0].strip())
+
+    def _loadEntryPoint(self, name):
+        moduleName, _, attrs = self._entryPoints[name].partition(":")
+        obj = __import__(moduleName, globals(), locals(), ["__name__"])
+        for attr in attrs.split(".") if attrs else []:
+            obj = getattr(obj, attr)
+        return obj
+
+    def getPluginNames(self, withExternal=True):
+        names = self._metadata.keys()
+        if withExternal:
+            names += self._getEntryPoints().keys()
+        return sorted(names)
+
+    def hasPlugin(self, name):
+        # the entry points are only scanned for the names not built in
+        return name in self._metadata or name in self._getEntryPoints()
+
+    def isBuiltin(self, name):
+        return name in self._metadata
+
+    def getMetadata(self, name):
+        """ Return the metadata dict of a plugin. An external plugin is
+            imported to get it.
+        """
+        if name in self._metadata:
+            return self._metadata[name]
+
+        pluginClass = self.loadPluginClass(name)
+        metadata = {"doc": (pluginClass.__doc__ or "").strip(),
+                    "options": pluginClass().optionHelp(),
+                    "straceOptions": [],
+                    "syscalls": [],
+                    "rawSyscalls": []}
+        metadata.update(getattr(pluginClass, "PLUGIN_METADATA", {}))
+        self._metadata[name] = metadata
+        return metadata
+
+    def getMissingStraceOptions(self, name, straceOptions):
+        """ Return the strace options needed by the plugin but not in
+            straceOptions (an empty list if it can work).
+        """
+        return [key for key in self.getMetadata(name)["straceOptions"]
+                if not straceOptions.get(key)]
+
+    def getUnknownOptions(self, name, pluginOptionDict):
+        """ Return the options in pluginOptionDict that the plugin does not have """
+        return [key for key in pluginOptionDict if key not in self.getMetadata(name)["options"]]
+
+    def loadPluginClass(self, name):
+        """ Import the plugin and return its class, or None if it cannot be
+            imported.
+        """
+        if name not in self._metadata and name in self._getEntryPoints():
+            try:
+                return self._loadEntryPoint(name)
+            except (ImportError, AttributeError) as e:
+                logging.warning("Cannot import external plugin %s: %s" % (name, e))
+                return None
+
+        try:
+            module = __import__("statPlugins." + name, globals(), locals(), [name])
+        except ImportError:
+            return None
+        return getattr(module, name, None)
+
+    def checkMetadata(self, name):
+        """ Import a built-in plugin and check that its metadata in
+            plugins.json matches the code. Return a list of problems.
+        """
+        metadata = self._metadata[name]
+        pluginClass = self.loadPluginClass(name)
+        if not pluginClass:
+            return ["cannot be imported"]
+
+        problems = []
+        if (pluginClass.__doc__ or "").strip() != metadata["doc"]:
+            problems.append("doc differs")
+        if sorted(pluginClass().optionHelp().keys()) != sorted(metadata["options"].keys()):
+            problems.append("options differ")
+
+        # with all the strace options, check the hooks
+        allStraceOptions = {"havePid": True, "haveTime": "tt", "haveTimeSpent": True}
+        statObj = pluginClass()
+        if not statObj.isOperational(allStraceOptions):
+            problems.append("not operational with all strace options")
+        for key, hooks in (("syscalls", statObj.getSyscallHooks()),
+                           ("rawSyscalls", statObj.getRawSyscallHooks())):
+            if sorted((hooks or {}).keys()) != sorted(metadata[key]):
+                problems.append("%s differ" % key)
+
+        # without one of the needed strace options, it should not be operational
+        for key in metadata["straceOptions"]:
+            straceOptions = dict(allStraceOptions)
+            straceOptions[key] = "" if key == "haveTime" else False
+            if pluginClass().isOperational(straceOptions):
+                problems.append("operational without %s" % key)
+        return problems
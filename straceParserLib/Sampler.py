@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+
+import os
+import math
+import random
+
+
+def _getPid(line, havePid):
+    """ The key of the unfinished syscall of a line, the same as StraceParser """
+    if havePid:
+        return line.partition(" ")[0]
+    return 0
+
+
+def pairUnfinishedLines(lines, havePid):
+    """ Return lines without the unfinished lines whose resumed line is not
+        in lines and the resumed lines whose unfinished line is not in lines,
+        so that a part of a strace file never pairs an unfinished syscall
+        with a wrong resumed line.
+
+        >>> lines = ['1 read(3, <unfinished ...>', '2 <... write resumed> ) = 1',
+        ...          '1 <... read resumed> "a", 1) = 1', '2 open("/a", O_RDONLY <unfinished ...>']
+        >>> pairUnfinishedLines(lines, True)
+        ['1 read(3, <unfinished ...>', '1 <... read resumed> "a", 1) = 1']
+    """
+    keep = [True] * len(lines)
+    pendingIndex = {}
+    for index, line in enumerate(lines):
+        if "<unfinished ...>" in line:
+            pid = _getPid(line, havePid)
+            if pid in pendingIndex:
+                keep[pendingIndex[pid]] = False
+            pendingIndex[pid] = index
+        elif "resumed>" in line:
+            pid = _getPid(line, havePid)
+            if pid in pendingIndex:
+                del pendingIndex[pid]
+            else:
+                keep[index] = False
+    for index in pendingIndex.itervalues():
+        keep[index] = False
+    return [line for line, isKept in zip(lines, keep) if isKept]
+
+
+class LineSampleReader(object):
+    """
+    LineSampleReader
+
+    Wrap the reader of a strace file to return a deterministic fraction of
+    the syscalls: the n-th line is sampled by a hash of n. A resumed line is
+    sampled if and only if its unfinished line is.
+    """
+
+    def __init__(self, reader, fraction, havePid):
+        self._reader = reader
+        self._threshold = int(fraction * 2 ** 32)
+        self._havePid = havePid
+        self._syscallCount = 0
+        self._sampledCount = 0
+
+    def _isSampled(self, index):
+        # Knuth's multiplicative hash spreads the line numbers evenly
+        return (index * 2654435761) & 0xffffffff < self._threshold
+
+    def __iter__(self):
+        sampledUnfinished = {}
+        for index, line in enumerate(self._reader):
+            if "resumed>" in line:
+                if sampledUnfinished.pop(_getPid(line, self._havePid), False):
+                    yield line
+                continue
+
+            self._syscallCount += 1
+            isSampled = self._isSampled(index)
+            if "<unfinished ...>" in line:
+                sampledUnfinished[_getPid(line, self._havePid)] = isSampled
+            if isSampled:
+                self._sampledCount += 1
+                yield line
+
+    def getFraction(self):
+        """ The fraction of syscalls sampled, after all lines are read """
+        if not self._syscallCount:
+            return 0.0
+        return float(self._sampledCount) / self._syscallCount
+
+    def close(self):
+        self._reader.close()
+
+
+class BlockSampleReader(object):
+    """
+    BlockSampleReader
+
+    Read a fraction of a strace file as blocks of blockSize bytes at random
+    offsets, so that the rest of the file is never read. A block starts at
+    the first line starting inside it and ends with the line crossing its
+    end. Unfinished/resumed lines are only kept in pairs within a block.
+    """
+
+    def __init__(self, reader, fraction, havePid, blockSize=1048576, seed=0):
+        self._buffer = reader.buffer
+        self._reader = reader
+        self._havePid = havePid
+        self._blockSize = blockSize
+        self._fileSize = os.fstat(reader.fileno()).st_size
+        blockCount = max(1, int(math.ceil(float(self._fileSize) / blockSize)))
+        sampleCount = min(blockCount, max(1, int(round(blockCount * fraction))))
+        self._blockList = sorted(random.Random(seed).sample(xrange(blockCount), sampleCount))
+        self._readBytes = 0
+
+    def _readBlock(self, block):
+        start = block * self._blockSize
+        end = start + self._blockSize
+        if start > 0:
+            # skip the rest of the line crossing the start of the block, it
+            # is read (and counted) by the block before
+            self._buffer.seek(start - 1)
+            self._buffer.readline()
+        else:
+            self._buffer.seek(0)
+        readStart = self._buffer.tell()
+        lines = []
+        while self._buffer.tell() < end:
+            line = self._buffer.readline()
+            if not line:
+                break
+            lines.append(line.decode("utf-8", "replace"))
+        self._readBytes += min(self._buffer.tell(), self._fileSize) - readStart
+        return lines
+
+    def __iter__(self):
+        for block in self._blockList:
+            for line in pairUnfinishedLines(self._readBlock(block), self._havePid):
+                yield line
+
+    def getFraction(self):
+        """ The fraction of the file read, after all blocks are read """
+        if not self._fileSize:
+            return 0.0
+        return min(1.0, float(self._readBytes) / self._fileSize)
+
+    def close(self):
+        self._reader.close()
+
+
+if __name__ == '__main__':
+    print "running some tests..."
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 675 Mass Ave, Cambridge, MA 02139, USA.
+
+""" Helpers shared by the stat plugins """
+
+import math
+import heapq
+import bisect
+
+
+def timedeltaToMicroseconds(delta):
+    """ Convert a timedelta to an integer number of microseconds
+
+        >>> from datetime import timedelta
+        >>> timedeltaToMicroseconds(timedelta(seconds=1, microseconds=5))
+        1000005
+    """
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def percentile(sortedValues, p):
+    """ Return the p-th percentile (nearest rank) of a sorted list, or None
+        if the list is empty
+
+        >>> percentile([1, 2, 3, 4, 5, 6, 7, 8, 9, 10], 90)
+        9
+        >>> percentile([5], 99)
+        5
+    """
+    if not sortedValues:
+        return None
+    rank = int(math.ceil(len(sortedValues) * p / 100.0))
+    return sortedValues[max(rank, 1) - 1]
+
+
+class LatencyHistogram(object):
+    """
+    LatencyHistogram
+
+    A histogram of non-negative integers (e.g. latencies in microseconds)
+    with 8 buckets per power of 2, so the percentiles are within 1/16 of
+    the real value in fixed memory. Histograms can be merged.
+
+    >>> h = LatencyHistogram()
+    >>> for value in range(1, 101):
+    ...     h.add(value)
+    >>> h.getCount()
+    100
+    >>> h.percentile(50), h.percentile(99)
+    (49, 99)
+    >>> h.merge(h)
+    >>> h.getCount(), h.percentile(50)
+    (200, 49)
+    """
+
+    # values below SMALL_VALUE have their own bucket
+    SMALL_VALUE = 16
+
+    def __init__(self):
+        # _buckets[bucket] = count
+        self._buckets = {}
+
+    def _bucket(self, value):
+        if value < LatencyHistogram.SMALL_VALUE:
+            return value
+        shift = value.bit_length() - 4
+        return shift * 8 + (value >> shift)
+
+    def _bucketValue(self, bucket):
+        """ The middle value of a bucket """
+        if bucket < LatencyHistogram.SMALL_VALUE:
+            return bucket
+        shift = bucket // 8 - 1
+        lower = (bucket % 8 + 8) << shift
+        return lower + ((1 << shift) - 1) // 2
+
+    def add(self, value, count=1):
+        bucket = self._bucket(value)
+        self._buckets[bucket] = self._buckets.get(bucket, 0) + count
+
+    def merge(self, other):
+        for bucket, count in other._buckets.items():
+            self._buckets[bucket] = self._buckets.get(bucket, 0) + count
+
+    def getCount(self):
+        return sum(self._buckets.itervalues())
+
+    def percentile(self, p):
+        """ The p-th percentile (nearest rank), None if it is empty """
+        total = self.getCount()
+        if not total:
+            return None
+        rank = max(int(math.ceil(total * p / 100.0)), 1)
+        for bucket in sorted(self._buckets):
+            rank -= self._buckets[bucket]
+            if rank <= 0:
+                return self._bucketValue(bucket)
+
+
+class SpaceSaving(object):
+    """
+    SpaceSaving
+
+    Find the heavy hitters of a stream in fixed memory (the Space-Saving
+    algorithm of Metwally et al.). At most capacity keys are counted. When a
+    new key comes and the table is full, the key with the minimum count is
+    replaced and the new key inherits its count as the error.
+
+    The estimated count of a key is never less than its real count, and at
+    most its error more. Any key with a real count more than
+    total / capacity is guaranteed to be in the table.
+
+    >>> s = SpaceSaving(2)
+    >>> for key in "aabac":
+    ...     _ = s.add(key)
+    >>> s.getTop(2)
+    [('a', 3, 0), ('c', 2, 1)]
+    >>> s.getTotal()
+    5
+    >>> s.add("d", 10)
+    'c'
+    >>> s.getTop(1)
+    [('d', 12, 2)]
+    """
+
+    def __init__(self, capacity):
+        self._capacity = capacity
+        self._total = 0
+        # _counters[key] = [count, error]
+        self._counters = {}
+        # min-heap of (count, key); entries are updated lazily, so an entry
+        # is stale if its count is not the current count of its key
+        self._heap = []
+
+    def add(self, key, weight=1):
+        """ Count weight for key. Return the key replaced by key in the
+            table (so the caller can drop the data it keeps for that key), or
+            None.
+        """
+        self._total += weight
+        evictedKey = None
+        counter = self._counters.get(key)
+        if counter is None:
+            if len(self._counters) < self._capacity:
+                counter = self._counters[key] = [0, 0]
+            else:
+                minCount, evictedKey = self._popMin()
+                del self._counters[evictedKey]
+                counter = self._counters[key] = [minCount, minCount]
+        counter[0] += weight
+        heapq.heappush(self._heap, (counter[0], key))
+        if len(self._heap) > 4 * self._capacity:
+            self._rebuildHeap()
+        return evictedKey
+
+    def _popMin(self):
+        while True:
+            count, key = heapq.heappop(self._heap)
+            if key in self._counters and self._counters[key][0] == count:
+                return count, key
+
+    def _rebuildHeap(self):
+        self._heap = [(counter[0], key) for key, counter in self._counters.iteritems()]
+        heapq.heapify(self._heap)
+
+    def getMinCount(self):
+        """ The maximum count of a key not in the table """
+        if len(self._counters) < self._capacity:
+            return 0
+        return min(counter[0] for counter in self._counters.itervalues())
+
+    def getTotal(self):
+        return self._total
+
+    def getCapacity(self):
+        return self._capacity
+
+    def getTop(self, n):
+        """ Return a list of (key, estimated count, error) of the n keys with
+            the largest estimated count, the largest first.
+        """
+        return sorted([(key, counter[0], counter[1]) for key, counter in self._counters.iteritems()],
+                      key=lambda item: (-item[1], item[2], item[0]))[:n]
+
+    def merge(self, other):
+        """ Merge another SpaceSaving of the same capacity into this one. A
+            key missing in one table is given the minimum count of that
+            table, which is added to its error.
+
+            >>> a = SpaceSaving(2); b = SpaceSaving(2)
+            >>> for key in "aab": _ = a.add(key)
+            >>> for key in "ccb": _ = b.add(key)
+            >>> a.merge(b)
+            >>> a.getTop(2)
+            [('a', 3, 1), ('c', 3, 1)]
+        """
+        selfMin, otherMin = self.getMinCount(), other.getMinCount()
+        merged = {}
+        for key in set(self._counters) | set(other._counters):
+            count, error = self._counters.get(key, [selfMin, selfMin])
+            otherCount, otherError = other._counters.get(key, [otherMin, otherMin])
+            merged[key] = [count + otherCount, error + otherError]
+        keepList = sorted(merged, key=lambda key: (-merged[key][0], key))[:self._capacity]
+        self._counters = dict((key, merged[key]) for key in keepList)
+        self._total += other._total
+        self._rebuildHeap()
+
+
+class IntervalMap(object):
+    """
+    IntervalMap
+
+    Disjoint half-open intervals [start, end) with a value each, e.g. the
+    mappings of an address space. The intervals are kept sorted by start, so
+    finding the intervals overlapping a range is a binary search.
+
+    >>> m = IntervalMap()
+    >>> m.add(0, 100, "a")
+    0
+    >>> m.add(50, 150, "b")           # replaces [50, 100) of "a"
+    50
+    >>> m.getIntervals()
+    [(0, 50, 'a'), (50, 150, 'b')]
+    >>> m.remove(20, 60)
+    40
+    >>> m.getIntervals(), m.getSize()
+    ([(0, 20, 'a'), (60, 150, 'b')], 110)
+    >>> m.get(70), m.get(30)
+    ('b', None)
+    """
+
+    def __init__(self):
+        self._starts = []
+        # _intervals[start] = (end, value)
+        self._intervals = {}
+        self._size = 0
+
+    def __len__(self):
+        return len(self._starts)
+
+    def getSize(self):
+        """ The total length of the intervals """
+        return self._size
+
+    def getIntervals(self):
+        """ Return the list of (start, end, value), sorted by start """
+        return [(start,) + self._intervals[start] for start in self._starts]
+
+    def get(self, point):
+        """ Return the value of the interval containing point, or None """
+        index = bisect.bisect_right(self._starts, point) - 1
+        if index >= 0:
+            end, value = self._intervals[self._starts[index]]
+            if point < end:
+                return value
+        return None
+
+    def remove(self, start, end):
+        """ Remove the range [start, end) from the intervals, splitting the
+            intervals crossing its bounds. Return the length removed.
+        """
+        if start >= end:
+            return 0
+        index = bisect.bisect_right(self._starts, start) - 1
+        if index < 0 or self._intervals[self._starts[index]][0] <= start:
+            index += 1          # no interval contains start
+        removed = 0
+        keepList = []
+        lastIndex = index
+        while lastIndex < len(self._starts) and self._starts[lastIndex] < end:
+            intervalStart = self._starts[lastIndex]
+            intervalEnd, value = self._intervals.pop(intervalStart)
+            if intervalStart < start:
+                keepList.append((intervalStart, start, value))
+            if intervalEnd > end:
+                keepList.append((end, intervalEnd, value))
+            removed += min(intervalEnd, end) - max(intervalStart, start)
+            lastIndex += 1
+        self._starts[index:lastIndex] = [keepStart for keepStart, keepEnd, value in keepList]
+        for keepStart, keepEnd, value in keepList:
+            self._intervals[keepStart] = (keepEnd, value)
+        self._size -= removed
+        return removed
+
+    def add(self, start, end, value):
+        """ Add the interval [start, end), replacing the intervals it
+            overlaps. Return the length replaced.
+        """
+        if start >= end:
+            return 0
+        replaced = self.remove(start, end)
+        bisect.insort(self._starts, start)
+        self._intervals[start] = (end, value)
+        self._size += end - start
+        return replaced
+
+    def copy(self):
+        other = IntervalMap()
+        other._starts = list(self._starts)
+        other._intervals = dict(self._intervals)
+        other._size = self._size
+        return other
+
+
+if __name__ == '__main__':
+    print "running some tests..."
+    import doctest
+    doctest.testmod()
@@ -49,10 +49,14 @@ class StraceParser:
         self._completeSyscallCallbackHook = defaultdict(list)
         self._rawSyscallCallbackHook = defaultdict(list)
 
+        # the unfinished syscall line of each pid, waiting for its resumed line
+        self._unfinishedSyscallStack = {}
+
         # regex compiled for _parseLine
         self._reCompleteSyscall = re.compile(r"([^(]+)\((.*)\)[ ]+=[ ]+([a-fx\d\-?]+)(.*)")
         self._reUnfinishedSyscall = re.compile(r"([^(]+)\((.*) <unfinished ...>")
         self._reResumedSyscall = re.compile(r"\<\.\.\. ([^ ]+) resumed\> (.*)\)[ ]+=[ ]+([a-fx\d\-?]+)(.*)")
+        self._reErrno = re.compile(r"[ ]+(E[A-Z0-9]+)\b")
         return
 
     def registerSyscallHook(self, fullSyscallName, func):
@@ -68,6 +72,18 @@ class StraceParser:
     def startParse(self, reader, straceOptions):
         self._parse(reader, straceOptions)
 
+    def getState(self):
+        """ Return the state of the parser which is needed to continue
+            parsing the rest of a strace file later (see setState).
+        """
+        return {"unfinishedSyscallStack": dict(self._unfinishedSyscallStack)}
+
+    def setState(self, state):
+        """ Restore the state returned by getState, before startParse is
+            called on the rest of the strace file.
+        """
+        self._unfinishedSyscallStack = dict(state["unfinishedSyscallStack"])
+
     def autoDetectFormat(self, reader):
         """ autoDetectFormat - Detect the strace output line format, return a
             dict with following:
@@ -79,7 +95,10 @@ class StraceParser:
             It use peek() on the reader so it will not abvance the position of
             the stream.
         """
-        buf = reader.buffer.peek(4096);
+        if hasattr(reader, "peek"):     # e.g. LiveReader
+            buf = reader.peek(4096)
+        else:
+            buf = reader.buffer.peek(4096);
 
         failCount = 0
         for line in buf.split('\n'):
@@ -156,7 +175,7 @@ class StraceParser:
     def _parse(self, reader, straceOptions):
         syscallListByPid = {}
 
-        unfinishedSyscallStack = {}
+        unfinishedSyscallStack = self._unfinishedSyscallStack
         if not reader:
             logging.error("Cannot read file")
             return
@@ -259,6 +278,7 @@ class StraceParser:
 #   args :      a list of arguments ([] if no options)
 #   return :    return value (+/- int string or hex number string or '?' (e.g. exit syscall)), not exist if it is an unfinished syscall
 #   timeSpent : time spent in syscall (if haveTimeSpent enable. But even so, it may not exist in some case (e.g. exit syscall) and None will be stored in this field)
+#   errno :     error name of a failed syscall (e.g. "ENOENT"), None if no error, not exist if it is an unfinished syscall
 #   type :      Type of syscall ("completed", "unfinished", "resumed")
 #
 #   Return null if hit some error
@@ -306,6 +326,10 @@ class StraceParser:
                 result["return"] = m.group(3)
                 remainLine = m.group(4)
 
+            if result["type"] != "unfinished":
+                m = self._reErrno.match(remainLine)
+                result["errno"] = m.group(1) if m else None
+
             if result["type"] != "unfinished" and straceOptions["haveTimeSpent"]:
                 m = re.search(r"<([\d.]*)>", remainLine)
                 if m:
@@ -0,0 +1,34 @@
+#!/bin/bash
+#
+# Run plugins through the analysis server (--serve/--connect) and check that
+# the output is the same as a direct run, also after other queries on the
+# same resident trace.
+#
+file=${1:-stardict_T.out}
+socket=/tmp/strace_analyser_test.$$.sock
+
+../strace_analyser --serve $socket $file > /dev/null &
+server_pid=$!
+trap "kill $server_pid 2> /dev/null; rm -f $socket" EXIT
+for i in $(seq 50); do
+	[ -S $socket ] && break
+	sleep 0.1
+done
+
+for plugin in StatSlowest StatFutex StatSummary; do
+	../strace_analyser -e $plugin $file > /tmp/${plugin}.${file}.direct
+done
+
+# each plugin twice, after all the others, to catch a query changing the trace
+for round in 1 2; do
+	for plugin in StatFutex StatSlowest StatSummary; do
+		echo "Testing plugin $plugin through the server on $file (round $round)..."
+		../strace_analyser --connect $socket -e $plugin > /tmp/${plugin}.${file}.server || exit 1
+		if ! diff -q /tmp/${plugin}.${file}.direct /tmp/${plugin}.${file}.server > /dev/null; then
+			echo "Output of $plugin through the server differs from a direct run:"
+			diff /tmp/${plugin}.${file}.direct /tmp/${plugin}.${file}.server | head
+			exit 1
+		fi
+	done
+done
+echo "OK"
@@ -3,10 +3,17 @@
 # Just a very simple test that run all the plugins on all the files. We should improve this later and 
 # may be using a better framework.
 #
+echo "Checking plugin registry..."
+../strace_analyser --check-plugin-registry || exit 1
+
 for plugin in $(ls ../statPlugins/*.py | grep -v init | grep -v Base | sed 's#.*/\([^\.]*\).*#\1#'); do 
 	for file in $(ls *.out); do 
 		echo "Testing plugin $plugin on $file..."
-		../strace_analyser -e $plugin $file > /tmp/${plugin}.${file}.output_old  # we should compare the output too
+		options=""
+		if [ $plugin = StatSQLite ]; then	# do not leave the database in the test directory
+			options="-o output=/tmp/${plugin}.${file}.db"
+		fi
+		../strace_analyser -e $plugin $options $file > /tmp/${plugin}.${file}.output_old  # we should compare the output too
 		exit_val=$?
 		if [ ! $exit_val -eq 0 ]; then
 			exit 1